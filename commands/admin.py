@@ -1,13 +1,21 @@
 import os
+import asyncio
 import discord
 from discord.ext import commands, tasks
-from discord import Interaction
+from discord import Interaction, ui
 from datetime import datetime, timezone, timedelta
 import random
 import string
 
-from utils.supabase import get_supabase
-from utils.luarmor import get_user_info, add_time_to_user, delete_user_by_discord, create_or_update_user, compensate_all_users
+from utils.supabase import get_supabase, execute_async
+from utils.fanout import fan_out, collect_late, SourceResult
+from utils.queries import select, query_budget
+from utils import history, events, keypool
+from utils.plans import plan_for_days
+from utils.members import member_resolver
+from utils.supervisor import supervised, RunContext
+from utils.roblox import verify_gamepass_purchase, get_gamepass_info, find_owned_gamepasses, GAMEPASSES
+from utils.luarmor import get_user_info, add_time_to_user, delete_user_by_discord, compensate_all_users
 
 # -----------------------------
 # CONFIG
@@ -30,6 +38,14 @@ ALL_STAFF_ROLE_IDS = ADMIN_STAFF_ROLE_IDS | SUPPORT_ROLE_IDS
 EMBED_COLOR = 0x489BF3
 BOT_LOGO_URL = "https://cdn.discordapp.com/attachments/1449252986911068273/1449511913317732485/ScriptUnionIcon.png"
 
+# Renewal reminders missed while the bot was down are still sent if they're at most this old
+REMINDER_CATCH_UP_HOURS = 24
+
+# /userlookup: first render waits at most this long per source, then edits in late results
+LOOKUP_DB_DEADLINE = 2.5
+LOOKUP_LUARMOR_DEADLINE = 3.0
+LOOKUP_LATE_TIMEOUT = 15.0
+
 supabase = get_supabase()
 
 
@@ -43,12 +59,221 @@ def _is_any_staff(member: discord.Member) -> bool:
     return any(r.id in ALL_STAFF_ROLE_IDS for r in member.roles)
 
 
+def whitelist_plan_for_days(days: int) -> tuple[str, str]:
+    """Luarmor plan name + display text for a manual whitelist of `days` (0 = lifetime)."""
+    if days == 0:
+        return "Script Union - Fix it up (Lifetime)", "Lifetime"
+    if days <= 7:
+        return "Script Union - Fix it up (Week)", f"{days} days"
+    if days <= 30:
+        return "Script Union - Fix it up (Month)", f"{days} days"
+    return f"Manual Whitelist ({days} days)", f"{days} days"
+
+
+async def _load_stats(month_ago: str, week_ago: str) -> dict:
+    """/stats counters via the bot_stats RPC (sql/bot_stats.sql), or separate counts if it isn't installed."""
+    try:
+        resp = await execute_async(supabase.rpc("bot_stats", {"month_ago": month_ago, "week_ago": week_ago}))
+        if isinstance(resp.data, dict):
+            return resp.data
+    except Exception as e:
+        print(f"[STATS] bot_stats RPC unavailable, using separate counts: {e}")
+
+    total, monthly, weekly, active, tickets, variants = await asyncio.gather(
+        execute_async(select("role_redeem", "id", count="exact").limit(1)),
+        execute_async(select("role_redeem", "id", count="exact").gte("redeemed_at", month_ago).limit(1)),
+        execute_async(select("role_redeem", "id", count="exact").gte("redeemed_at", week_ago).limit(1)),
+        execute_async(select("role_redeem", "id", count="exact").eq("whitelisted", True).limit(1)),
+        execute_async(select("tickets", "id", count="exact").eq("status", "open").limit(1)),
+        execute_async(select("role_redeem", "variant_name")),
+    )
+    variant_counts = {}
+    for r in (variants.data or []):
+        v = r.get("variant_name") or "Unknown"
+        variant_counts[v] = variant_counts.get(v, 0) + 1
+
+    return {
+        "total": total.count or 0,
+        "monthly": monthly.count or 0,
+        "weekly": weekly.count or 0,
+        "active": active.count or 0,
+        "open_tickets": tickets.count or 0,
+        "variants": variant_counts,
+    }
+
+
 def _generate_referral_code() -> str:
     chars = string.ascii_uppercase + string.digits
     code = ''.join(random.choices(chars, k=6))
     return f"REF-{code}"
 
 
+def _section_unavailable(result: SourceResult) -> str | None:
+    """Placeholder text for a lookup section that hasn't loaded (None if it has)."""
+    if result.status == "pending":
+        return "⏳ Still loading..."
+    if result.status == "failed":
+        return f"⚠️ Unavailable ({result.error})"
+    return None
+
+
+def _format_history_lines(rows: list[dict], offset: int) -> list[str]:
+    lines = []
+    for i, r in enumerate(rows):
+        variant = r.get("variant_name") or "Unknown"
+        invoice = r.get("invoice_id") or "N/A"
+        redeemed_at = r.get("redeemed_at")
+
+        if redeemed_at:
+            try:
+                ts = int(datetime.fromisoformat(redeemed_at.replace("Z", "+00:00")).timestamp())
+                date_str = f"<t:{ts}:d>"
+            except:
+                date_str = redeemed_at[:10]
+        else:
+            date_str = "Unknown"
+
+        lines.append(f"**{offset + i + 1}.** {variant} - {date_str}\n   Invoice: `{invoice[:15]}...`")
+    return lines
+
+
+async def _load_history_summary(discord_id: int):
+    page, total = await asyncio.gather(history.fetch_page(discord_id), history.count(discord_id))
+    return page, total
+
+
+class PurchaseHistoryView(ui.View):
+    """Pages through a user's redemptions on demand (keyset cursors, newest first)."""
+
+    def __init__(self, owner_id: int, user: discord.abc.User):
+        super().__init__(timeout=300)
+        self.owner_id = owner_id
+        self.user = user
+        self.cursors: list = [None]  # cursor for each visited page
+        self.page_index = 0
+        self.total = 0
+
+        self.prev_button = ui.Button(
+            label="◀ Prev", style=discord.ButtonStyle.secondary,
+            custom_id=f"purchase_history:{user.id}:prev", disabled=True
+        )
+        self.next_button = ui.Button(
+            label="Next ▶", style=discord.ButtonStyle.secondary,
+            custom_id=f"purchase_history:{user.id}:next", disabled=True
+        )
+        self.prev_button.callback = self._on_prev
+        self.next_button.callback = self._on_next
+        self.add_item(self.prev_button)
+        self.add_item(self.next_button)
+
+    async def interaction_check(self, interaction: Interaction) -> bool:
+        return interaction.user.id == self.owner_id
+
+    async def render(self) -> discord.Embed:
+        page, self.total = await asyncio.gather(
+            history.fetch_page(self.user.id, self.cursors[self.page_index]),
+            history.count(self.user.id),
+        )
+        if page.next_cursor and len(self.cursors) == self.page_index + 1:
+            self.cursors.append(page.next_cursor)
+
+        self.prev_button.disabled = self.page_index == 0
+        self.next_button.disabled = page.next_cursor is None
+
+        pages = max(1, -(-self.total // history.PAGE_SIZE))
+        embed = discord.Embed(title=f"Purchase History: {self.user}", color=discord.Color(EMBED_COLOR))
+        lines = _format_history_lines(page.rows, self.page_index * history.PAGE_SIZE)
+        embed.description = "\n".join(lines) or "No purchases found"
+        embed.set_footer(text=f"Page {self.page_index + 1}/{pages} • {self.total} total")
+        return embed
+
+    async def _on_prev(self, interaction: Interaction):
+        self.page_index = max(0, self.page_index - 1)
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+
+    async def _on_next(self, interaction: Interaction):
+        if self.page_index + 1 < len(self.cursors):
+            self.page_index += 1
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+
+
+class UserLookupView(ui.View):
+    def __init__(self, owner_id: int, user: discord.abc.User):
+        super().__init__(timeout=300)
+        self.owner_id = owner_id
+        self.user = user
+
+    async def interaction_check(self, interaction: Interaction) -> bool:
+        return interaction.user.id == self.owner_id
+
+    @ui.button(label="Browse Purchase History", style=discord.ButtonStyle.primary)
+    async def browse_history(self, interaction: Interaction, button: ui.Button):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        view = PurchaseHistoryView(self.owner_id, self.user)
+        await interaction.followup.send(embed=await view.render(), view=view, ephemeral=True)
+
+
+def _build_userlookup_embed(user: discord.Member, results: dict[str, SourceResult]) -> discord.Embed:
+    embed = discord.Embed(
+        title=f"User Lookup: {user}",
+        color=discord.Color(EMBED_COLOR)
+    )
+    embed.set_thumbnail(url=user.display_avatar.url)
+    embed.add_field(name="User ID", value=f"`{user.id}`", inline=True)
+    embed.add_field(name="Account Created", value=f"<t:{int(user.created_at.timestamp())}:R>", inline=True)
+    embed.add_field(name="Joined Server", value=f"<t:{int(user.joined_at.timestamp())}:R>" if user.joined_at else "Unknown", inline=True)
+
+    luarmor = results["luarmor"]
+    placeholder = _section_unavailable(luarmor)
+    if placeholder:
+        embed.add_field(name="Luarmor Status", value=placeholder, inline=False)
+    elif luarmor.value:
+        luarmor_info = luarmor.value
+        key = luarmor_info.get("user_key", "Unknown")
+        auth_expire = luarmor_info.get("auth_expire")
+        hwid = luarmor_info.get("identifier", "Not set")
+
+        if auth_expire is None or auth_expire == -1:
+            expiry_text = "Lifetime"
+        else:
+            expiry_text = f"<t:{auth_expire}:F>"
+
+        embed.add_field(name="Luarmor Key", value=f"||`{key}`||", inline=False)
+        embed.add_field(name="Key Expires", value=expiry_text, inline=True)
+        embed.add_field(name="HWID", value=f"`{hwid[:20]}...`" if len(str(hwid)) > 20 else f"`{hwid}`", inline=True)
+    else:
+        embed.add_field(name="Luarmor Status", value="No active whitelist", inline=False)
+
+    purchases = results["history"]
+    placeholder = _section_unavailable(purchases)
+    if placeholder:
+        embed.add_field(name="Purchase History", value=placeholder, inline=False)
+    else:
+        first_page, total = purchases.value
+        if first_page.rows:
+            embed.add_field(
+                name=f"Purchase History ({total} total)",
+                value="\n".join(_format_history_lines(first_page.rows, 0)) or "None",
+                inline=False
+            )
+        else:
+            embed.add_field(name="Purchase History", value="No purchases found", inline=False)
+
+    referral = results["referral"]
+    placeholder = _section_unavailable(referral)
+    if placeholder:
+        embed.add_field(name="Referral Code", value=placeholder, inline=False)
+    elif referral.value.data:
+        ref = referral.value.data[0]
+        embed.add_field(
+            name="Referral Code",
+            value=f"`{ref.get('referral_code')}` ({ref.get('uses', 0)} uses)",
+            inline=False
+        )
+
+    return embed
+
+
 class Admin(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -64,143 +289,155 @@ class Admin(commands.Cog):
     # -----------------------------
     
     @tasks.loop(minutes=10)
+    @supervised("expiry_check", interval=600, timeout=300)
     async def expiry_check(self):
         """Check for expired keys and remove Premium role"""
-        try:
-            guild = self.bot.get_guild(GUILD_ID)
-            if not guild:
-                return
+        guild = self.bot.get_guild(GUILD_ID)
+        if not guild:
+            return 0
 
-            now = datetime.now(timezone.utc).isoformat()
-            expired = supabase.table("role_redeem").select(
-                "id, discord_id, product_name, variant_name, expires_at"
-            ).lt("expires_at", now).eq("whitelisted", True).execute()
+        # Everything expired so far, so a run after downtime picks up what it missed on its own
+        now = datetime.now(timezone.utc).isoformat()
+        expired = await execute_async(supabase.table("role_redeem").select(
+            "id, discord_id, product_name, variant_name, expires_at"
+        ).lt("expires_at", now).eq("whitelisted", True))
 
-            if not expired.data:
-                return
+        if not expired.data:
+            return 0
 
-            log_channel = guild.get_channel(LOG_CHANNEL_ID)
-            role = guild.get_role(ACCESS_ROLE_ID)
+        role = guild.get_role(ACCESS_ROLE_ID)
 
-            for entry in expired.data:
-                discord_id = entry.get("discord_id")
-                if not discord_id:
-                    continue
+        members = await member_resolver.resolve_many(
+            guild, [e["discord_id"] for e in expired.data if e.get("discord_id")]
+        )
 
-                try:
-                    member = guild.get_member(int(discord_id))
-                    if member is None:
-                        try:
-                            member = await guild.fetch_member(int(discord_id))
-                        except:
-                            member = None
+        processed = 0
+        for entry in expired.data:
+            discord_id = entry.get("discord_id")
+            if not discord_id:
+                continue
+
+            try:
+                member = members.get(int(discord_id))
 
-                    if member and role and role in member.roles:
-                        await member.remove_roles(role, reason="Subscription expired")
+                if member and role and role in member.roles:
+                    await member.remove_roles(role, reason="Subscription expired")
 
-                    supabase.table("role_redeem").update({
-                        "whitelisted": False
-                    }).eq("id", entry["id"]).execute()
+                await execute_async(supabase.table("role_redeem").update({
+                    "whitelisted": False
+                }).eq("id", entry["id"]))
+                processed += 1
 
+                try:
+                    await delete_user_by_discord(discord_id)
+                except:
+                    pass
+
+                embed = discord.Embed(
+                    title="Subscription Expired",
+                    color=discord.Color.red()
+                )
+                embed.add_field(name="User", value=f"<@{discord_id}> (`{discord_id}`)", inline=False)
+                embed.add_field(name="Product", value=entry.get("product_name", "Unknown"), inline=True)
+                embed.add_field(name="Variant", value=entry.get("variant_name", "Unknown"), inline=True)
+                embed.set_footer(text="Role and whitelist access removed")
+                events.record("expiry", embed, discord_id=discord_id)
+
+                if member:
                     try:
-                        await delete_user_by_discord(discord_id)
+                        dm_embed = discord.Embed(
+                            title="Your Subscription Has Expired",
+                            description=(
+                                "Your Fix-It-Up Premium subscription has expired.\n\n"
+                                "Your Premium role and whitelist access have been removed.\n\n"
+                                "**Want to renew?**\n"
+                                "Visit our shop to purchase a new subscription!"
+                            ),
+                            color=discord.Color.red()
+                        )
+                        dm_embed.set_thumbnail(url=BOT_LOGO_URL)
+                        await member.send(embed=dm_embed)
                     except:
                         pass
 
-                    if log_channel:
-                        embed = discord.Embed(
-                            title="Subscription Expired",
-                            color=discord.Color.red()
-                        )
-                        embed.add_field(name="User", value=f"<@{discord_id}> (`{discord_id}`)", inline=False)
-                        embed.add_field(name="Product", value=entry.get("product_name", "Unknown"), inline=True)
-                        embed.add_field(name="Variant", value=entry.get("variant_name", "Unknown"), inline=True)
-                        embed.set_footer(text="Role and whitelist access removed")
-                        await log_channel.send(embed=embed)
-
-                    if member:
-                        try:
-                            dm_embed = discord.Embed(
-                                title="Your Subscription Has Expired",
-                                description=(
-                                    "Your Fix-It-Up Premium subscription has expired.\n\n"
-                                    "Your Premium role and whitelist access have been removed.\n\n"
-                                    "**Want to renew?**\n"
-                                    "Visit our shop to purchase a new subscription!"
-                                ),
-                                color=discord.Color.red()
-                            )
-                            dm_embed.set_thumbnail(url=BOT_LOGO_URL)
-                            await member.send(embed=dm_embed)
-                        except:
-                            pass
-
-                except Exception as e:
-                    print(f"[EXPIRY] Error processing {discord_id}: {e}")
+            except Exception as e:
+                print(f"[EXPIRY] Error processing {discord_id}: {e}")
 
-        except Exception as e:
-            print(f"[EXPIRY TASK ERROR] {e}")
+        return processed
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        member_resolver.forget(member.guild.id, member.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        member_resolver.forget(member.guild.id, member.id)
 
     @expiry_check.before_loop
     async def before_expiry_check(self):
         await self.bot.wait_until_ready()
 
     @tasks.loop(hours=1)
-    async def renewal_reminder(self):
+    @supervised("renewal_reminder", interval=3600, timeout=600, catch_up=REMINDER_CATCH_UP_HOURS * 3600)
+    async def renewal_reminder(self, run: RunContext):
         """DM users 3 days before their subscription expires"""
-        try:
-            guild = self.bot.get_guild(GUILD_ID)
-            if not guild:
-                return
-
-            now = datetime.now(timezone.utc)
-            three_days = now + timedelta(days=3)
-            three_days_plus_hour = three_days + timedelta(hours=1)
-
-            expiring = supabase.table("role_redeem").select(
-                "id, discord_id, product_name, variant_name, expires_at"
-            ).gte("expires_at", three_days.isoformat()
-            ).lt("expires_at", three_days_plus_hour.isoformat()
-            ).eq("whitelisted", True).execute()
+        guild = self.bot.get_guild(GUILD_ID)
+        if not guild:
+            return 0
+
+        # Window starts where the last successful run's ended, so hours missed
+        # while the bot was down are still reminded (up to REMINDER_CATCH_UP_HOURS)
+        window_start = datetime.fromtimestamp(run.covered_since, tz=timezone.utc) + timedelta(days=3)
+        window_end = datetime.fromtimestamp(run.started_at, tz=timezone.utc) + timedelta(days=3, hours=1)
+        if run.missed:
+            print(f"[REMINDER] Catching up {run.missed / 3600:.1f}h of missed reminder windows")
+
+        expiring = await execute_async(supabase.table("role_redeem").select(
+            "id, discord_id, product_name, variant_name, expires_at"
+        ).gte("expires_at", window_start.isoformat()
+        ).lt("expires_at", window_end.isoformat()
+        ).eq("whitelisted", True))
+
+        if not expiring.data:
+            return 0
+
+        members = await member_resolver.resolve_many(
+            guild, [e["discord_id"] for e in expiring.data if e.get("discord_id")]
+        )
 
-            if not expiring.data:
-                return
+        sent = 0
+        for entry in expiring.data:
+            discord_id = entry.get("discord_id")
+            if not discord_id:
+                continue
 
-            for entry in expiring.data:
-                discord_id = entry.get("discord_id")
-                if not discord_id:
+            try:
+                member = members.get(int(discord_id))
+                if member is None:
                     continue
 
-                try:
-                    member = guild.get_member(int(discord_id))
-                    if member is None:
-                        try:
-                            member = await guild.fetch_member(int(discord_id))
-                        except:
-                            continue
-
-                    expires_at = entry.get("expires_at")
-                    ts = int(datetime.fromisoformat(expires_at.replace("Z", "+00:00")).timestamp())
-
-                    dm_embed = discord.Embed(
-                        title="Subscription Expiring Soon!",
-                        description=(
-                            f"Your Fix-It-Up Premium subscription expires <t:{ts}:R>!\n\n"
-                            "**Renew now to keep your access:**\n"
-                            "- Premium role\n"
-                            "- Script whitelist\n\n"
-                            "Visit our shop to renew before it expires!"
-                        ),
-                        color=discord.Color.orange()
-                    )
-                    dm_embed.set_thumbnail(url=BOT_LOGO_URL)
-                    await member.send(embed=dm_embed)
-
-                except Exception as e:
-                    print(f"[REMINDER] Error for {discord_id}: {e}")
-
-        except Exception as e:
-            print(f"[REMINDER TASK ERROR] {e}")
+                expires_at = entry.get("expires_at")
+                ts = int(datetime.fromisoformat(expires_at.replace("Z", "+00:00")).timestamp())
+
+                dm_embed = discord.Embed(
+                    title="Subscription Expiring Soon!",
+                    description=(
+                        f"Your Fix-It-Up Premium subscription expires <t:{ts}:R>!\n\n"
+                        "**Renew now to keep your access:**\n"
+                        "- Premium role\n"
+                        "- Script whitelist\n\n"
+                        "Visit our shop to renew before it expires!"
+                    ),
+                    color=discord.Color.orange()
+                )
+                dm_embed.set_thumbnail(url=BOT_LOGO_URL)
+                await member.send(embed=dm_embed)
+                sent += 1
+
+            except Exception as e:
+                print(f"[REMINDER] Error for {discord_id}: {e}")
+
+        return sent
 
     @renewal_reminder.before_loop
     async def before_renewal_reminder(self):
@@ -238,16 +475,15 @@ class Admin(commands.Cog):
 
         await interaction.followup.send(embed=embed, ephemeral=True)
 
-        log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-        if log_channel:
-            log_embed = discord.Embed(title="Whitelist Time Added", color=discord.Color.blue())
-            log_embed.add_field(name="User", value=f"{user.mention} (`{user.id}`)", inline=True)
-            log_embed.add_field(name="Days Added", value=f"{days}", inline=True)
-            log_embed.add_field(name="Staff", value=f"{interaction.user.mention}", inline=True)
-            await log_channel.send(embed=log_embed)
+        log_embed = discord.Embed(title="Whitelist Time Added", color=discord.Color.blue())
+        log_embed.add_field(name="User", value=f"{user.mention} (`{user.id}`)", inline=True)
+        log_embed.add_field(name="Days Added", value=f"{days}", inline=True)
+        log_embed.add_field(name="Staff", value=f"{interaction.user.mention}", inline=True)
+        events.record("addtime", log_embed, discord_id=user.id, actor_id=interaction.user.id)
 
     @discord.app_commands.command(name="applyref", description="Apply a referral code for a user")
     @discord.app_commands.describe(code="The referral code", buyer="The user who made the purchase")
+    @query_budget(4)
     async def applyref(self, interaction: Interaction, code: str, buyer: discord.Member):
         if not _is_admin_staff(interaction.user):
             await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
@@ -255,7 +491,7 @@ class Admin(commands.Cog):
 
         await interaction.response.defer(ephemeral=True)
 
-        referral = supabase.table("referrals").select("*").eq(
+        referral = select("referrals", "id, referrer_discord_id, bonus_days_per_referral, uses").eq(
             "referral_code", code.upper()
         ).limit(1).execute()
 
@@ -304,14 +540,12 @@ class Admin(commands.Cog):
 
         await interaction.followup.send(embed=embed, ephemeral=True)
 
-        log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-        if log_channel:
-            log_embed = discord.Embed(title="Referral Code Applied", color=discord.Color.blue())
-            log_embed.add_field(name="Referrer", value=f"<@{referrer_id}>", inline=True)
-            log_embed.add_field(name="New Customer", value=f"{buyer.mention}", inline=True)
-            log_embed.add_field(name="Code", value=f"`{code.upper()}`", inline=True)
-            log_embed.add_field(name="Staff", value=f"{interaction.user.mention}", inline=True)
-            await log_channel.send(embed=log_embed)
+        log_embed = discord.Embed(title="Referral Code Applied", color=discord.Color.blue())
+        log_embed.add_field(name="Referrer", value=f"<@{referrer_id}>", inline=True)
+        log_embed.add_field(name="New Customer", value=f"{buyer.mention}", inline=True)
+        log_embed.add_field(name="Code", value=f"`{code.upper()}`", inline=True)
+        log_embed.add_field(name="Staff", value=f"{interaction.user.mention}", inline=True)
+        events.record("referral", log_embed, discord_id=buyer.id, actor_id=interaction.user.id)
 
     @discord.app_commands.command(name="verifygamepass", description="Verify a Roblox gamepass purchase and whitelist user")
     @discord.app_commands.describe(
@@ -345,9 +579,9 @@ class Admin(commands.Cog):
 
         # Check if this roblox user already redeemed this gamepass
         gamepass_info = get_gamepass_info(gamepass)
-        existing = supabase.table("gamepass_redemptions").select("*").eq(
+        existing = supabase.table("gamepass_redemptions").select("discord_id, redeemed_at").eq(
             "roblox_user_id", roblox_user_id
-        ).eq("gamepass_id", gamepass).execute()
+        ).eq("gamepass_id", gamepass).limit(1).execute()
 
         if existing.data:
             prev = existing.data[0]
@@ -369,7 +603,9 @@ class Admin(commands.Cog):
 
         # Whitelist on Luarmor
         product_name = f"Script Union - Fix it up ({gamepass_info['name']})"
-        luarmor_result = await create_or_update_user(user.id, product_name)
+        luarmor_result = await keypool.provision(
+            user.id, product_name, expiry=plan_for_days(gamepass_info["days"] or 0).expiry()
+        )
 
         if not luarmor_result or luarmor_result.get("error"):
             embed = discord.Embed(
@@ -418,17 +654,15 @@ class Admin(commands.Cog):
         await interaction.followup.send(embed=embed, ephemeral=True)
 
         # Log
-        log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-        if log_channel:
-            log_embed = discord.Embed(
-                title="Gamepass Purchase Verified",
-                color=discord.Color.green()
-            )
-            log_embed.add_field(name="User", value=f"{user.mention} (`{user.id}`)", inline=True)
-            log_embed.add_field(name="Roblox", value=f"`{roblox_username}` (`{roblox_user_id}`)", inline=True)
-            log_embed.add_field(name="Product", value=gamepass_info["name"], inline=True)
-            log_embed.add_field(name="Verified By", value=f"{interaction.user.mention}", inline=True)
-            await log_channel.send(embed=log_embed)
+        log_embed = discord.Embed(
+            title="Gamepass Purchase Verified",
+            color=discord.Color.green()
+        )
+        log_embed.add_field(name="User", value=f"{user.mention} (`{user.id}`)", inline=True)
+        log_embed.add_field(name="Roblox", value=f"`{roblox_username}` (`{roblox_user_id}`)", inline=True)
+        log_embed.add_field(name="Product", value=gamepass_info["name"], inline=True)
+        log_embed.add_field(name="Verified By", value=f"{interaction.user.mention}", inline=True)
+        events.record("gamepass", log_embed, discord_id=user.id, actor_id=interaction.user.id)
 
         # DM user
         try:
@@ -577,6 +811,7 @@ class Admin(commands.Cog):
 
     @discord.app_commands.command(name="whitelist", description="Manually whitelist a user")
     @discord.app_commands.describe(user="The user to whitelist", days="Number of days (0 for lifetime)")
+    @query_budget(1)
     async def whitelist(self, interaction: Interaction, user: discord.Member, days: int = 0):
         if not _is_admin_staff(interaction.user):
             await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
@@ -585,7 +820,7 @@ class Admin(commands.Cog):
         await interaction.response.defer(ephemeral=True)
 
         # Check if user is blacklisted
-        blacklisted = supabase.table("blacklist").select("*").eq(
+        blacklisted = select("blacklist", "discord_id").eq(
             "discord_id", int(user.id)
         ).limit(1).execute()
 
@@ -593,22 +828,10 @@ class Admin(commands.Cog):
             await interaction.followup.send(f"{user.mention} is blacklisted and cannot be whitelisted.", ephemeral=True)
             return
 
-        # Determine product name based on days
-        if days == 0:
-            product_name = "Script Union - Fix it up (Lifetime)"
-            expiry_text = "Lifetime"
-        elif days <= 7:
-            product_name = "Script Union - Fix it up (Week)"
-            expiry_text = f"{days} days"
-        elif days <= 30:
-            product_name = "Script Union - Fix it up (Month)"
-            expiry_text = f"{days} days"
-        else:
-            product_name = f"Manual Whitelist ({days} days)"
-            expiry_text = f"{days} days"
+        product_name, expiry_text = whitelist_plan_for_days(days)
 
-        # Create Luarmor key
-        luarmor_result = await create_or_update_user(user.id, product_name)
+        # Create Luarmor key with exactly the requested duration
+        luarmor_result = await keypool.provision(user.id, product_name, expiry=plan_for_days(days).expiry())
 
         if not luarmor_result or luarmor_result.get("error"):
             error_msg = luarmor_result.get("error") if luarmor_result else "Unknown error"
@@ -639,13 +862,11 @@ class Admin(commands.Cog):
         await interaction.followup.send(embed=embed, ephemeral=True)
 
         # Log
-        log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-        if log_channel:
-            log_embed = discord.Embed(title="Manual Whitelist", color=discord.Color.green())
-            log_embed.add_field(name="User", value=f"{user.mention} (`{user.id}`)", inline=True)
-            log_embed.add_field(name="Duration", value=expiry_text, inline=True)
-            log_embed.add_field(name="Staff", value=f"{interaction.user.mention}", inline=True)
-            await log_channel.send(embed=log_embed)
+        log_embed = discord.Embed(title="Manual Whitelist", color=discord.Color.green())
+        log_embed.add_field(name="User", value=f"{user.mention} (`{user.id}`)", inline=True)
+        log_embed.add_field(name="Duration", value=expiry_text, inline=True)
+        log_embed.add_field(name="Staff", value=f"{interaction.user.mention}", inline=True)
+        events.record("whitelist", log_embed, discord_id=user.id, actor_id=interaction.user.id)
 
         # DM user
         try:
@@ -664,6 +885,7 @@ class Admin(commands.Cog):
 
     @discord.app_commands.command(name="blacklist", description="Blacklist a user from redeeming")
     @discord.app_commands.describe(user="The user to blacklist", reason="Reason for blacklist")
+    @query_budget(2)
     async def blacklist(self, interaction: Interaction, user: discord.Member, reason: str = "No reason provided"):
         if not _is_admin_staff(interaction.user):
             await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
@@ -672,7 +894,7 @@ class Admin(commands.Cog):
         await interaction.response.defer(ephemeral=True)
 
         # Check if already blacklisted
-        existing = supabase.table("blacklist").select("*").eq(
+        existing = select("blacklist", "discord_id").eq(
             "discord_id", int(user.id)
         ).limit(1).execute()
 
@@ -709,16 +931,15 @@ class Admin(commands.Cog):
         await interaction.followup.send(embed=embed, ephemeral=True)
 
         # Log
-        log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-        if log_channel:
-            log_embed = discord.Embed(title="User Blacklisted", color=discord.Color.red())
-            log_embed.add_field(name="User", value=f"{user.mention} (`{user.id}`)", inline=True)
-            log_embed.add_field(name="Reason", value=reason, inline=False)
-            log_embed.add_field(name="Staff", value=f"{interaction.user.mention}", inline=True)
-            await log_channel.send(embed=log_embed)
+        log_embed = discord.Embed(title="User Blacklisted", color=discord.Color.red())
+        log_embed.add_field(name="User", value=f"{user.mention} (`{user.id}`)", inline=True)
+        log_embed.add_field(name="Reason", value=reason, inline=False)
+        log_embed.add_field(name="Staff", value=f"{interaction.user.mention}", inline=True)
+        events.record("blacklist", log_embed, discord_id=user.id, actor_id=interaction.user.id)
 
     @discord.app_commands.command(name="unblacklist", description="Remove a user from the blacklist")
     @discord.app_commands.describe(user="The user to unblacklist")
+    @query_budget(2)
     async def unblacklist(self, interaction: Interaction, user: discord.Member):
         if not _is_admin_staff(interaction.user):
             await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
@@ -727,7 +948,7 @@ class Admin(commands.Cog):
         await interaction.response.defer(ephemeral=True)
 
         # Check if blacklisted
-        existing = supabase.table("blacklist").select("*").eq(
+        existing = select("blacklist", "discord_id").eq(
             "discord_id", int(user.id)
         ).limit(1).execute()
 
@@ -745,12 +966,10 @@ class Admin(commands.Cog):
         await interaction.followup.send(embed=embed, ephemeral=True)
 
         # Log
-        log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-        if log_channel:
-            log_embed = discord.Embed(title="User Unblacklisted", color=discord.Color.green())
-            log_embed.add_field(name="User", value=f"{user.mention} (`{user.id}`)", inline=True)
-            log_embed.add_field(name="Staff", value=f"{interaction.user.mention}", inline=True)
-            await log_channel.send(log_embed)
+        log_embed = discord.Embed(title="User Unblacklisted", color=discord.Color.green())
+        log_embed.add_field(name="User", value=f"{user.mention} (`{user.id}`)", inline=True)
+        log_embed.add_field(name="Staff", value=f"{interaction.user.mention}", inline=True)
+        events.record("unblacklist", log_embed, discord_id=user.id, actor_id=interaction.user.id)
 
     @discord.app_commands.command(name="compensate", description="Add hours to ALL active whitelist keys (for downtime compensation)")
     @discord.app_commands.describe(hours="Number of hours to add to all active keys")
@@ -789,17 +1008,15 @@ class Admin(commands.Cog):
         await interaction.followup.send(embed=embed, ephemeral=True)
 
         # Log to channel
-        log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-        if log_channel:
-            log_embed = discord.Embed(
-                title="Mass Compensation Issued",
-                description=f"**{hours} hours** added to all active whitelist keys.",
-                color=discord.Color.blue()
-            )
-            log_embed.add_field(name="Users Updated", value=str(result["success"]), inline=True)
-            log_embed.add_field(name="Skipped", value=str(result["skipped"]), inline=True)
-            log_embed.add_field(name="Issued By", value=f"{interaction.user.mention}", inline=True)
-            await log_channel.send(embed=log_embed)
+        log_embed = discord.Embed(
+            title="Mass Compensation Issued",
+            description=f"**{hours} hours** added to all active whitelist keys.",
+            color=discord.Color.blue()
+        )
+        log_embed.add_field(name="Users Updated", value=str(result["success"]), inline=True)
+        log_embed.add_field(name="Skipped", value=str(result["skipped"]), inline=True)
+        log_embed.add_field(name="Issued By", value=f"{interaction.user.mention}", inline=True)
+        events.record("compensate", log_embed, actor_id=interaction.user.id)
 
 
     # -----------------------------
@@ -815,79 +1032,76 @@ class Admin(commands.Cog):
 
         await interaction.response.defer(ephemeral=True)
 
-        redemptions = supabase.table("role_redeem").select("*").eq(
-            "discord_id", int(user.id)
-        ).order("redeemed_at", desc=True).execute()
+        # All upstreams at once; anything slower than its deadline is filled in by editing later
+        results, pending = await fan_out({
+            "history": (lambda: _load_history_summary(user.id), LOOKUP_DB_DEADLINE),
+            "referral": (lambda: execute_async(
+                supabase.table("referrals").select("referral_code, uses").eq(
+                    "referrer_discord_id", int(user.id)
+                ).limit(1)
+            ), LOOKUP_DB_DEADLINE),
+            "luarmor": (lambda: get_user_info(user.id), LOOKUP_LUARMOR_DEADLINE),
+        })
+
+        message = await interaction.followup.send(
+            embed=_build_userlookup_embed(user, results),
+            view=UserLookupView(interaction.user.id, user),
+            ephemeral=True,
+            wait=True,
+        )
 
-        referral = supabase.table("referrals").select("*").eq(
-            "referrer_discord_id", int(user.id)
-        ).limit(1).execute()
+        if pending:
+            results.update(await collect_late(pending, LOOKUP_LATE_TIMEOUT))
+            try:
+                await message.edit(embed=_build_userlookup_embed(user, results))
+            except discord.HTTPException as e:
+                print(f"[USERLOOKUP] Could not update lookup message: {e}")
+
+    @discord.app_commands.command(name="robloxcheck", description="Check which gamepasses a Roblox user owns")
+    @discord.app_commands.describe(roblox_username="The Roblox username to check")
+    async def robloxcheck(self, interaction: Interaction, roblox_username: str):
+        if not _is_any_staff(interaction.user):
+            await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+            return
 
-        luarmor_info = await get_user_info(user.id)
+        await interaction.response.defer(ephemeral=True)
+
+        roblox_user_id, owned = await find_owned_gamepasses(roblox_username)
+        if not roblox_user_id:
+            await interaction.followup.send(f"Could not find Roblox user `{roblox_username}`.", ephemeral=True)
+            return
+
+        # One query for every gamepass this Roblox account already redeemed
+        redeemed = supabase.table("gamepass_redemptions").select(
+            "gamepass_id, discord_id, redeemed_at"
+        ).eq("roblox_user_id", roblox_user_id).execute()
+        redeemed_by_pass = {r.get("gamepass_id"): r for r in (redeemed.data or [])}
 
         embed = discord.Embed(
-            title=f"User Lookup: {user}",
+            title=f"Roblox Gamepasses: {roblox_username}",
+            description=f"Roblox ID: `{roblox_user_id}`",
             color=discord.Color(EMBED_COLOR)
         )
-        embed.set_thumbnail(url=user.display_avatar.url)
-        embed.add_field(name="User ID", value=f"`{user.id}`", inline=True)
-        embed.add_field(name="Account Created", value=f"<t:{int(user.created_at.timestamp())}:R>", inline=True)
-        embed.add_field(name="Joined Server", value=f"<t:{int(user.joined_at.timestamp())}:R>" if user.joined_at else "Unknown", inline=True)
 
-        if luarmor_info:
-            key = luarmor_info.get("user_key", "Unknown")
-            auth_expire = luarmor_info.get("auth_expire")
-            hwid = luarmor_info.get("identifier", "Not set")
-            
-            if auth_expire is None or auth_expire == -1:
-                expiry_text = "Lifetime"
+        for gamepass_id, info in GAMEPASSES.items():
+            status = owned.get(gamepass_id)
+            if status is None:
+                line = "⚠️ Could not check"
+            elif status:
+                line = "✅ Owned"
             else:
-                expiry_text = f"<t:{auth_expire}:F>"
-            
-            embed.add_field(name="Luarmor Key", value=f"||`{key}`||", inline=False)
-            embed.add_field(name="Key Expires", value=expiry_text, inline=True)
-            embed.add_field(name="HWID", value=f"`{hwid[:20]}...`" if len(str(hwid)) > 20 else f"`{hwid}`", inline=True)
-        else:
-            embed.add_field(name="Luarmor Status", value="No active whitelist", inline=False)
-
-        if redemptions.data:
-            history = []
-            for i, r in enumerate(redemptions.data[:5]):
-                product = r.get("product_name", "Unknown")
-                variant = r.get("variant_name", "Unknown")
-                invoice = r.get("invoice_id", "N/A")
-                redeemed_at = r.get("redeemed_at")
-                
-                if redeemed_at:
-                    try:
-                        ts = int(datetime.fromisoformat(redeemed_at.replace("Z", "+00:00")).timestamp())
-                        date_str = f"<t:{ts}:d>"
-                    except:
-                        date_str = redeemed_at[:10]
-                else:
-                    date_str = "Unknown"
-                
-                history.append(f"**{i+1}.** {variant} - {date_str}\n   Invoice: `{invoice[:15]}...`")
-            
-            embed.add_field(
-                name=f"Purchase History ({len(redemptions.data)} total)",
-                value="\n".join(history) or "None",
-                inline=False
-            )
-        else:
-            embed.add_field(name="Purchase History", value="No purchases found", inline=False)
+                line = "❌ Not owned"
 
-        if referral.data:
-            ref = referral.data[0]
-            embed.add_field(
-                name="Referral Code",
-                value=f"`{ref.get('referral_code')}` ({ref.get('uses', 0)} uses)",
-                inline=False
-            )
+            prev = redeemed_by_pass.get(gamepass_id)
+            if prev:
+                line += f"\nRedeemed by <@{prev.get('discord_id')}> ({(prev.get('redeemed_at') or 'Unknown')[:10]})"
+
+            embed.add_field(name=f"{info['name']} (`{gamepass_id}`)", value=line, inline=False)
 
         await interaction.followup.send(embed=embed, ephemeral=True)
 
     @discord.app_commands.command(name="stats", description="View bot and sales statistics")
+    @query_budget(7)  # one bot_stats RPC; without sql/bot_stats.sql the failed RPC plus six counts
     async def stats(self, interaction: Interaction):
         if not _is_any_staff(interaction.user):
             await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
@@ -899,34 +1113,13 @@ class Admin(commands.Cog):
         month_ago = (now - timedelta(days=30)).isoformat()
         week_ago = (now - timedelta(days=7)).isoformat()
 
-        total = supabase.table("role_redeem").select("id", count="exact").execute()
-        total_count = total.count or 0
-
-        monthly = supabase.table("role_redeem").select("id", count="exact").gte(
-            "redeemed_at", month_ago
-        ).execute()
-        monthly_count = monthly.count or 0
-
-        weekly = supabase.table("role_redeem").select("id", count="exact").gte(
-            "redeemed_at", week_ago
-        ).execute()
-        weekly_count = weekly.count or 0
-
-        active = supabase.table("role_redeem").select("id", count="exact").eq(
-            "whitelisted", True
-        ).execute()
-        active_count = active.count or 0
-
-        all_redemptions = supabase.table("role_redeem").select("variant_name").execute()
-        variant_counts = {}
-        for r in (all_redemptions.data or []):
-            v = r.get("variant_name", "Unknown")
-            variant_counts[v] = variant_counts.get(v, 0) + 1
-
-        open_tickets = supabase.table("tickets").select("id", count="exact").eq(
-            "status", "open"
-        ).execute()
-        ticket_count = open_tickets.count or 0
+        stats = await _load_stats(month_ago, week_ago)
+        total_count = stats["total"]
+        monthly_count = stats["monthly"]
+        weekly_count = stats["weekly"]
+        active_count = stats["active"]
+        ticket_count = stats["open_tickets"]
+        variant_counts = stats["variants"]
 
         embed = discord.Embed(title="Shop Statistics", color=discord.Color(EMBED_COLOR))
         embed.set_thumbnail(url=BOT_LOGO_URL)
@@ -1011,7 +1204,7 @@ class Admin(commands.Cog):
         try:
             await interaction.response.defer(ephemeral=True)
             
-            existing = supabase.table("referrals").select("*").eq(
+            existing = select("referrals", "referral_code, uses, bonus_days_per_referral").eq(
                 "referrer_discord_id", int(interaction.user.id)
             ).limit(1).execute()
 
@@ -1070,6 +1263,7 @@ class Admin(commands.Cog):
 
     @discord.app_commands.command(name="referrals", description="View your referral stats")
     @discord.app_commands.describe(user="The user to check (staff only)")
+    @query_budget(2)
     async def referrals(self, interaction: Interaction, user: discord.Member = None):
         target = user or interaction.user
         
@@ -1080,7 +1274,7 @@ class Admin(commands.Cog):
 
         await interaction.response.defer(ephemeral=True)
 
-        referral = supabase.table("referrals").select("*").eq(
+        referral = select("referrals", "referral_code, uses, bonus_days_per_referral").eq(
             "referrer_discord_id", int(target.id)
         ).limit(1).execute()
 
@@ -1097,9 +1291,9 @@ class Admin(commands.Cog):
         uses = ref.get("uses", 0)
         bonus_days = ref.get("bonus_days_per_referral", 3)
 
-        referral_uses = supabase.table("referral_uses").select("*").eq(
+        referral_uses = select("referral_uses", "referred_discord_id, bonus_days_awarded, created_at").eq(
             "referrer_discord_id", int(target.id)
-        ).order("created_at", desc=True).limit(10).execute()
+        ).order("created_at", desc=True).limit(5).execute()
 
         embed = discord.Embed(
             title=f"Referral Stats: {target}",
@@ -0,0 +1,274 @@
+import io
+import discord
+from discord.ext import commands
+from discord import Interaction
+
+from utils.supabase import get_supabase, execute_async
+from utils.members import member_resolver
+from utils.luarmor import add_time_to_user, delete_user_by_discord
+from utils.bulk import run_bulk, read_csv_rows, results_to_csv
+from utils.plans import plan_for_days
+from utils import events, keypool
+from commands.admin import _is_admin_staff, whitelist_plan_for_days
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+LOG_CHANNEL_ID = 1449252986911068273
+ACCESS_ROLE_ID = 1444450052323147826
+
+MAX_ROWS = 1000
+MAX_FILE_BYTES = 256 * 1024
+MAX_DAYS = 3650
+
+BULK_CONCURRENCY = 4
+BULK_RATE_PER_SEC = 3.0  # Luarmor + role edits per second across the whole job
+IN_CHUNK_SIZE = 200      # discord_ids per in_() query (keeps the request URL short)
+
+supabase = get_supabase()
+
+
+def _parse_discord_id(value: str) -> int | None:
+    if value.isdigit() and 15 <= len(value) <= 21:
+        return int(value)
+    return None
+
+
+def _validate(rows: list[dict], second_column: str) -> tuple[list[dict], list[str]]:
+    """Check every row up front. Returns (clean rows, errors)."""
+    errors = []
+    clean = []
+    seen = set()
+
+    if not rows:
+        errors.append("The file has no rows.")
+    if len(rows) > MAX_ROWS:
+        errors.append(f"Too many rows ({len(rows)}). Max is {MAX_ROWS}.")
+
+    for row in rows:
+        line = row["line"]
+        discord_id = _parse_discord_id(row["discord_id"])
+        if discord_id is None:
+            errors.append(f"Line {line}: invalid discord_id `{row['discord_id']}`")
+            continue
+        if discord_id in seen:
+            errors.append(f"Line {line}: duplicate discord_id `{discord_id}`")
+            continue
+        seen.add(discord_id)
+
+        item = {"line": line, "discord_id": discord_id}
+        if second_column == "days":
+            raw = row.get("days", "")
+            if not raw.lstrip("-").isdigit():
+                errors.append(f"Line {line}: days must be a whole number")
+                continue
+            item["days"] = int(raw)
+        else:
+            item[second_column] = row.get(second_column) or "No reason provided"
+        clean.append(item)
+
+    return clean, errors
+
+
+async def _blacklisted_ids(ids: list[int]) -> set[int]:
+    """Which of `ids` are already on the blacklist, IN_CHUNK_SIZE ids per query."""
+    found = set()
+    for i in range(0, len(ids), IN_CHUNK_SIZE):
+        resp = await execute_async(
+            supabase.table("blacklist").select("discord_id").in_("discord_id", ids[i:i + IN_CHUNK_SIZE])
+        )
+        found.update(int(r["discord_id"]) for r in (resp.data or []))
+    return found
+
+
+class Bulk(commands.Cog):
+    """CSV-driven bulk variants of /whitelist, /addtime and /blacklist."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    async def _load_rows(self, interaction: Interaction, file: discord.Attachment, second_column: str):
+        if not _is_admin_staff(interaction.user):
+            await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+            return None
+        if file.size > MAX_FILE_BYTES:
+            await interaction.response.send_message("File is too large (max 256 KB).", ephemeral=True)
+            return None
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        rows = read_csv_rows(await file.read(), ["discord_id", second_column])
+        items, errors = _validate(rows, second_column)
+        return items, errors
+
+    async def _report_errors(self, interaction: Interaction, errors: list[str]):
+        shown = "\n".join(errors[:20])
+        more = f"\n...and {len(errors) - 20} more" if len(errors) > 20 else ""
+        await interaction.followup.send(
+            f"Nothing was changed - fix these rows and upload again:\n{shown}{more}", ephemeral=True
+        )
+
+    async def _run(self, interaction: Interaction, title: str, items: list[dict], worker, columns: list[str]):
+        progress_msg = await interaction.followup.send(f"{title}: 0/{len(items)} processed...", ephemeral=True, wait=True)
+
+        async def on_progress(done: int, total: int):
+            await progress_msg.edit(content=f"{title}: {done}/{total} processed...")
+
+        results = await run_bulk(
+            items, worker,
+            concurrency=BULK_CONCURRENCY,
+            rate_per_sec=BULK_RATE_PER_SEC,
+            on_progress=on_progress,
+        )
+
+        ok = sum(1 for r in results if r.ok)
+        failed = len(results) - ok
+        await progress_msg.edit(content=f"{title}: done - **{ok}** succeeded, **{failed}** failed.")
+
+        report = discord.File(io.BytesIO(results_to_csv(results, columns)), filename=f"{title.lower().replace(' ', '-')}-results.csv")
+        await interaction.followup.send("Per-user results:", file=report, ephemeral=True)
+
+        # One consolidated log entry instead of one embed per user
+        log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
+        if log_channel:
+            log_embed = discord.Embed(title=title, color=discord.Color.blue())
+            log_embed.add_field(name="Rows", value=str(len(results)), inline=True)
+            log_embed.add_field(name="Succeeded", value=str(ok), inline=True)
+            log_embed.add_field(name="Failed", value=str(failed), inline=True)
+            log_embed.add_field(name="Staff", value=f"{interaction.user.mention}", inline=True)
+            log_report = discord.File(io.BytesIO(results_to_csv(results, columns)), filename="results.csv")
+            await log_channel.send(embed=log_embed, file=log_report)
+            events.record("bulk", log_embed, actor_id=interaction.user.id, post=False)
+
+        return results
+
+    @discord.app_commands.command(name="bulkwhitelist", description="Whitelist many users from a CSV (discord_id,days)")
+    @discord.app_commands.describe(
+        file="CSV with discord_id,days per line (days 0 = lifetime)",
+        notify="DM each user after whitelisting"
+    )
+    async def bulkwhitelist(self, interaction: Interaction, file: discord.Attachment, notify: bool = False):
+        loaded = await self._load_rows(interaction, file, "days")
+        if loaded is None:
+            return
+        items, errors = loaded
+        errors += [f"Line {i['line']}: days must be 0-{MAX_DAYS}" for i in items if not 0 <= i["days"] <= MAX_DAYS]
+        if errors:
+            await self._report_errors(interaction, errors)
+            return
+
+        ids = [i["discord_id"] for i in items]
+        blacklisted_ids = await _blacklisted_ids(ids)
+        members = await member_resolver.resolve_many(interaction.guild, ids)
+        role = interaction.guild.get_role(ACCESS_ROLE_ID)
+
+        async def worker(item):
+            uid = item["discord_id"]
+            if uid in blacklisted_ids:
+                return False, "blacklisted"
+
+            product_name, expiry_text = whitelist_plan_for_days(item["days"])
+            result = await keypool.provision(
+                uid, product_name,
+                note=f"Bulk whitelist by {interaction.user.id}",
+                expiry=plan_for_days(item["days"]).expiry(),
+            )
+            if not result or result.get("error"):
+                return False, f"luarmor failed: {result.get('error') if result else 'unknown error'}"
+
+            member = members.get(uid)
+            if member is None:
+                return True, "whitelisted (not in server, no role)"
+            if role and role not in member.roles:
+                await member.add_roles(role, reason=f"Bulk whitelist by {interaction.user}")
+            if notify:
+                try:
+                    await member.send(f"You have been whitelisted for **{expiry_text}**.")
+                except discord.HTTPException:
+                    pass
+            return True, f"whitelisted ({expiry_text})"
+
+        await self._run(interaction, "Bulk Whitelist", items, worker, ["discord_id", "days"])
+
+    @discord.app_commands.command(name="bulkaddtime", description="Add days to many users from a CSV (discord_id,days)")
+    @discord.app_commands.describe(file="CSV with discord_id,days per line")
+    async def bulkaddtime(self, interaction: Interaction, file: discord.Attachment):
+        loaded = await self._load_rows(interaction, file, "days")
+        if loaded is None:
+            return
+        items, errors = loaded
+        errors += [f"Line {i['line']}: days must be 1-{MAX_DAYS}" for i in items if not 1 <= i["days"] <= MAX_DAYS]
+        if errors:
+            await self._report_errors(interaction, errors)
+            return
+
+        async def worker(item):
+            result = await add_time_to_user(item["discord_id"], item["days"])
+            if not result:
+                return False, "no whitelist key"
+            if result.get("error") == "lifetime":
+                return True, "lifetime - nothing to extend"
+            return True, f"new expiry {result['new_expire']}"
+
+        await self._run(interaction, "Bulk Add Time", items, worker, ["discord_id", "days"])
+
+    @discord.app_commands.command(name="bulkblacklist", description="Blacklist many users from a CSV (discord_id,reason)")
+    @discord.app_commands.describe(file="CSV with discord_id,reason per line")
+    async def bulkblacklist(self, interaction: Interaction, file: discord.Attachment):
+        loaded = await self._load_rows(interaction, file, "reason")
+        if loaded is None:
+            return
+        items, errors = loaded
+        if errors:
+            await self._report_errors(interaction, errors)
+            return
+
+        ids = [i["discord_id"] for i in items]
+        already = await _blacklisted_ids(ids)
+
+        # Blacklist first, so nobody loses access without actually ending up on the list
+        insert_errors: dict[int, str] = {}
+        new_rows = [
+            {"discord_id": i["discord_id"], "reason": i["reason"], "blacklisted_by": int(interaction.user.id)}
+            for i in items if i["discord_id"] not in already
+        ]
+        for start in range(0, len(new_rows), IN_CHUNK_SIZE):
+            chunk = new_rows[start:start + IN_CHUNK_SIZE]
+            try:
+                await execute_async(supabase.table("blacklist").insert(chunk))
+            except Exception as e:
+                print(f"[BULK] Blacklist insert failed for {len(chunk)} user(s): {e}")
+                insert_errors.update({r["discord_id"]: str(e)[:200] for r in chunk})
+
+        members = await member_resolver.resolve_many(interaction.guild, ids)
+        role = interaction.guild.get_role(ACCESS_ROLE_ID)
+
+        async def worker(item):
+            uid = item["discord_id"]
+            if uid in already:
+                return False, "already blacklisted"
+            if uid in insert_errors:
+                return False, f"blacklist insert failed, access untouched: {insert_errors[uid]}"
+
+            steps = ["blacklisted"]
+            try:
+                if await delete_user_by_discord(uid):
+                    steps.append("key deleted")
+            except Exception as e:
+                return False, f"blacklisted, key removal failed: {e}"
+
+            member = members.get(uid)
+            if member and role and role in member.roles:
+                try:
+                    await member.remove_roles(role, reason=f"Bulk blacklist by {interaction.user}")
+                except discord.HTTPException as e:
+                    return False, f"{', '.join(steps)}, role removal failed: {e}"
+                steps.append("role removed")
+            return True, ", ".join(steps)
+
+        await self._run(interaction, "Bulk Blacklist", items, worker, ["discord_id", "reason"])
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Bulk(bot))
+    print("✅ Loaded cog: bulk")
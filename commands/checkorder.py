@@ -1,13 +1,18 @@
+import io
 import os
+import re
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
-import aiohttp
-from aiohttp import ClientTimeout
 from datetime import datetime, timezone
 from typing import Optional
 
-from utils.supabase import get_supabase
+from utils.supabase import get_supabase, execute_async
+from utils.fanout import fan_out, collect_late, SourceResult
+from utils.bulk import RateLimiter
+from utils.queries import select, query_budget
+from utils.sellauth import fetch_invoice, invoice_status, extract_product_and_variant
+from utils import unredeemed
 
 # -----------------------------
 # CONFIG
@@ -19,75 +24,242 @@ SUPPORT_ROLE_IDS = {1449491116822106263}  # Support team (view only)
 ALL_STAFF_ROLE_IDS = ADMIN_STAFF_ROLE_IDS | SUPPORT_ROLE_IDS
 
 SHOP_URL = os.getenv("SHOP_URL", "").strip()
-SELLAUTH_API_KEY = os.getenv("SELLAUTH_API_KEY")
-SELLAUTH_SHOP_ID = os.getenv("SELLAUTH_SHOP_ID")
+
+# First render waits at most this long per source, then late results are edited in
+CHECK_DB_DEADLINE = 2.5
+CHECK_SELLAUTH_DEADLINE = 3.0
+CHECK_LATE_TIMEOUT = 10.0
+
+# Several IDs in one /checkorder: one in_() query plus spaced-out SellAuth fetches
+MAX_ORDERS_PER_CHECK = 10
+CHECK_SELLAUTH_RATE_PER_SEC = 20.0
+
+# Paid-but-unredeemed finder: pull new invoices into the local index this often
+UNREDEEMED_REFRESH_MINUTES = 60
+UNREDEEMED_LIST_LIMIT = 15
+
+# Everything build_order_embed reads from the redemption row
+REDEEM_COLUMNS = "invoice_id, discord_id, redeemed_by, redeemed_at, product_name, variant_name, expires_at"
 
 supabase = get_supabase()
 
 # -----------------------------
-# SELLAUTH
+# HELPERS
 # -----------------------------
-async def fetch_invoice(invoice_id: str) -> dict | None:
-    if not SELLAUTH_API_KEY or not SELLAUTH_SHOP_ID:
+def try_parse_iso_to_unix(ts: Optional[str]) -> Optional[int]:
+    if not ts:
+        return None
+    try:
+        dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+        return int(dt.timestamp())
+    except Exception:
         return None
 
-    url = f"https://api.sellauth.com/v1/shops/{SELLAUTH_SHOP_ID}/invoices/{invoice_id}"
-    headers = {"Authorization": f"Bearer {SELLAUTH_API_KEY}"}
+def _source_note(result: SourceResult) -> str | None:
+    if result.status == "pending":
+        return "⏳ still loading"
+    if result.status == "failed":
+        return f"⚠️ unavailable ({result.error})"
+    return None
+
+
+def parse_order_ids(raw: str) -> list[str]:
+    """Order IDs separated by spaces, commas or newlines, de-duplicated in the order given."""
+    return list(dict.fromkeys(p for p in re.split(r"[\s,;]+", raw or "") if p))
+
+
+def order_results(invoice_id: str, results: dict[str, SourceResult]) -> dict[str, SourceResult]:
+    """Slice the shared fan-out results down to one order (its redemption rows + its SellAuth fetch)."""
+    redeem = results["redeem"]
+    if redeem.ok:
+        rows = [r for r in (redeem.value.data or []) if str(r.get("invoice_id") or "").strip() == invoice_id]
+        redeem = SourceResult("ok", rows)
+    return {"redeem": redeem, "sellauth": results[f"sellauth:{invoice_id}"]}
+
+
+def _order_state(results: dict[str, SourceResult]):
+    """(redeemed_row, invoice, paid, refunded, cancelled, status, headline, color) for one order."""
+    redeem_result = results["redeem"]
+    sellauth_result = results["sellauth"]
+
+    redeemed_row = None
+    if redeem_result.ok and redeem_result.value:
+        redeemed_row = redeem_result.value[0]
+
+    invoice = sellauth_result.value if sellauth_result.ok else None
+    paid, refunded, cancelled, status = invoice_status(invoice)
+    is_redeemed = bool(redeemed_row)
+
+    # Colors/headline
+    if not sellauth_result.ok or not redeem_result.ok:
+        color = discord.Color.light_grey()
+        headline = "Partial result - some sources are still loading or unavailable"
+    elif paid and is_redeemed:
+        color = discord.Color.green()
+        headline = "Paid and redeemed"
+    elif paid and not is_redeemed:
+        color = discord.Color.orange()
+        headline = "Paid but not redeemed"
+    else:
+        color = discord.Color.red()
+        if refunded:
+            headline = "Refunded"
+        elif cancelled:
+            headline = "Cancelled"
+        elif invoice is None:
+            headline = "Order not found"
+        else:
+            headline = "Not paid / not completed"
 
-    timeout = ClientTimeout(total=8)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status != 200:
-                return None
-            return await resp.json()
+    return redeemed_row, invoice, paid, refunded, cancelled, status, headline, color
 
-def get_paid_refund_cancel(invoice: Optional[dict]) -> tuple[bool, bool, bool, str]:
-    if not invoice:
-        return False, False, False, "not_found"
 
-    status = (invoice.get("status") or "unknown").lower()
-    refunded = bool(invoice.get("refunded", False))
-    cancelled = bool(invoice.get("cancelled", False))
+def build_order_embed(invoice_id: str, results: dict[str, SourceResult]) -> discord.Embed:
+    redeem_result = results["redeem"]
+    sellauth_result = results["sellauth"]
+    redeemed_row, invoice, paid, refunded, cancelled, status, headline, color = _order_state(results)
 
-    paid = status in {"paid", "completed", "complete"} and not refunded and not cancelled
-    return paid, refunded, cancelled, status
+    # Product/variant (SellAuth first, then Supabase fallback)
+    sa_product, sa_variant = extract_product_and_variant(invoice)
+    db_product = (redeemed_row.get("product_name") if redeemed_row else None)
+    db_variant = (redeemed_row.get("variant_name") if redeemed_row else None)
 
-def extract_product_and_variant(invoice: Optional[dict]) -> tuple[str, str]:
-    """
-    Matches your SellAuth payload:
-      invoice['items'][0]['product']['name']
-      invoice['items'][0]['variant']['name']
-    """
-    if not invoice:
-        return "Unknown", "Standard"
+    product_name = sa_product if sa_product != "Unknown" else (db_product or "Unknown")
+    variant_name = sa_variant if sa_variant != "Standard" else (db_variant or sa_variant or "Standard")
 
-    items = invoice.get("items")
-    if isinstance(items, list) and items and isinstance(items[0], dict):
-        first = items[0]
-        product = first.get("product")
-        variant = first.get("variant")
+    is_redeemed = bool(redeemed_row)
+    sellauth_note = _source_note(sellauth_result)
+    redeem_note = _source_note(redeem_result)
 
-        product_name = None
-        variant_name = None
+    flags = []
+    if refunded:
+        flags.append("REFUNDED")
+    if cancelled:
+        flags.append("CANCELLED")
+    flags_text = " • ".join(flags) if flags else "None"
 
-        if isinstance(product, dict):
-            product_name = product.get("name") or product.get("title")
-        if isinstance(variant, dict):
-            variant_name = variant.get("name") or variant.get("title")
+    embed = discord.Embed(
+        title="Order Check",
+        description=f"**{headline}**",
+        color=color
+    )
 
-        if product_name:
-            return str(product_name).strip(), str(variant_name or "Standard").strip()
+    embed.add_field(name="Order ID", value=f"`{invoice_id}`", inline=False)
+    if sellauth_note:
+        embed.add_field(name="SellAuth", value=sellauth_note, inline=False)
+    else:
+        embed.add_field(name="SellAuth Status", value=f"`{status}`", inline=True)
+        embed.add_field(name="Flags", value=f"`{flags_text}`", inline=True)
+        embed.add_field(name="Paid", value="✅ Yes" if paid else "❌ No", inline=True)
 
-    return "Unknown", "Standard"
+    if redeem_note:
+        embed.add_field(name="Redeemed", value=redeem_note, inline=True)
+    else:
+        embed.add_field(name="Redeemed", value="✅ Yes" if is_redeemed else "❌ No", inline=True)
+
+    embed.add_field(
+        name="Product",
+        value=f"**{product_name}**\nVariant: `{variant_name}`",
+        inline=False
+    )
+
+    if redeemed_row:
+        redeemed_at = redeemed_row.get("redeemed_at")
+        redeemed_ts = try_parse_iso_to_unix(redeemed_at)
+        redeemed_at_display = f"<t:{redeemed_ts}:F>" if redeemed_ts else f"`{redeemed_at or 'N/A'}`"
+
+        # NEW: use discord_id (fallback to old username if needed)
+        discord_id = redeemed_row.get("discord_id")
+        if discord_id:
+            granted_to_display = f"<@{discord_id}>\n`{discord_id}`"
+        else:
+            granted_to_display = str(redeemed_row.get("discord_username", "Unknown"))
+
+        embed.add_field(
+            name="Granted To",
+            value=granted_to_display,
+            inline=True
+        )
+        embed.add_field(
+            name="Redeemed By",
+            value=f"`{redeemed_row.get('redeemed_by', 'N/A')}`",
+            inline=True
+        )
+        embed.add_field(
+            name="Redeemed At",
+            value=redeemed_at_display,
+            inline=False
+        )
+
+        # OPTIONAL: show expiry if present
+        expires_at = redeemed_row.get("expires_at")
+        if expires_at:
+            exp_ts = try_parse_iso_to_unix(expires_at)
+            exp_display = f"<t:{exp_ts}:F>" if exp_ts else f"`{expires_at}`"
+            embed.add_field(name="Expires", value=exp_display, inline=False)
+        else:
+            # If you want lifetime shown only when redeemed, keep this:
+            embed.add_field(name="Expires", value="Lifetime / None", inline=False)
+
+    embed.set_footer(text="Script Union • Order Verification")
+    return embed
+
+
+def build_unredeemed_embed(report: unredeemed.UnredeemedReport) -> discord.Embed:
+    color = discord.Color.orange() if report.orders else discord.Color.green()
+    embed = discord.Embed(
+        title="Paid but Not Redeemed",
+        description=f"**{len(report.orders)}** paid order(s) from the last {report.window_days} day(s) were never redeemed.",
+        color=color
+    )
+    embed.add_field(name="Paid Orders Checked", value=str(report.paid_checked), inline=True)
+    embed.add_field(name="Redeemed", value=str(report.redeemed), inline=True)
+    embed.add_field(
+        name="By Age",
+        value="\n".join(f"{label}: **{count}**" for label, count in report.buckets().items()),
+        inline=True
+    )
+
+    if report.orders:
+        lines = [
+            f"`{o.invoice_id}` • {o.product_name} ({o.variant_name}) • <t:{int(o.created_at)}:R>"
+            for o in report.orders[:UNREDEEMED_LIST_LIMIT]
+        ]
+        if len(report.orders) > UNREDEEMED_LIST_LIMIT:
+            lines.append(f"...and {len(report.orders) - UNREDEEMED_LIST_LIMIT} more (see CSV)")
+        embed.add_field(name="Oldest First", value="\n".join(lines)[:1024], inline=False)
+
+    embed.set_footer(text="Script Union • Order Verification")
+    return embed
+
+STATE_ICONS = {
+    "Paid and redeemed": "✅",
+    "Paid but not redeemed": "🟠",
+    "Partial result - some sources are still loading or unavailable": "⏳",
+}
+
+
+def build_summary_embed(invoice_ids: list[str], results: dict[str, SourceResult]) -> discord.Embed:
+    lines = []
+    counts: dict[str, int] = {}
+    for invoice_id in invoice_ids:
+        headline = _order_state(order_results(invoice_id, results))[6]
+        counts[headline] = counts.get(headline, 0) + 1
+        lines.append(f"{STATE_ICONS.get(headline, '❌')} `{invoice_id}` - {headline}")
+
+    embed = discord.Embed(
+        title="Order Check",
+        description=f"**{len(invoice_ids)} orders**\n\n" + "\n".join(lines),
+        color=discord.Color.blurple()
+    )
+    embed.add_field(
+        name="Summary",
+        value="\n".join(f"{headline}: **{n}**" for headline, n in counts.items()),
+        inline=False
+    )
+    embed.set_footer(text="Script Union • Order Verification • Use ▶ for details")
+    return embed
 
-def try_parse_iso_to_unix(ts: Optional[str]) -> Optional[int]:
-    if not ts:
-        return None
-    try:
-        dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-        return int(dt.timestamp())
-    except Exception:
-        return None
 
 # -----------------------------
 # UI
@@ -104,6 +276,50 @@ class CopyOrderView(discord.ui.View):
     async def copy_order_id(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_message(f"\`\`\`{self.invoice_id}\`\`\`", ephemeral=True)
 
+
+class OrderPagesView(CopyOrderView):
+    """Summary page plus one page per order; late SellAuth results are filled in by re-rendering."""
+
+    def __init__(self, owner_id: int, invoice_ids: list[str], results: dict[str, SourceResult]):
+        super().__init__(" ".join(invoice_ids))
+        self.timeout = 300
+        self.owner_id = owner_id
+        self.invoice_ids = invoice_ids
+        self.results = results
+        self.page_index = 0  # 0 = summary, then one page per order
+
+        self.prev_button = discord.ui.Button(label="◀ Prev", style=discord.ButtonStyle.secondary, disabled=True)
+        self.next_button = discord.ui.Button(label="Next ▶", style=discord.ButtonStyle.secondary)
+        self.prev_button.callback = self._on_prev
+        self.next_button.callback = self._on_next
+        self.add_item(self.prev_button)
+        self.add_item(self.next_button)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.owner_id
+
+    def render(self) -> discord.Embed:
+        self.prev_button.disabled = self.page_index == 0
+        self.next_button.disabled = self.page_index >= len(self.invoice_ids)
+
+        if self.page_index == 0:
+            self.invoice_id = " ".join(self.invoice_ids)
+            return build_summary_embed(self.invoice_ids, self.results)
+
+        self.invoice_id = self.invoice_ids[self.page_index - 1]
+        embed = build_order_embed(self.invoice_id, order_results(self.invoice_id, self.results))
+        embed.set_footer(text=f"Order {self.page_index}/{len(self.invoice_ids)} • Script Union • Order Verification")
+        return embed
+
+    async def _on_prev(self, interaction: discord.Interaction):
+        self.page_index = max(0, self.page_index - 1)
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    async def _on_next(self, interaction: discord.Interaction):
+        self.page_index = min(len(self.invoice_ids), self.page_index + 1)
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+
 def staff_only():
     async def predicate(interaction: discord.Interaction) -> bool:
         if not interaction.guild or not isinstance(interaction.user, discord.Member):
@@ -121,131 +337,97 @@ def staff_only():
 class CheckOrder(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.refresh_unredeemed.start()
+
+    def cog_unload(self):
+        self.refresh_unredeemed.cancel()
+
+    @tasks.loop(minutes=UNREDEEMED_REFRESH_MINUTES)
+    async def refresh_unredeemed(self):
+        """Keep the local invoice index current so /unredeemed only fetches the newest invoices."""
+        try:
+            fetched = await unredeemed.refresh()
+            if fetched:
+                print(f"[UNREDEEMED] Indexed {fetched} updated invoice(s)")
+        except Exception as e:
+            print(f"[UNREDEEMED REFRESH ERROR] {e}")
+
+    @refresh_unredeemed.before_loop
+    async def before_refresh_unredeemed(self):
+        await self.bot.wait_until_ready()
 
     @app_commands.command(
         name="checkorder",
-        description="Check SellAuth paid/refund status + whether an order has been redeemed"
+        description="Check SellAuth paid/refund status + whether one or more orders have been redeemed"
     )
+    @app_commands.describe(order_id=f"One or more order IDs separated by spaces or commas (max {MAX_ORDERS_PER_CHECK})")
     @app_commands.guilds(discord.Object(id=GUILD_ID))
     @staff_only()
+    @query_budget(1)
     async def checkorder(self, interaction: discord.Interaction, order_id: str):
         await interaction.response.defer(ephemeral=True, thinking=True)
-        invoice_id = (order_id or "").strip()
-
-        # Supabase: redeemed?
-        redeemed_row = None
-        try:
-            res = (
-                supabase.table("role_redeem")
-                .select("*")
-                .eq("invoice_id", invoice_id)
-                .limit(1)
-                .execute()
+        invoice_ids = parse_order_ids(order_id)
+        if not invoice_ids:
+            await interaction.followup.send("Give at least one order ID.", ephemeral=True)
+            return
+        if len(invoice_ids) > MAX_ORDERS_PER_CHECK:
+            await interaction.followup.send(
+                f"That's {len(invoice_ids)} order IDs - check at most {MAX_ORDERS_PER_CHECK} at a time.", ephemeral=True
             )
-            if res.data:
-                redeemed_row = res.data[0]
-        except Exception:
-            redeemed_row = None
-
-        # SellAuth: invoice
-        invoice = await fetch_invoice(invoice_id)
-        paid, refunded, cancelled, status = get_paid_refund_cancel(invoice)
-
-        # Product/variant (SellAuth first, then Supabase fallback)
-        sa_product, sa_variant = extract_product_and_variant(invoice)
-        db_product = (redeemed_row.get("product_name") if redeemed_row else None)
-        db_variant = (redeemed_row.get("variant_name") if redeemed_row else None)
-
-        product_name = sa_product if sa_product != "Unknown" else (db_product or "Unknown")
-        variant_name = sa_variant if sa_variant != "Standard" else (db_variant or sa_variant or "Standard")
-
-        is_redeemed = bool(redeemed_row)
-
-        # Colors/headline
-        if paid and is_redeemed:
-            color = discord.Color.green()
-            headline = "Paid and redeemed"
-        elif paid and not is_redeemed:
-            color = discord.Color.orange()
-            headline = "Paid but not redeemed"
-        else:
-            color = discord.Color.red()
-            if refunded:
-                headline = "Refunded"
-            elif cancelled:
-                headline = "Cancelled"
-            elif invoice is None:
-                headline = "Order not found"
-            else:
-                headline = "Not paid / not completed"
-
-        flags = []
-        if refunded:
-            flags.append("REFUNDED")
-        if cancelled:
-            flags.append("CANCELLED")
-        flags_text = " • ".join(flags) if flags else "None"
-
-        embed = discord.Embed(
-            title="Order Check",
-            description=f"**{headline}**",
-            color=color
-        )
+            return
 
-        embed.add_field(name="Order ID", value=f"`{invoice_id}`", inline=False)
-        embed.add_field(name="SellAuth Status", value=f"`{status}`", inline=True)
-        embed.add_field(name="Flags", value=f"`{flags_text}`", inline=True)
-        embed.add_field(name="Paid", value="✅ Yes" if paid else "❌ No", inline=True)
-        embed.add_field(name="Redeemed", value="✅ Yes" if is_redeemed else "❌ No", inline=True)
+        limiter = RateLimiter(CHECK_SELLAUTH_RATE_PER_SEC)
+
+        async def fetch(invoice_id: str):
+            await limiter.wait()
+            return await fetch_invoice(invoice_id)
+
+        # One Supabase query for every ID, SellAuth fetches side by side; slow ones are edited in
+        sources = {
+            "redeem": (lambda: execute_async(
+                select("role_redeem", REDEEM_COLUMNS)
+                .in_("invoice_id", invoice_ids)
+            ), CHECK_DB_DEADLINE),
+        }
+        for invoice_id in invoice_ids:
+            sources[f"sellauth:{invoice_id}"] = (lambda i=invoice_id: fetch(i), CHECK_SELLAUTH_DEADLINE)
+        results, pending = await fan_out(sources)
+
+        if len(invoice_ids) == 1:
+            view = CopyOrderView(invoice_ids[0])
+            render = lambda: build_order_embed(invoice_ids[0], order_results(invoice_ids[0], results))
+        else:
+            view = OrderPagesView(interaction.user.id, invoice_ids, results)
+            render = view.render
 
-        embed.add_field(
-            name="Product",
-            value=f"**{product_name}**\nVariant: `{variant_name}`",
-            inline=False
-        )
+        message = await interaction.followup.send(embed=render(), view=view, ephemeral=True, wait=True)
 
-        if redeemed_row:
-            redeemed_at = redeemed_row.get("redeemed_at")
-            redeemed_ts = try_parse_iso_to_unix(redeemed_at)
-            redeemed_at_display = f"<t:{redeemed_ts}:F>" if redeemed_ts else f"`{redeemed_at or 'N/A'}`"
-
-            # NEW: use discord_id (fallback to old username if needed)
-            discord_id = redeemed_row.get("discord_id")
-            if discord_id:
-                granted_to_display = f"<@{discord_id}>\n`{discord_id}`"
-            else:
-                granted_to_display = str(redeemed_row.get("discord_username", "Unknown"))
-
-            embed.add_field(
-                name="Granted To",
-                value=granted_to_display,
-                inline=True
-            )
-            embed.add_field(
-                name="Redeemed By",
-                value=f"`{redeemed_row.get('redeemed_by', 'N/A')}`",
-                inline=True
-            )
-            embed.add_field(
-                name="Redeemed At",
-                value=redeemed_at_display,
-                inline=False
-            )
+        if pending:
+            results.update(await collect_late(pending, CHECK_LATE_TIMEOUT))
+            try:
+                await message.edit(embed=render(), view=view)
+            except discord.HTTPException as e:
+                print(f"[CHECKORDER] Could not update order message: {e}")
 
-            # OPTIONAL: show expiry if present
-            expires_at = redeemed_row.get("expires_at")
-            if expires_at:
-                exp_ts = try_parse_iso_to_unix(expires_at)
-                exp_display = f"<t:{exp_ts}:F>" if exp_ts else f"`{expires_at}`"
-                embed.add_field(name="Expires", value=exp_display, inline=False)
-            else:
-                # If you want lifetime shown only when redeemed, keep this:
-                embed.add_field(name="Expires", value="Lifetime / None", inline=False)
+    @app_commands.command(
+        name="unredeemed",
+        description="List paid SellAuth orders that were never redeemed"
+    )
+    @app_commands.describe(days=f"How far back to look (max {unredeemed.LOOKBACK_DAYS} days)")
+    @app_commands.guilds(discord.Object(id=GUILD_ID))
+    @staff_only()
+    async def unredeemed_orders(self, interaction: discord.Interaction, days: int = 30):
+        await interaction.response.defer(ephemeral=True, thinking=True)
 
-        embed.set_footer(text="Script Union • Order Verification")
+        # Incremental: only invoices updated since the last refresh are fetched
+        try:
+            await unredeemed.refresh()
+        except Exception as e:
+            print(f"[UNREDEEMED] Refresh failed, reporting from the local index: {e}")
 
-        view = CopyOrderView(invoice_id)
-        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+        report = await unredeemed.build_report(days)
+        file = discord.File(io.BytesIO(unredeemed.report_csv(report)), filename="unredeemed-orders.csv")
+        await interaction.followup.send(embed=build_unredeemed_embed(report), file=file, ephemeral=True)
 
     async def cog_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
         if isinstance(error, app_commands.CheckFailure):
@@ -4,6 +4,9 @@ from discord import app_commands, ui, Interaction
 import json
 import os
 from utils.supabase import get_supabase
+from utils.queries import select, query_budget
+from utils.admission import rate_limited
+from utils.supervisor import supervised
 
 supabase = get_supabase()
 
@@ -24,6 +27,8 @@ class DynamicRedeemButton(ui.Button):
         self.product_path = product_path
         self.required_role = required_role
 
+    @rate_limited("command")
+    @query_budget(2, name="DynamicRedeemButton.callback")
     async def callback(self, interaction: Interaction):
         await interaction.response.defer(ephemeral=True)
 
@@ -40,9 +45,9 @@ class DynamicRedeemButton(ui.Button):
             )
 
         # Fetch redemption row for this role
-        resp = supabase.table("role_redeem")\
-            .select("*")\
+        resp = select("role_redeem", "redeemed, redeemed_by")\
             .eq("role_id", self.required_role)\
+            .limit(1)\
             .execute()
 
         if not resp.data:
@@ -125,8 +130,8 @@ class CodeRedeem(commands.Cog):
         self.refresh_dashboard.cancel()
 
     @tasks.loop(minutes=1)
+    @supervised("refresh_dashboard", interval=60, timeout=45, jitter=10)
     async def refresh_dashboard(self):
-        await self.bot.wait_until_ready()
         channel = self.bot.get_channel(REDEEM_CHANNEL_ID)
         if not channel:
             print("Redeem channel not found.")
@@ -151,6 +156,10 @@ class CodeRedeem(commands.Cog):
         except Exception as e:
             print(f"Failed to send dashboard: {e}")
 
+    @refresh_dashboard.before_loop
+    async def before_refresh_dashboard(self):
+        await self.bot.wait_until_ready()
+
     @app_commands.command(name="redeem-dashboard", description="Show your redeem dashboard.")
     async def user_dashboard(self, interaction: Interaction):
         embed = discord.Embed(
@@ -0,0 +1,390 @@
+import time
+import asyncio
+import discord
+from discord.ext import commands, tasks
+from discord import Interaction
+
+from utils import events, outbox, keypool, metrics, supervisor, leader
+from commands.admin import _is_any_staff, _is_admin_staff
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+EMBED_COLOR = 0x489BF3
+
+FLUSH_INTERVAL_SECONDS = 5
+MAX_MESSAGES_PER_FLUSH = 5     # log-channel posts per tick, across all channels (Discord allows ~5 per 5s per channel)
+EMBEDS_PER_MESSAGE = 10        # Discord limit
+MAX_EMBED_CHARS = 6000         # Discord limit for all embeds in one message
+
+OUTBOX_REPLAY_SECONDS = 3
+
+KEYPOOL_REFILL_SECONDS = 30
+KEYPOOL_RECLAIM_MINUTES = 30
+
+TASK_HISTORY_PRUNE_HOURS = 24
+OUTBOX_PRUNE_HOURS = 24
+EVENTS_PRUNE_HOURS = 24
+
+
+def _pack(batch: list[events.Event]) -> list[list[events.Event]]:
+    """Group consecutive events into messages that fit Discord's embed limits."""
+    messages, current, size = [], [], 0
+    for event in batch:
+        length = len(event.to_embed())
+        if current and (len(current) >= EMBEDS_PER_MESSAGE or size + length > MAX_EMBED_CHARS):
+            messages.append(current)
+            current, size = [], 0
+        current.append(event)
+        size += length
+    if current:
+        messages.append(current)
+    return messages
+
+
+class Ops(commands.Cog):
+    """Background plumbing (event journal, Supabase outbox, Luarmor key pool) and the staff views onto it."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.maintain_leadership.start()
+        self.flush_events.start()
+        self.replay_outbox.start()
+        self.refill_keypool.start()
+        self.reclaim_keypool.start()
+        self.prune_task_history.start()
+        self.prune_outbox.start()
+        self.prune_events.start()
+
+    def cog_unload(self):
+        self.maintain_leadership.cancel()
+        self.flush_events.cancel()
+        self.replay_outbox.cancel()
+        self.refill_keypool.cancel()
+        self.reclaim_keypool.cancel()
+        self.prune_task_history.cancel()
+        self.prune_outbox.cancel()
+        self.prune_events.cancel()
+
+    # -----------------------------
+    # BACKGROUND TASKS
+    # -----------------------------
+
+    @tasks.loop(seconds=leader.RENEW_SECONDS)
+    async def maintain_leadership(self):
+        # No before_loop: the first round should settle before the jobs waiting in leader.confirm()
+        changed = await leader.renew()
+        if changed is True:
+            # Adopt the pool keys the previous leader left behind
+            asyncio.create_task(self._adopt_keypool())
+        elif changed is False:
+            keypool.surrender()
+
+    async def _adopt_keypool(self):
+        try:
+            await keypool.reclaim()
+        except Exception as e:
+            print(f"[KEYPOOL RECLAIM ERROR] {e}")
+
+    @tasks.loop(seconds=FLUSH_INTERVAL_SECONDS)
+    async def flush_events(self):
+        try:
+            await self._flush_once()
+        except Exception as e:
+            print(f"[EVENTS FLUSH ERROR] {e}")
+
+    @flush_events.before_loop
+    async def before_flush_events(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(seconds=OUTBOX_REPLAY_SECONDS)
+    async def replay_outbox(self):
+        try:
+            result = await outbox.replay()
+            if result["sent"] or result["failed"]:
+                print(f"[OUTBOX] sent={result['sent']} failed={result['failed']}")
+        except Exception as e:
+            print(f"[OUTBOX REPLAY ERROR] {e}")
+
+    @tasks.loop(seconds=KEYPOOL_REFILL_SECONDS)
+    async def refill_keypool(self):
+        if not leader.is_leader():
+            return
+        try:
+            await keypool.refill()
+        except Exception as e:
+            print(f"[KEYPOOL REFILL ERROR] {e}")
+
+    @tasks.loop(minutes=KEYPOOL_RECLAIM_MINUTES)
+    async def reclaim_keypool(self):
+        if not leader.is_leader():
+            return
+        try:
+            await keypool.reclaim()
+        except Exception as e:
+            print(f"[KEYPOOL RECLAIM ERROR] {e}")
+
+    @tasks.loop(hours=TASK_HISTORY_PRUNE_HOURS)
+    async def prune_task_history(self):
+        try:
+            removed = supervisor.prune()
+            if removed:
+                print(f"[SUPERVISOR] Pruned {removed} old task run(s)")
+        except Exception as e:
+            print(f"[TASK HISTORY PRUNE ERROR] {e}")
+
+    @tasks.loop(hours=OUTBOX_PRUNE_HOURS)
+    async def prune_outbox(self):
+        try:
+            removed = outbox.prune()
+            if removed:
+                print(f"[OUTBOX] Pruned {removed} sent write(s)")
+        except Exception as e:
+            print(f"[OUTBOX PRUNE ERROR] {e}")
+
+    @tasks.loop(hours=EVENTS_PRUNE_HOURS)
+    async def prune_events(self):
+        try:
+            removed = events.prune()
+            if removed:
+                print(f"[EVENTS] Pruned {removed} old event(s)")
+        except Exception as e:
+            print(f"[EVENTS PRUNE ERROR] {e}")
+
+    async def _flush_once(self):
+        pending = events.unposted(limit=EMBEDS_PER_MESSAGE * MAX_MESSAGES_PER_FLUSH)
+        if not pending:
+            return
+
+        by_channel: dict[int, list[events.Event]] = {}
+        for event in pending:
+            by_channel.setdefault(event.channel_id, []).append(event)
+
+        sent = 0
+        for channel_id, batch in by_channel.items():
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                try:
+                    channel = await self.bot.fetch_channel(channel_id)
+                except (discord.NotFound, discord.Forbidden) as e:
+                    events.mark_posted([ev.id for ev in batch], error=f"channel unavailable: {e}")
+                    continue
+
+            for message in _pack(batch):
+                if sent >= MAX_MESSAGES_PER_FLUSH:
+                    return
+                ids = [ev.id for ev in message]
+                try:
+                    await channel.send(embeds=[ev.to_embed() for ev in message])
+                except (discord.Forbidden, discord.NotFound) as e:
+                    events.mark_posted(ids, error=str(e))
+                except discord.HTTPException as e:
+                    if e.status == 400:
+                        # Malformed embed - keep it in the journal but stop retrying
+                        events.mark_posted(ids, error=str(e))
+                    else:
+                        print(f"[EVENTS] Post to {channel_id} failed, will retry: {e}")
+                        return
+                else:
+                    events.mark_posted(ids)
+                sent += 1
+
+    # -----------------------------
+    # STAFF COMMANDS
+    # -----------------------------
+
+    @discord.app_commands.command(name="events", description="Search the bot's audit log")
+    @discord.app_commands.describe(
+        user="Events about (or performed by) this user",
+        kind="Event type, e.g. whitelist, blacklist, expiry",
+        hours="Only events from the last N hours",
+        limit="How many events to show (max 25)",
+        event_id="Show the full log embed for one event"
+    )
+    async def events_cmd(
+        self,
+        interaction: Interaction,
+        user: discord.User = None,
+        kind: str = None,
+        hours: int = None,
+        limit: int = 10,
+        event_id: int = None,
+    ):
+        if not _is_any_staff(interaction.user):
+            await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+            return
+
+        if event_id:
+            event = events.get(event_id)
+            if not event:
+                await interaction.response.send_message(f"No event `#{event_id}`.", ephemeral=True)
+                return
+            await interaction.response.send_message(embed=event.to_embed(), ephemeral=True)
+            return
+
+        since = time.time() - hours * 3600 if hours else None
+        found = events.query(
+            kind=kind.strip().lower() if kind else None,
+            discord_id=user.id if user else None,
+            since=since,
+            limit=max(1, min(limit, 25)),
+        )
+
+        embed = discord.Embed(title="Audit Log", color=discord.Color(EMBED_COLOR))
+        if not found:
+            embed.description = "No matching events."
+        else:
+            lines = []
+            for e in found:
+                title = e.embed.get("title", "")
+                who = f" <@{e.discord_id}>" if e.discord_id else ""
+                pending = " ⏳" if e.posted_at is None else ""
+                lines.append(f"`#{e.id}` <t:{int(e.created_at)}:R> **{e.kind}** {title}{who}{pending}")
+            embed.description = "\n".join(lines)[:4000]
+
+        backlog = events.backlog()
+        embed.set_footer(text=f"Types: {', '.join(events.kinds()) or 'none'} | Unposted: {backlog}")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @discord.app_commands.command(name="outbox", description="Show pending Supabase writes")
+    @discord.app_commands.describe(retry_dead="Re-queue writes that gave up after repeated failures")
+    async def outbox_cmd(self, interaction: Interaction, retry_dead: bool = False):
+        if not _is_admin_staff(interaction.user):
+            await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+            return
+
+        requeued = outbox.requeue_dead() if retry_dead else 0
+        counts = outbox.stats()
+
+        embed = discord.Embed(title="Supabase Outbox", color=discord.Color(EMBED_COLOR))
+        embed.add_field(name="Pending", value=str(counts.get("pending", 0)), inline=True)
+        embed.add_field(name="Sent", value=str(counts.get("sent", 0)), inline=True)
+        embed.add_field(name="Dead", value=str(counts.get("dead", 0)), inline=True)
+
+        head = outbox.pending(limit=1)
+        if head and head[0].last_error:
+            embed.add_field(
+                name="Blocked On",
+                value=f"`#{head[0].seq}` {head[0].dedup_key} ({head[0].attempts} tries)\n`{head[0].last_error[:200]}`",
+                inline=False
+            )
+        parked = outbox.dead(limit=5)
+        if parked:
+            embed.add_field(
+                name="Dead Writes",
+                value="\n".join(f"`#{e.seq}` {e.dedup_key}: `{(e.last_error or '')[:80]}`" for e in parked),
+                inline=False
+            )
+        if requeued:
+            embed.set_footer(text=f"Re-queued {requeued} dead write(s)")
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @discord.app_commands.command(name="metrics", description="Show bot performance counters")
+    async def metrics_cmd(self, interaction: Interaction):
+        if not _is_any_staff(interaction.user):
+            await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+            return
+
+        snap = metrics.snapshot()
+        embed = discord.Embed(title="Bot Metrics", color=discord.Color(EMBED_COLOR))
+
+        pool = keypool.stats()
+        hit_rate = metrics.ratio("keypool.hit", "keypool.miss")
+        embed.add_field(
+            name="Key Pool",
+            value=(
+                f"Ready: **{pool['ready']}** / target {keypool.target_size()}"
+                f" | Claimed: {pool['claimed']}\n"
+                f"Redeems/hour (24h): {keypool.redeem_rate_per_hour():.2f}\n"
+                f"Hit rate: {'n/a' if hit_rate is None else f'{hit_rate:.0%}'}"
+            ),
+            inline=False
+        )
+
+        ticket_rate = metrics.ratio("tickets.pool_hit", "tickets.pool_miss")
+        embed.add_field(
+            name="Ticket Pool",
+            value=f"Hit rate: {'n/a' if ticket_rate is None else f'{ticket_rate:.0%}'}",
+            inline=False
+        )
+
+        rejected = {
+            name.removeprefix("admission.rejected."): value
+            for name, value in snap["counters"].items() if name.startswith("admission.rejected.")
+        }
+        embed.add_field(
+            name="Admission Rejections",
+            value=", ".join(f"{reason}: {n}" for reason, n in sorted(rejected.items())) or "none",
+            inline=False
+        )
+
+        if snap["timers"]:
+            embed.add_field(
+                name="Latency (ms)",
+                value="\n".join(
+                    f"`{name}` n={t['count']} p50={t['p50']:.0f} p95={t['p95']:.0f} max={t['max']:.0f}"
+                    for name, t in sorted(snap["timers"].items())
+                )[:1024],
+                inline=False
+            )
+        if snap["counters"]:
+            embed.add_field(
+                name="Counters",
+                value="\n".join(f"`{name}` {value}" for name, value in sorted(snap["counters"].items()))[:1024],
+                inline=False
+            )
+        embed.set_footer(text=f"Since restart ({snap['uptime'] / 3600:.1f}h ago)")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @discord.app_commands.command(name="taskhistory", description="Show recent background task runs")
+    @discord.app_commands.describe(task="Only this task (e.g. renewal_reminder); leave empty for an overview")
+    async def taskhistory(self, interaction: Interaction, task: str | None = None):
+        if not _is_any_staff(interaction.user):
+            await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+            return
+
+        if task is None:
+            embed = discord.Embed(title="Background Tasks (24h)", color=discord.Color(EMBED_COLOR))
+            for row in supervisor.summary():
+                avg = row["avg_duration"]
+                embed.add_field(
+                    name=row["task"],
+                    value=(
+                        f"Last: <t:{int(row['last_started'])}:R> ({row['last_status']})\n"
+                        f"Runs: {row['runs']} | Failed: {row['failures']} | Items: {row['items']}\n"
+                        f"Avg: {'n/a' if avg is None else f'{avg:.1f}s'}"
+                    ),
+                    inline=True
+                )
+            if not embed.fields:
+                embed.description = "No runs recorded yet."
+            lease = await leader.status()
+            role = "leader" if lease["leader"] else "standby"
+            embed.set_footer(text=f"This replica: {lease['instance']} ({role}) | Lease holder: {lease['holder'] or 'none'}")
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        runs = supervisor.recent(task)
+        if not runs:
+            known = ", ".join(f"`{t}`" for t in supervisor.task_names()) or "none"
+            await interaction.response.send_message(f"No runs for `{task}`. Known tasks: {known}", ephemeral=True)
+            return
+
+        lines = []
+        for r in runs:
+            line = f"<t:{int(r['started_at'])}:f> **{r['status']}** {r['duration']:.1f}s"
+            if r["items"] is not None:
+                line += f" • {r['items']} item(s)"
+            if r["caught_up"]:
+                line += f" • caught up {r['caught_up'] / 3600:.1f}h"
+            if r["error"]:
+                line += f"\n  `{r['error'][:150]}`"
+            lines.append(line)
+        embed = discord.Embed(title=f"Task History: {task}", description="\n".join(lines)[:4096], color=discord.Color(EMBED_COLOR))
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Ops(bot))
+    print("✅ Loaded cog: ops")
@@ -0,0 +1,116 @@
+import io
+import discord
+from discord.ext import commands, tasks
+from discord import Interaction
+
+from utils.reconcile import build_plan, apply_plan, format_plan
+from utils import events
+from utils.supervisor import supervised
+from commands.admin import _is_admin_staff
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+GUILD_ID = 1345153296360542271
+LOG_CHANNEL_ID = 1449252986911068273
+
+RECONCILE_INTERVAL_MINUTES = 60
+
+
+def _plan_embed(plan, title: str, color: discord.Color) -> discord.Embed:
+    embed = discord.Embed(title=title, color=color)
+    embed.add_field(name="Users Checked", value=str(plan.checked), inline=True)
+    embed.add_field(name="Corrections", value=str(len(plan.corrections)), inline=True)
+    embed.add_field(name="Needs Review", value=str(len(plan.issues)), inline=True)
+
+    lines = format_plan(plan)
+    if lines:
+        embed.add_field(name="Change Plan", value="\n".join(lines)[:1024], inline=False)
+    return embed
+
+
+def _issues_file(plan) -> discord.File | None:
+    if not plan.issues:
+        return None
+    body = "discord_id,kind,detail\n" + "".join(
+        f"{i.discord_id},{i.kind},{i.detail}\n" for i in plan.issues
+    )
+    return discord.File(io.BytesIO(body.encode("utf-8")), filename="reconcile-review.csv")
+
+
+class Reconcile(commands.Cog):
+    """Keeps role_redeem.expires_at and Luarmor auth_expire in step."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.reconcile_task.start()
+
+    def cog_unload(self):
+        self.reconcile_task.cancel()
+
+    async def _run(self, dry_run: bool, full: bool):
+        plan = await build_plan(full=full)
+        results = [] if dry_run else await apply_plan(plan)
+        return plan, results
+
+    @tasks.loop(minutes=RECONCILE_INTERVAL_MINUTES)
+    @supervised("reconcile", interval=RECONCILE_INTERVAL_MINUTES * 60, timeout=900)
+    async def reconcile_task(self):
+        """Incremental pass: only users changed since the last watermark."""
+        plan, results = await self._run(dry_run=False, full=False)
+        failed = sum(1 for r in results if not r.ok)
+        print(f"[RECONCILE] checked={plan.checked} corrected={len(results) - failed} "
+              f"failed={failed} review={len(plan.issues)}")
+
+        if not plan.corrections and not plan.issues:
+            return 0
+        guild = self.bot.get_guild(GUILD_ID)
+        log_channel = guild.get_channel(LOG_CHANNEL_ID) if guild else None
+        if log_channel:
+            embed = _plan_embed(plan, "Whitelist Drift Corrected", discord.Color.blue())
+            if failed:
+                embed.add_field(name="Failed", value=str(failed), inline=True)
+            file = _issues_file(plan)
+            await log_channel.send(embed=embed, **({"file": file} if file else {}))
+            events.record("reconcile", embed, post=False)
+        return len(results) - failed
+
+    @reconcile_task.before_loop
+    async def before_reconcile_task(self):
+        await self.bot.wait_until_ready()
+
+    @discord.app_commands.command(name="reconcile", description="Compare DB expiries with Luarmor and fix drift")
+    @discord.app_commands.describe(
+        dry_run="Only show the change plan (default: on)",
+        full="Check every user instead of only those changed since the last run"
+    )
+    async def reconcile(self, interaction: Interaction, dry_run: bool = True, full: bool = False):
+        if not _is_admin_staff(interaction.user):
+            await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        plan, results = await self._run(dry_run=dry_run, full=full)
+
+        if dry_run:
+            embed = _plan_embed(plan, "Reconcile - Dry Run", discord.Color.orange())
+            embed.set_footer(text="Nothing was changed. Run with dry_run:False to apply.")
+        else:
+            failed = sum(1 for r in results if not r.ok)
+            embed = _plan_embed(plan, "Reconcile - Applied", discord.Color.green())
+            if failed:
+                embed.add_field(name="Failed", value=str(failed), inline=True)
+
+        file = _issues_file(plan)
+        await interaction.followup.send(embed=embed, ephemeral=True, **({"file": file} if file else {}))
+
+        if not dry_run:
+            log_embed = _plan_embed(plan, "Whitelist Drift Corrected", discord.Color.blue())
+            log_embed.add_field(name="Staff", value=f"{interaction.user.mention}", inline=True)
+            events.record("reconcile", log_embed, actor_id=interaction.user.id)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Reconcile(bot))
+    print("✅ Loaded cog: reconcile")
@@ -0,0 +1,140 @@
+import io
+import discord
+from discord.ext import commands, tasks
+from discord import Interaction
+
+from utils.refunds import build_plan, apply_plan, format_plan
+from utils.bulk import results_to_csv
+from utils import events, leader
+from utils.supervisor import supervised, task_lock
+from commands.admin import _is_admin_staff
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+GUILD_ID = 1345153296360542271
+LOG_CHANNEL_ID = 1449252986911068273
+ACCESS_ROLE_ID = 1444450052323147826
+
+SWEEP_INTERVAL_MINUTES = 30
+
+
+def _plan_embed(plan, title: str, color: discord.Color) -> discord.Embed:
+    embed = discord.Embed(title=title, color=color)
+    embed.add_field(name="Invoices Read", value=str(plan.scanned), inline=True)
+    embed.add_field(name="Refunded/Cancelled", value=str(len(plan.flagged_invoices)), inline=True)
+    embed.add_field(name="Users to Revoke", value=str(len(plan.revocations)), inline=True)
+    if plan.retried:
+        embed.add_field(name="Retried", value=f"{plan.retried} invoice(s) from earlier failures", inline=False)
+
+    lines = format_plan(plan)
+    if lines:
+        embed.add_field(name="Revocations", value="\n".join(lines)[:1024], inline=False)
+    if not plan.complete:
+        embed.add_field(name="Note", value="Delta not fully read - the rest is picked up next sweep.", inline=False)
+    return embed
+
+
+def _results_file(results) -> discord.File | None:
+    if not results:
+        return None
+    return discord.File(
+        io.BytesIO(results_to_csv(results, ["discord_id", "invoices"])), filename="refund-sweep-results.csv"
+    )
+
+
+class Refunds(commands.Cog):
+    """Revokes access for invoices SellAuth has since marked refunded or cancelled."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.refund_sweep.start()
+
+    def cog_unload(self):
+        self.refund_sweep.cancel()
+
+    async def _run(self, dry_run: bool):
+        plan = await build_plan(dry_run=dry_run)
+        results = [] if dry_run else await apply_plan(plan, self.bot.get_guild(GUILD_ID), ACCESS_ROLE_ID)
+        return plan, results
+
+    @tasks.loop(minutes=SWEEP_INTERVAL_MINUTES)
+    @supervised("refund_sweep", interval=SWEEP_INTERVAL_MINUTES * 60, timeout=900)
+    async def refund_sweep(self):
+        """Incremental pass: only invoices updated since the last watermark."""
+        plan, results = await self._run(dry_run=False)
+        failed = sum(1 for r in results if not r.ok)
+        print(f"[REFUNDS] read={plan.scanned} flagged={len(plan.flagged_invoices)} "
+              f"revoked={len(results) - failed} failed={failed}")
+
+        if not results:
+            return 0
+        guild = self.bot.get_guild(GUILD_ID)
+        log_channel = guild.get_channel(LOG_CHANNEL_ID) if guild else None
+        embed = _plan_embed(plan, "Refunded Orders Revoked", discord.Color.red())
+        if failed:
+            embed.add_field(name="Failed", value=str(failed), inline=True)
+        if log_channel:
+            await log_channel.send(embed=embed, file=_results_file(results))
+        for rev in plan.revocations:
+            user_embed = discord.Embed(title="Access Revoked (Refund)", color=discord.Color.red())
+            user_embed.add_field(name="User", value=f"<@{rev.discord_id}> (`{rev.discord_id}`)", inline=False)
+            user_embed.add_field(
+                name="Invoices", value="\n".join(f"`{i}` - {r}" for i, r in rev.reasons.items())[:1024], inline=False
+            )
+            if rev.keep_access:
+                user_embed.set_footer(text="Row flagged only - another active purchase still covers this user")
+            events.record("refund_revoke", user_embed, discord_id=rev.discord_id, post=False)
+        return len(results) - failed
+
+    @refund_sweep.before_loop
+    async def before_refund_sweep(self):
+        await self.bot.wait_until_ready()
+
+    @discord.app_commands.command(name="refundsweep", description="Revoke access for refunded or cancelled SellAuth orders")
+    @discord.app_commands.describe(dry_run="Only show who would lose access (default: on)")
+    async def refundsweep(self, interaction: Interaction, dry_run: bool = True):
+        if not _is_admin_staff(interaction.user):
+            await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        if dry_run:
+            plan, results = await self._run(dry_run=True)
+        else:
+            # Same gate and lock as the scheduled sweep, so the two never revoke side by side
+            if not leader.is_leader():
+                await interaction.followup.send(
+                    "This replica isn't the leader - the sweep only applies on the leader. Try again shortly.",
+                    ephemeral=True,
+                )
+                return
+            lock = task_lock("refund_sweep")
+            if lock.locked():
+                await interaction.followup.send("A refund sweep is already running. Try again shortly.", ephemeral=True)
+                return
+            async with lock:
+                plan, results = await self._run(dry_run=False)
+
+        if dry_run:
+            embed = _plan_embed(plan, "Refund Sweep - Dry Run", discord.Color.orange())
+            embed.set_footer(text="Nothing was changed. Run with dry_run:False to apply.")
+        else:
+            failed = sum(1 for r in results if not r.ok)
+            embed = _plan_embed(plan, "Refund Sweep - Applied", discord.Color.green())
+            if failed:
+                embed.add_field(name="Failed", value=str(failed), inline=True)
+
+        file = _results_file(results)
+        await interaction.followup.send(embed=embed, ephemeral=True, **({"file": file} if file else {}))
+
+        if results:
+            log_embed = _plan_embed(plan, "Refunded Orders Revoked", discord.Color.red())
+            log_embed.add_field(name="Staff", value=f"{interaction.user.mention}", inline=True)
+            events.record("refund_revoke", log_embed, actor_id=interaction.user.id)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Refunds(bot))
+    print("✅ Loaded cog: refunds")
@@ -0,0 +1,396 @@
+import asyncio
+import time
+import secrets
+import discord
+from discord.ext import commands, tasks
+from discord import ui, Interaction
+from datetime import datetime, timezone, timedelta
+
+from utils.supabase import get_supabase
+from utils.members import get_or_fetch_member
+from utils.roblox import roblox, GAMEPASSES
+from utils.plans import plan_for_days
+from utils import events, keypool, leader
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+GUILD_ID = 1345153296360542271
+LOG_CHANNEL_ID = 1449252986911068273
+ACCESS_ROLE_ID = 1444450052323147826
+SCRIPT_CHANNEL_ID = 1444457969407496352
+
+EMBED_COLOR = 0x489BF3
+BOT_LOGO_URL = "https://cdn.discordapp.com/attachments/1449252986911068273/1449511913317732485/ScriptUnionIcon.png"
+
+POLL_INTERVAL_SECONDS = 15
+POLL_CONCURRENCY = 5          # Roblox users checked at once
+BACKOFF_BASE_SECONDS = 15     # first re-check delay after "not owned yet"
+BACKOFF_MAX_SECONDS = 300
+PENDING_EXPIRY_HOURS = 48     # stop polling after this long
+VERIFY_CODE_PREFIX = "SU-"    # ownership code the buyer adds to their Roblox profile
+
+supabase = get_supabase()
+
+# Set by the cog so the modal can trigger an immediate check
+_poller: "Robux | None" = None
+
+
+def _gamepass_product_name(gamepass_id: int) -> str:
+    return f"Script Union - Fix it up ({GAMEPASSES[gamepass_id]['name']})"
+
+
+def _new_verify_code() -> str:
+    return VERIFY_CODE_PREFIX + secrets.token_hex(3).upper()
+
+
+# -----------------------------
+# MODAL
+# -----------------------------
+class RobuxUsernameModal(ui.Modal, title="Roblox Username"):
+    roblox_username = ui.TextInput(
+        label="Roblox Username",
+        placeholder="The account you bought the gamepass with",
+        required=True,
+        max_length=32,
+    )
+
+    def __init__(self, channel: discord.TextChannel, ticket_id: int | None):
+        super().__init__()
+        self.channel = channel
+        self.ticket_id = ticket_id
+
+    async def on_submit(self, interaction: Interaction):
+        username = self.roblox_username.value.strip()
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        roblox_user_id = await roblox.get_user_id(username)
+        if not roblox_user_id:
+            await interaction.followup.send(
+                f"Could not find Roblox user `{username}`. Check the spelling and try again.",
+                ephemeral=True
+            )
+            return
+
+        verify_code = _new_verify_code()
+        row = {
+            "discord_id": int(interaction.user.id),
+            "channel_id": int(self.channel.id),
+            "ticket_id": self.ticket_id,
+            "roblox_username": username,
+            "roblox_user_id": roblox_user_id,
+            "verify_code": verify_code,
+            "status": "pending",
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+        try:
+            existing = supabase.table("robux_pending").select("id").eq(
+                "channel_id", int(self.channel.id)
+            ).eq("status", "pending").limit(1).execute()
+
+            if existing.data:
+                row_id = existing.data[0]["id"]
+                supabase.table("robux_pending").update(row).eq("id", row_id).execute()
+            else:
+                ins = supabase.table("robux_pending").insert(row).execute()
+                row_id = ins.data[0]["id"] if ins.data else None
+        except Exception as e:
+            print(f"[ROBUX] Failed to save pending purchase: {e}")
+            await interaction.followup.send("Something went wrong. A staff member will help you.", ephemeral=True)
+            return
+
+        # Anyone could name an account that bought a pass; the profile code proves it's theirs
+        embed = discord.Embed(
+            title="Verify Your Roblox Account",
+            description=(
+                f"Add this code anywhere in the **About** section of `{username}`'s Roblox profile:\n\n"
+                f"**`{verify_code}`**\n\n"
+                "Access is granted automatically once Roblox shows both the gamepass purchase and the code. "
+                "You can remove the code afterwards."
+            ),
+            color=discord.Color(EMBED_COLOR)
+        )
+        try:
+            await self.channel.send(content=interaction.user.mention, embed=embed)
+        except Exception:
+            pass
+        await interaction.followup.send(
+            f"Got it! Watching `{username}` - the verification code is posted in this ticket.", ephemeral=True
+        )
+
+        if _poller and row_id:
+            _poller.check_soon(row_id)
+
+
+# -----------------------------
+# COG
+# -----------------------------
+class Robux(commands.Cog):
+    """Polls Roblox for pending gamepass purchases and fulfils them without staff."""
+
+    def __init__(self, bot: commands.Bot):
+        global _poller
+        self.bot = bot
+        self._semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+        # row_id -> (monotonic due time, attempts)
+        self._schedule: dict[int, tuple[float, int]] = {}
+        self._in_flight: set[int] = set()
+        self._code_reminded: set[int] = set()
+        _poller = self
+        self.poll_pending.start()
+
+    def cog_unload(self):
+        global _poller
+        self.poll_pending.cancel()
+        _poller = None
+
+    def check_soon(self, row_id: int) -> None:
+        """Reset backoff for a row and poll it now (leader only; a new row is due on the leader's next poll anyway)."""
+        if not leader.is_leader():
+            return
+        self._schedule[row_id] = (0.0, 0)
+        asyncio.create_task(self._poll_once())
+
+    def _backoff(self, row_id: int) -> None:
+        _, attempts = self._schedule.get(row_id, (0.0, 0))
+        delay = min(BACKOFF_BASE_SECONDS * (2 ** attempts), BACKOFF_MAX_SECONDS)
+        self._schedule[row_id] = (time.monotonic() + delay, attempts + 1)
+
+    @tasks.loop(seconds=POLL_INTERVAL_SECONDS)
+    async def poll_pending(self):
+        if not leader.is_leader():
+            return
+        try:
+            await self._poll_once()
+        except Exception as e:
+            print(f"[ROBUX POLL ERROR] {e}")
+
+    @poll_pending.before_loop
+    async def before_poll_pending(self):
+        await self.bot.wait_until_ready()
+
+    async def _poll_once(self):
+        guild = self.bot.get_guild(GUILD_ID)
+        if not guild:
+            return
+
+        pending = supabase.table("robux_pending").select(
+            "id, discord_id, channel_id, roblox_username, roblox_user_id, verify_code, created_at"
+        ).eq("status", "pending").execute()
+
+        now = time.monotonic()
+        expire_before = datetime.now(timezone.utc) - timedelta(hours=PENDING_EXPIRY_HOURS)
+        due = []
+
+        for row in pending.data or []:
+            row_id = row["id"]
+            if row_id in self._in_flight:
+                continue
+
+            channel = guild.get_channel(int(row["channel_id"]))
+            if not isinstance(channel, discord.TextChannel):
+                # Ticket closed before the purchase showed up
+                self._set_status(row_id, "cancelled")
+                continue
+
+            try:
+                created = datetime.fromisoformat(row["created_at"].replace("Z", "+00:00"))
+            except Exception:
+                created = None
+            if created and created < expire_before:
+                self._set_status(row_id, "expired")
+                try:
+                    await channel.send(
+                        "We stopped watching for your gamepass purchase. A staff member will verify it manually."
+                    )
+                except Exception:
+                    pass
+                continue
+
+            due_at, _ = self._schedule.get(row_id, (0.0, 0))
+            if due_at <= now:
+                due.append((row, channel))
+
+        if due:
+            await asyncio.gather(*(self._check_row(guild, row, channel) for row, channel in due))
+
+    def _set_status(self, row_id: int, status: str) -> None:
+        self._schedule.pop(row_id, None)
+        try:
+            supabase.table("robux_pending").update({"status": status}).eq("id", row_id).execute()
+        except Exception as e:
+            print(f"[ROBUX] Failed to mark {row_id} {status}: {e}")
+
+    def _release(self, row_id: int, discord_id: int, redemption_id: int | None) -> None:
+        """Undo a failed fulfilment: drop its redemption record and hand the row back to the poller."""
+        try:
+            if redemption_id is not None:
+                supabase.table("gamepass_redemptions").delete().eq("id", redemption_id).execute()
+            supabase.table("robux_pending").update({"status": "pending"}).eq("id", row_id).execute()
+        except Exception as e:
+            # Left claimed with nothing granted - staff have to finish it by hand
+            print(f"[ROBUX] Could not roll back pending {row_id}: {e}")
+            embed = discord.Embed(title="Gamepass Fulfilment Stuck", color=discord.Color.red())
+            embed.add_field(name="User", value=f"<@{discord_id}> (`{discord_id}`)", inline=True)
+            embed.add_field(name="Pending Row", value=f"`{row_id}`", inline=True)
+            embed.add_field(name="Error", value=f"`{str(e)[:200]}`", inline=False)
+            events.record("gamepass_failed", embed, discord_id=discord_id)
+        self._backoff(row_id)
+
+    async def _check_row(self, guild: discord.Guild, row: dict, channel: discord.TextChannel):
+        row_id = row["id"]
+        self._in_flight.add(row_id)
+        try:
+            async with self._semaphore:
+                owned = await roblox.owned_gamepasses(int(row["roblox_user_id"]))
+
+            owned_ids = [gp for gp, ok in owned.items() if ok]
+            if not owned_ids:
+                self._backoff(row_id)
+                return
+
+            redeemed = supabase.table("gamepass_redemptions").select("gamepass_id").eq(
+                "roblox_user_id", int(row["roblox_user_id"])
+            ).execute()
+            already = {r.get("gamepass_id") for r in (redeemed.data or [])}
+            new_ids = [gp for gp in owned_ids if gp not in already]
+            if not new_ids:
+                self._backoff(row_id)
+                return
+
+            if not await self._owns_account(row, channel):
+                self._backoff(row_id)
+                return
+
+            # If several unredeemed passes are owned, grant the most valuable one
+            gamepass_id = max(new_ids, key=lambda gp: GAMEPASSES[gp]["price"])
+            await self._fulfil(guild, row, channel, gamepass_id)
+        except Exception as e:
+            print(f"[ROBUX] Check failed for pending {row_id}: {e}")
+            self._backoff(row_id)
+        finally:
+            self._in_flight.discard(row_id)
+
+    async def _owns_account(self, row: dict, channel: discord.TextChannel) -> bool:
+        """True once the row's verification code shows up in the Roblox profile."""
+        code = row.get("verify_code")
+        if not code:
+            return False  # rows from before verification codes: left for staff
+        description = await roblox.get_description(int(row["roblox_user_id"]))
+        if description is None:
+            return False
+        if code.upper() in description.upper():
+            return True
+        if row["id"] not in self._code_reminded:
+            self._code_reminded.add(row["id"])
+            try:
+                await channel.send(
+                    f"<@{row['discord_id']}> We can see the gamepass on `{row['roblox_username']}`, but not the "
+                    f"verification code. Add **`{code}`** to the profile's About section and it'll go through."
+                )
+            except Exception:
+                pass
+        return False
+
+    async def _fulfil(self, guild: discord.Guild, row: dict, channel: discord.TextChannel, gamepass_id: int):
+        row_id = row["id"]
+        discord_id = int(row["discord_id"])
+        roblox_username = row["roblox_username"]
+        roblox_user_id = int(row["roblox_user_id"])
+        gamepass_info = GAMEPASSES[gamepass_id]
+
+        # Claim the row so a second poll/replica can't fulfil it twice
+        claimed = supabase.table("robux_pending").update({
+            "status": "fulfilled",
+            "gamepass_id": gamepass_id,
+            "fulfilled_at": datetime.now(timezone.utc).isoformat(),
+        }).eq("id", row_id).eq("status", "pending").execute()
+        if not claimed.data:
+            return
+
+        # Record the redemption before granting: if the grant then fails it is rolled
+        # back, but a live grant never exists without a record blocking a second redeem
+        redemption_id = None
+        try:
+            ins = supabase.table("gamepass_redemptions").insert({
+                "discord_id": discord_id,
+                "roblox_username": roblox_username,
+                "roblox_user_id": roblox_user_id,
+                "gamepass_id": gamepass_id,
+                "product_type": gamepass_info["name"],
+                "verified_by": int(self.bot.user.id),
+            }).execute()
+            redemption_id = ins.data[0]["id"] if ins.data else None
+
+            luarmor_result = await keypool.provision(
+                discord_id,
+                _gamepass_product_name(gamepass_id),
+                note=f"Robux gamepass {gamepass_id} | Roblox: {roblox_username}",
+                expiry=plan_for_days(gamepass_info["days"] or 0).expiry(),
+            )
+            if not luarmor_result or luarmor_result.get("error"):
+                raise RuntimeError(f"Luarmor whitelist failed: {(luarmor_result or {}).get('error', 'no response')}")
+        except Exception as e:
+            self._release(row_id, discord_id, redemption_id)
+            print(f"[ROBUX] Fulfilling {row_id} for {discord_id} failed, will retry: {e}")
+            return
+
+        self._schedule.pop(row_id, None)
+        self._code_reminded.discard(row_id)
+
+        member = await get_or_fetch_member(guild, discord_id)
+        role = guild.get_role(ACCESS_ROLE_ID)
+        if member and role and role not in member.roles:
+            try:
+                await member.add_roles(role, reason=f"Robux gamepass {gamepass_id} auto-verified")
+            except Exception as e:
+                print(f"[ROBUX] Could not add role to {discord_id}: {e}")
+
+        if gamepass_info["days"]:
+            expiry_ts = int((datetime.now(timezone.utc) + timedelta(days=gamepass_info["days"])).timestamp())
+            expiry_text = f"<t:{expiry_ts}:F>"
+        else:
+            expiry_text = "Lifetime"
+
+        embed = discord.Embed(
+            title="Gamepass Verified - You're all set!",
+            description=(
+                f"Your **{gamepass_info['name']}** gamepass purchase was detected.\n\n"
+                f"Head to <#{SCRIPT_CHANNEL_ID}> and press **Get Script** to get started."
+            ),
+            color=discord.Color.green()
+        )
+        embed.add_field(name="Roblox User", value=f"`{roblox_username}`", inline=True)
+        embed.add_field(name="Expires", value=expiry_text, inline=True)
+        try:
+            await channel.send(content=f"<@{discord_id}>", embed=embed)
+        except Exception:
+            pass
+
+        log_embed = discord.Embed(title="Gamepass Purchase Auto-Verified", color=discord.Color.green())
+        log_embed.add_field(name="User", value=f"<@{discord_id}> (`{discord_id}`)", inline=True)
+        log_embed.add_field(name="Roblox", value=f"`{roblox_username}` (`{roblox_user_id}`)", inline=True)
+        log_embed.add_field(name="Product", value=gamepass_info["name"], inline=True)
+        log_embed.add_field(name="Ticket", value=channel.mention, inline=True)
+        events.record("gamepass", log_embed, discord_id=discord_id)
+
+        if member:
+            try:
+                dm_embed = discord.Embed(
+                    title="You've Been Whitelisted!",
+                    description=(
+                        f"Your **{gamepass_info['name']}** gamepass purchase has been verified.\n\n"
+                        f"Go to <#{SCRIPT_CHANNEL_ID}> and press **Get Script** to get started!"
+                    ),
+                    color=discord.Color.green()
+                )
+                dm_embed.set_thumbnail(url=BOT_LOGO_URL)
+                await member.send(embed=dm_embed)
+            except Exception:
+                pass
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Robux(bot))
+    print("✅ Loaded cog: robux")
@@ -2,6 +2,8 @@ import discord
 from discord.ext import commands
 from discord import app_commands, Interaction
 from utils.supabase import get_supabase
+from utils.queries import select, query_budget
+from utils.admission import rate_limited
 
 GUILD_ID = 1432550511495610472
 EXTRA_ROLE_ID = 1438358929187934310
@@ -14,13 +16,15 @@ class RoleRedeem(commands.Cog):
 
     @app_commands.command(name="role-redeem", description="Redeem a code to receive a role.")
     @app_commands.describe(code="Enter the redemption code")
+    @rate_limited("command")
+    @query_budget(2)
     async def role_redeem(self, interaction: Interaction, code: str):
 
         guild = self.bot.get_guild(GUILD_ID)
         if not guild:
             return await interaction.response.send_message("Guild not found.", ephemeral=True)
 
-        response = supabase.table("role_redeem").select("*").eq("code", code).execute()
+        response = select("role_redeem", "discord_id, role_id").eq("code", code).limit(1).execute()
 
         if not response.data:
             return await interaction.response.send_message("❌ Invalid or already used code.", ephemeral=True)
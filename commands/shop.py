@@ -1,14 +1,15 @@
-import os
 import discord
 from discord.ext import commands, tasks
 from discord import ui, Interaction
-import aiohttp
-from aiohttp import ClientTimeout
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 
 from utils.supabase import get_supabase
+from utils import history, events, outbox, sellauth, keypool, admission, leader, claims
+from utils.members import get_or_fetch_member, cache_member, member_resolver
 from commands.tickets import create_or_get_ticket_channel, CloseTicketView
-from utils.luarmor import create_or_update_user, compute_expiry_timestamp, get_user_info, add_time_to_user
+from utils.luarmor import get_user_info, add_time_to_user, assign_key, delete_user, expires_at_from
+from utils.plans import order_expiry, should_whitelist_product, UnknownPlanError
+from utils.queries import select
 
 # -----------------------------
 # CONFIG
@@ -24,71 +25,38 @@ BOT_LOGO_URL = "https://cdn.discordapp.com/attachments/1449252986911068273/14495
 
 EMBED_COLOR = 0x489BF3
 
-SELLAUTH_API_KEY = (os.getenv("SELLAUTH_API_KEY") or "").strip()
-SELLAUTH_SHOP_ID = (os.getenv("SELLAUTH_SHOP_ID") or "").strip()
-
-WHITELIST_PRODUCTS = ["fix it up", "fix-it-up", "fixitup"]
-
 supabase = get_supabase()
 
+# Invoice IDs being redeemed right now (claimed before the "already redeemed?" checks, released after the outbox write)
+_redeeming: set[str] = set()
+
 # -----------------------------
-# SELLAUTH HELPERS
+# HELPERS
 # -----------------------------
-async def fetch_invoice(invoice_id: str) -> dict | None:
-    if not SELLAUTH_API_KEY or not SELLAUTH_SHOP_ID:
-        return None
-
-    url = f"https://api.sellauth.com/v1/shops/{SELLAUTH_SHOP_ID}/invoices/{invoice_id}"
-    headers = {"Authorization": f"Bearer {SELLAUTH_API_KEY}"}
-
-    timeout = ClientTimeout(total=8)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status != 200:
-                return None
-            return await resp.json()
-
-
-def invoice_is_paid(invoice: dict) -> bool:
-    status = (invoice.get("status") or "").lower()
-    refunded = bool(invoice.get("refunded", False))
-    cancelled = bool(invoice.get("cancelled", False))
-    return status in {"completed", "paid"} and not refunded and not cancelled
-
-
-def extract_product_and_variant(invoice: dict) -> tuple[str, str]:
-    items = invoice.get("items")
-    if isinstance(items, list) and items:
-        item = items[0]
-        product = item.get("product", {}) or {}
-        variant = item.get("variant", {}) or {}
-
-        product_name = (product.get("name") or "Unknown").strip()
-        variant_name = (variant.get("name") or product_name).strip()
-        return product_name, variant_name
-
-    return "Unknown", "Standard"
-
-
-def compute_expires_at_from_variant(variant_name: str) -> str | None:
-    """Returns ISO string or None for lifetime."""
-    v = (variant_name or "").lower()
-    now = datetime.now(timezone.utc)
-
-    if "week" in v:
-        return (now + timedelta(days=7)).isoformat()
-    if "month" in v:
-        return (now + timedelta(days=30)).isoformat()
-    if "year" in v:
-        return (now + timedelta(days=365)).isoformat()
-
-    return None
-
-
-def should_whitelist_product(product_name: str, variant_name: str) -> bool:
-    """Check if this product should be whitelisted on Luarmor."""
-    combined = f"{product_name} {variant_name}".lower()
-    return any(p in combined for p in WHITELIST_PRODUCTS)
+async def grant_luarmor(member_id: int, invoice_id: str, product_name: str, variant_name: str, expiry):
+    """
+    Attach the key pre-created by the webhook receiver if there is one, otherwise
+    provision through the key pool. Returns keypool.provision's dict or None.
+    """
+    note = f"{product_name} | {variant_name} | Invoice: {invoice_id}"
+    entry = sellauth.indexed_invoice(invoice_id)
+    prekey = entry.get("prekey") if entry else None
+
+    if prekey:
+        sellauth.set_prekey(invoice_id, None)
+        if await assign_key(prekey, member_id, auth_expire=expiry.auth_expire, note=note):
+            print(f"[LUARMOR] Assigned pre-created key for invoice {invoice_id} to {member_id}")
+            return {"user_key": prekey, "expires_at": expires_at_from(expiry.auth_expire)}
+        # Usually the member already has a key - extend that one and drop the spare
+        print(f"[LUARMOR] Pre-created key for {invoice_id} not assignable, falling back")
+        await delete_user(prekey)
+
+    return await keypool.provision(
+        discord_id=member_id,
+        plan_name=variant_name,
+        note=note,
+        expiry=expiry,
+    )
 
 # -----------------------------
 # MODAL
@@ -115,15 +83,51 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
     async def on_submit(self, interaction: Interaction):
         invoice_id = self.order_id.value.strip()
         ref_code = self.referral_code.value.strip().upper() if self.referral_code.value else None
+
+        # Admission control: nothing below this costs a Supabase/SellAuth call if we say no here
+        wait = admission.check_rate("redeem", interaction.user.id)
+        if wait:
+            await interaction.response.send_message(
+                f"You're submitting orders too fast. Try again in {int(wait) + 1}s.", ephemeral=True
+            )
+            return
+        if not admission.valid_invoice_id(invoice_id):
+            await interaction.response.send_message(
+                "That doesn't look like a SellAuth order ID. Copy it from your order confirmation email.",
+                ephemeral=True
+            )
+            return
+        if admission.recently_missing(invoice_id):
+            await interaction.response.send_message(
+                "Order not found. Please check your invoice ID and try again.", ephemeral=True
+            )
+            return
+
         await interaction.response.defer(ephemeral=True, thinking=True)
+        claimed = False
 
         try:
+            # Claim before the "already redeemed?" checks: a second submit of the same
+            # invoice must not get past them while this one is still granting
+            if invoice_id in _redeeming:
+                await interaction.followup.send("This order is already being redeemed.", ephemeral=True)
+                return
+            _redeeming.add(invoice_id)
+            claimed = True
+
             guild = interaction.guild
             if not guild:
                 await interaction.followup.send("This must be used in the server.", ephemeral=True)
                 return
 
-            member = guild.get_member(interaction.user.id) or await guild.fetch_member(interaction.user.id)
+            if isinstance(interaction.user, discord.Member):
+                member = interaction.user
+                cache_member(member)
+            else:
+                member = await get_or_fetch_member(guild, interaction.user.id)
+            if member is None:
+                await interaction.followup.send("Could not find you in the server.", ephemeral=True)
+                return
 
             blacklisted = supabase.table("blacklist").select("reason").eq(
                 "discord_id", int(member.id)
@@ -138,6 +142,16 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
                 )
                 return
 
+            # Redeems committed locally but not yet replayed to Supabase count too
+            owed = outbox.get(f"role_redeem:{invoice_id}")
+            if owed:
+                redeemed_by = owed.payload.get("redeemed_by")
+                await interaction.followup.send(
+                    f"This order has already been redeemed by <@{redeemed_by}>.",
+                    ephemeral=True
+                )
+                return
+
             existing_invoice = (
                 supabase.table("role_redeem")
                 .select("id, redeemed_by")
@@ -153,7 +167,14 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
                 )
                 return
 
-            invoice = await fetch_invoice(invoice_id)
+            # Webhook-fed local index first; SellAuth is only called on a miss
+            try:
+                invoice, _source = await sellauth.get_invoice(invoice_id)
+            except admission.UpstreamBusy:
+                await interaction.followup.send(
+                    "We're handling a lot of orders right now. Please try again in a minute.", ephemeral=True
+                )
+                return
             if not invoice:
                 await interaction.followup.send(
                     "Order not found. Please check your invoice ID and try again.", 
@@ -161,11 +182,8 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
                 )
                 return
             
-            if not invoice_is_paid(invoice):
-                status = invoice.get("status", "unknown")
-                refunded = invoice.get("refunded", False)
-                cancelled = invoice.get("cancelled", False)
-                
+            paid, refunded, cancelled, status = sellauth.invoice_status(invoice)
+            if not paid:
                 if refunded:
                     await interaction.followup.send("This order has been refunded.", ephemeral=True)
                 elif cancelled:
@@ -190,18 +208,46 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
                 except Exception as e:
                     print(f"[DEBUG] Could not parse order date: {e}")
 
-            product_name, variant_name = extract_product_and_variant(invoice)
-            expires_at = compute_expires_at_from_variant(variant_name)
+            product_name, variant_name = sellauth.extract_product_and_variant(invoice)
+            # One canonical expiry for both role_redeem.expires_at and Luarmor auth_expire
+            # (None for products without a Luarmor key)
+            try:
+                expiry = order_expiry(product_name, variant_name)
+            except UnknownPlanError as e:
+                print(f"[REDEEM] {invoice_id}: {e}")
+                embed = discord.Embed(title="Redeem Needs Staff (Unknown Plan)", color=discord.Color.orange())
+                embed.add_field(name="User", value=f"{member.mention}\n`{member.id}`", inline=False)
+                embed.add_field(name="Invoice", value=f"`{invoice_id}`", inline=False)
+                embed.add_field(name="Product", value=f"{product_name} | {variant_name}", inline=False)
+                events.record("redeem_unknown_plan", embed, discord_id=member.id)
+                await interaction.followup.send(
+                    "We couldn't work out the plan for this order automatically.\n\n"
+                    "Please open a ticket and a staff member will assist you.",
+                    ephemeral=True
+                )
+                return
+            expires_at = expiry.expires_at if expiry else None
 
             role = guild.get_role(ACCESS_ROLE_ID)
             if not role:
                 await interaction.followup.send("Premium role not found. Contact staff.", ephemeral=True)
                 return
 
+            # Durable claim before anything is granted: holds across replicas and restarts,
+            # so a crash mid-grant leaves the invoice "redeemed" rather than grantable twice
+            if not await claims.claim(invoice_id, member.id):
+                await interaction.followup.send(
+                    "This order has already been redeemed or is being redeemed right now.\n\n"
+                    "If you didn't receive access, please open a ticket.",
+                    ephemeral=True
+                )
+                return
+
             try:
                 if role not in member.roles:
                     await member.add_roles(role, reason=f"SellAuth redeem {invoice_id}")
             except discord.Forbidden:
+                await claims.release(invoice_id)
                 await interaction.followup.send(
                     "I can't assign roles. Make sure my role is above the Premium role and I have Manage Roles.",
                     ephemeral=True
@@ -211,13 +257,9 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
             luarmor_key = None
             luarmor_expiry = None
             
-            if should_whitelist_product(product_name, variant_name):
+            if expiry is not None:
                 try:
-                    luarmor_result = await create_or_update_user(
-                        discord_id=member.id,
-                        plan_name=variant_name,
-                        note=f"{product_name} | {variant_name} | Invoice: {invoice_id}"
-                    )
+                    luarmor_result = await grant_luarmor(member.id, invoice_id, product_name, variant_name, expiry)
                     
                     if luarmor_result:
                         luarmor_key = luarmor_result.get("user_key")
@@ -232,8 +274,7 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
                 try:
                     print(f"[REFERRAL] Processing code: {ref_code}")
                     referral_data = (
-                        supabase.table("referrals")
-                        .select("*")
+                        select("referrals", "referrer_discord_id, bonus_days_per_referral")
                         .eq("referral_code", ref_code)
                         .limit(1)
                         .execute()
@@ -246,15 +287,15 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
                         print(f"[REFERRAL] Found code for referrer {referrer_id}, bonus days: {bonus_days}")
                         
                         if referrer_id != member.id:
-                            already_used = (
+                            already_used = outbox.get(f"referral_use:{member.id}") or (
                                 supabase.table("referral_uses")
                                 .select("id")
                                 .eq("referred_discord_id", member.id)
                                 .limit(1)
                                 .execute()
-                            )
+                            ).data
                             
-                            if not already_used.data:
+                            if not already_used:
                                 print(f"[REFERRAL] Adding {bonus_days} days to referrer {referrer_id}")
                                 
                                 referrer_result = await add_time_to_user(referrer_id, bonus_days)
@@ -270,7 +311,7 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
                                 else:
                                     print(f"[REFERRAL] Referrer not in Luarmor, creating account with {bonus_days} days")
                                     try:
-                                        new_user = await create_or_update_user(
+                                        new_user = await keypool.provision(
                                             discord_id=referrer_id,
                                             plan_name=f"Referral Bonus ({bonus_days} days)",
                                             note=f"Referral bonus from {member.id} using code {ref_code}"
@@ -281,7 +322,7 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
                                             
                                             # Give them the premium role too
                                             try:
-                                                referrer_member = guild.get_member(referrer_id) or await guild.fetch_member(referrer_id)
+                                                referrer_member = await member_resolver.resolve(guild, referrer_id)
                                                 if referrer_member and role not in referrer_member.roles:
                                                     await referrer_member.add_roles(role, reason=f"Referral bonus from {member.id}")
                                                     print(f"[REFERRAL] Added premium role to referrer {referrer_id}")
@@ -291,10 +332,16 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
                                         print(f"[REFERRAL] Failed to create account for referrer: {create_err}")
                                 
                             if bonus_applied:
+                                outbox.enqueue("referral_uses", {
+                                    "referral_code": ref_code,
+                                    "referrer_discord_id": referrer_id,
+                                    "referred_discord_id": int(member.id),
+                                    "bonus_days_awarded": bonus_days,
+                                }, dedup_key=f"referral_use:{member.id}", unique_col="referred_discord_id")
                                 referral_bonus_msg = f"\n\nReferral code applied! <@{referrer_id}> received {bonus_days} bonus days."
                                 
                                 try:
-                                    referrer = await guild.fetch_member(referrer_id)
+                                    referrer = await member_resolver.resolve(guild, referrer_id)
                                     if referrer:
                                         await referrer.send(
                                             f"Someone used your referral code `{ref_code}`!\n"
@@ -311,7 +358,8 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
                 except Exception as e:
                     print(f"[REFERRAL ERROR] {e}")
 
-            supabase.table("role_redeem").insert({
+            # Committed locally first; commands/ops.py replays it to Supabase
+            outbox.enqueue("role_redeem", {
                 "role_id": int(ACCESS_ROLE_ID),
                 "redeemed": True,
                 "redeemed_by": int(member.id),
@@ -324,35 +372,35 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
                 "luarmor_key": luarmor_key,
                 "whitelisted": True if luarmor_key else False,
                 "referral_code": ref_code,
-            }).execute()
-
-            log_channel = guild.get_channel(LOG_CHANNEL_ID)
-            if log_channel:
-                embed = discord.Embed(title="Order Redeemed", color=discord.Color.green())
-                embed.add_field(name="User", value=f"<@{member.id}>\n`{member.id}`", inline=False)
-                embed.add_field(name="Product", value=product_name, inline=True)
-                embed.add_field(name="Variant", value=variant_name, inline=True)
-                embed.add_field(name="Invoice ID", value=f"`{invoice_id}`", inline=False)
+            }, dedup_key=f"role_redeem:{invoice_id}", unique_col="invoice_id")
+            claims.finalize(invoice_id)
+            history.invalidate(member.id)
+
+            embed = discord.Embed(title="Order Redeemed", color=discord.Color.green())
+            embed.add_field(name="User", value=f"<@{member.id}>\n`{member.id}`", inline=False)
+            embed.add_field(name="Product", value=product_name, inline=True)
+            embed.add_field(name="Variant", value=variant_name, inline=True)
+            embed.add_field(name="Invoice ID", value=f"`{invoice_id}`", inline=False)
                 
-                if luarmor_key:
-                    embed.add_field(name="Luarmor Key", value=f"||`{luarmor_key}`||", inline=False)
-                    embed.add_field(name="Whitelist Status", value="Auto-whitelisted", inline=False)
-                else:
-                    embed.add_field(name="Whitelist Status", value="Failed - manual whitelist needed", inline=False)
-
-                if expires_at:
-                    try:
-                        ts = int(datetime.fromisoformat(expires_at.replace("Z", "+00:00")).timestamp())
-                        embed.add_field(name="Expires", value=f"<t:{ts}:F>", inline=False)
-                    except Exception:
-                        embed.add_field(name="Expires", value=f"`{expires_at}`", inline=False)
-                else:
-                    embed.add_field(name="Expires", value="Lifetime", inline=False)
+            if luarmor_key:
+                embed.add_field(name="Luarmor Key", value=f"||`{luarmor_key}`||", inline=False)
+                embed.add_field(name="Whitelist Status", value="Auto-whitelisted", inline=False)
+            else:
+                embed.add_field(name="Whitelist Status", value="Failed - manual whitelist needed", inline=False)
+
+            if expires_at:
+                try:
+                    ts = int(datetime.fromisoformat(expires_at.replace("Z", "+00:00")).timestamp())
+                    embed.add_field(name="Expires", value=f"<t:{ts}:F>", inline=False)
+                except Exception:
+                    embed.add_field(name="Expires", value=f"`{expires_at}`", inline=False)
+            else:
+                embed.add_field(name="Expires", value="Lifetime", inline=False)
                 
-                if ref_code:
-                    embed.add_field(name="Referral Code Used", value=f"`{ref_code}`", inline=False)
+            if ref_code:
+                embed.add_field(name="Referral Code Used", value=f"`{ref_code}`", inline=False)
 
-                await log_channel.send(embed=embed)
+            events.record("redeem", embed, discord_id=member.id)
 
             if should_whitelist_product(product_name, variant_name):
                 if luarmor_key:
@@ -386,6 +434,9 @@ class RedeemOrderModal(ui.Modal, title="Redeem Order ID"):
                 )
             except:
                 pass
+        finally:
+            if claimed:
+                _redeeming.discard(invoice_id)
 
 
 # -----------------------------
@@ -398,14 +449,18 @@ class ShopView(ui.View):
 
         self.add_item(ui.Button(label="Purchase", url=SHOP_URL, style=discord.ButtonStyle.link))
 
-    @ui.button(label="Redeem Order ID", style=discord.ButtonStyle.primary)
+    @ui.button(label="Redeem Order ID", style=discord.ButtonStyle.primary, custom_id="shop_redeem_order_v1")
     async def redeem_order(self, interaction: Interaction, button: ui.Button):
         await interaction.response.send_modal(RedeemOrderModal(self.bot))
 
-    @ui.button(label="Open Ticket", style=discord.ButtonStyle.secondary)
+    @ui.button(label="Open Ticket", style=discord.ButtonStyle.secondary, custom_id="shop_open_ticket_v1")
+    @admission.rate_limited("ticket")
     async def open_ticket(self, interaction: Interaction, button: ui.Button):
         await interaction.response.defer(ephemeral=True)
         channel = await create_or_get_ticket_channel(interaction.guild, interaction.user)
+        if channel is None:
+            await interaction.followup.send("Failed to create ticket. Please contact staff.", ephemeral=True)
+            return
         await interaction.followup.send(f"Ticket ready: {channel.mention}", ephemeral=True)
 
 
@@ -415,11 +470,15 @@ class ShopView(ui.View):
 class Shop(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        # Persistent, so every replica serves the buttons on whichever copy the leader posted
+        self.bot.add_view(ShopView(bot))
         self.refresh_shop.start()
 
     @tasks.loop(count=1)
     async def refresh_shop(self):
         await self.bot.wait_until_ready()
+        if not await leader.confirm():
+            return  # the leader reposts it; a standby would delete the leader's copy (its buttons work here too)
         channel = self.bot.get_channel(SHOP_CHANNEL_ID)
         if not isinstance(channel, discord.TextChannel):
             return
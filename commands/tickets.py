@@ -3,8 +3,15 @@ from discord.ext import commands, tasks
 from discord import ui, Interaction
 from datetime import datetime, timezone, timedelta
 import io
+import time
+import asyncio
+import weakref
 
-from utils.supabase import get_supabase
+from utils.supabase import get_supabase, execute_async
+from utils.members import get_or_fetch_member
+from utils import events, metrics, transcripts, attachments, admission, leader
+from utils.supervisor import supervised
+from commands.robux import RobuxUsernameModal
 
 # -----------------------------
 # CONFIG
@@ -22,8 +29,33 @@ EMBED_COLOR = 0x489BF3
 
 TICKET_AUTO_CLOSE_DAYS = 3
 
+GUILD_ID = 1345153296360542271
+
+# Hidden, pre-created channels waiting in the ticket category; opening a ticket
+# just renames one and sets its overwrites instead of creating a channel
+TICKET_POOL_SIZE = 3
+TICKET_POOL_TOPUP_SECONDS = 60
+TICKET_POOL_CREATES_PER_TICK = 2   # stay well clear of channel-create rate limits
+TICKET_POOL_TOPIC = "ticket_pool=1"
+TICKET_POOL_NAME = "ticket-pool"
+
+TRANSCRIPT_SEARCH_MAX_RESULTS = 15
+
 supabase = get_supabase()
 
+# Open-ticket index: opener user_id <-> channel_id. Built on ready from the DB and
+# channel topics, then kept current by opens, closes and channel deletes.
+_open_by_user: dict[int, int] = {}
+_open_by_channel: dict[int, int] = {}
+_index_ready = False
+
+# One lock per user while they open a ticket (double clicks queue up instead of racing).
+# Callers must defer the interaction before awaiting create_or_get_ticket_channel.
+_open_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# Pool channel IDs already handed to an opener (the cached topic lags behind the rename)
+_claimed_pool: set[int] = set()
+
 
 def _has_staff_role(member: discord.Member) -> bool:
     return any(r.id in STAFF_ROLE_IDS for r in member.roles)
@@ -55,6 +87,58 @@ def _get_ticket_id_from_topic(topic: str | None) -> int | None:
     return None
 
 
+def _get_reason_from_topic(topic: str | None) -> str | None:
+    # stored like: "reason=support"
+    if not topic:
+        return None
+    for part in topic.split():
+        if part.startswith("reason="):
+            return part.split("=", 1)[1] or None
+    return None
+
+
+async def _stream_transcript(channel: discord.TextChannel, writer: transcripts.TranscriptWriter) -> None:
+    """
+    Feed the channel history (oldest first) into the transcript writer/archive.
+    Attachments are downloaded into the local store concurrently while the history
+    is paged; the transcript ends with a table mapping them to their stored blobs.
+    """
+    downloads: list[asyncio.Task] = []
+    started = time.perf_counter()
+    try:
+        async for msg in channel.history(limit=None, oldest_first=True):
+            names = []
+            for att in msg.attachments:
+                downloads.append(asyncio.create_task(attachments.fetch(att.url, att.filename, att.size)))
+                names.append(f"#{len(downloads)} {att.filename} - {att.url}")
+            writer.add(
+                msg.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                str(msg.author),
+                msg.author.id,
+                msg.content,
+                attachments=names,
+                embeds=[embed.title for embed in msg.embeds if embed.title],
+            )
+    except Exception:
+        for task in downloads:
+            task.cancel()
+        writer.abort()
+        raise
+
+    if not downloads:
+        return
+
+    stored = await asyncio.gather(*downloads)
+    writer.header(f"{'='*60}", "ATTACHMENTS (archived by sha256)", f"{'='*60}")
+    for index, item in enumerate(stored, start=1):
+        if item.sha256:
+            writer.header(f"#{index} {item.filename} -> sha256:{item.sha256} ({item.size} bytes)")
+        else:
+            writer.header(f"#{index} {item.filename} -> not archived ({item.error})")
+    attachments.link(writer.id, stored)
+    print(f"[ATTACHMENTS] {channel.name}: {attachments.summarize(stored, time.perf_counter() - started)}")
+
+
 class TicketReasonSelect(ui.Select):
     def __init__(self):
         options = [
@@ -85,23 +169,27 @@ class TicketReasonSelect(ui.Select):
             custom_id="ticket_reason_select_v1"
         )
 
+    @admission.rate_limited("ticket")
     async def callback(self, interaction: Interaction):
         if not interaction.guild or not isinstance(interaction.user, discord.Member):
             await interaction.response.send_message("Must be used in a server.", ephemeral=True)
             return
 
         reason = self.values[0]
-        
+
+        # Defer first: opening can outlast the 3s window, and a second click waits on the first one's lock
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
         # Create ticket with reason
         channel = await create_or_get_ticket_channel(interaction.guild, interaction.user, reason)
-        
+
         if channel:
-            await interaction.response.send_message(
+            await interaction.followup.send(
                 f"Your ticket has been created: {channel.mention}",
                 ephemeral=True
             )
         else:
-            await interaction.response.send_message(
+            await interaction.followup.send(
                 "Failed to create ticket. Please contact staff.",
                 ephemeral=True
             )
@@ -144,40 +232,18 @@ class CloseTicketView(ui.View):
 
         await interaction.response.send_message("Generating transcript and closing ticket...", ephemeral=True)
 
-        transcript_lines = []
-        transcript_lines.append(f"{'='*60}")
-        transcript_lines.append(f"TICKET TRANSCRIPT: {channel.name}")
-        transcript_lines.append(f"Ticket ID: {ticket_id}")
-        transcript_lines.append(f"Closed At: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}")
-        transcript_lines.append(f"{'='*60}\n")
-
-        # Fetch all messages (oldest first)
-        messages = []
-        async for msg in channel.history(limit=None, oldest_first=True):
-            messages.append(msg)
-
-        for msg in messages:
-            timestamp = msg.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            author = f"{msg.author} ({msg.author.id})"
-            content = msg.content or "[No text content]"
-            
-            transcript_lines.append(f"[{timestamp}] {author}")
-            transcript_lines.append(f"{content}")
-            
-            # Include attachment URLs
-            if msg.attachments:
-                for att in msg.attachments:
-                    transcript_lines.append(f"  [Attachment: {att.filename} - {att.url}]")
-            
-            # Include embed titles
-            if msg.embeds:
-                for embed in msg.embeds:
-                    if embed.title:
-                        transcript_lines.append(f"  [Embed: {embed.title}]")
-            
-            transcript_lines.append("")  # Empty line between messages
-
-        transcript_text = "\n".join(transcript_lines)
+        writer = transcripts.TranscriptWriter(
+            channel.name, ticket_id=ticket_id, opener_id=opener_id, reason=_get_reason_from_topic(channel.topic)
+        )
+        writer.header(
+            f"{'='*60}",
+            f"TICKET TRANSCRIPT: {channel.name}",
+            f"Ticket ID: {ticket_id}",
+            f"Closed At: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}",
+            f"{'='*60}\n",
+        )
+        await _stream_transcript(channel, writer)
+        transcript_text = writer.finish(closed_by=interaction.user.id)
         transcript_file = io.BytesIO(transcript_text.encode('utf-8'))
         transcript_file.name = f"transcript-{channel.name}.txt"
 
@@ -202,12 +268,7 @@ class CloseTicketView(ui.View):
         # Resolve opener name from topic (if possible)
         opener_member = None
         if opener_id:
-            opener_member = interaction.guild.get_member(opener_id)
-            if opener_member is None:
-                try:
-                    opener_member = await interaction.guild.fetch_member(opener_id)
-                except Exception:
-                    opener_member = None
+            opener_member = await get_or_fetch_member(interaction.guild, opener_id)
 
         opener_text = (
             f"{opener_member.mention} • **{opener_member}** (`{opener_id}`)"
@@ -220,7 +281,7 @@ class CloseTicketView(ui.View):
             embed.add_field(name="Ticket", value=f"`{channel.name}`", inline=True)
             if ticket_id:
                 embed.add_field(name="Ticket #", value=f"`{ticket_id}`", inline=True)
-            embed.add_field(name="Messages", value=f"`{len(messages)}`", inline=True)
+            embed.add_field(name="Messages", value=f"`{writer.message_count}`", inline=True)
             embed.add_field(name="Opened By", value=opener_text, inline=False)
             embed.add_field(name="Closed By", value=closer_text, inline=False)
             
@@ -230,14 +291,122 @@ class CloseTicketView(ui.View):
                 embed=embed, 
                 file=discord.File(transcript_file, filename=f"transcript-{channel.name}.txt")
             )
+            events.record("ticket_close", embed, discord_id=opener_id, actor_id=interaction.user.id, post=False)
 
+        _index_remove_channel(channel.id)
         try:
             await channel.delete(reason=f"Ticket closed by {interaction.user} ({interaction.user.id})")
         except Exception:
             pass
 
 
+class RobuxTicketView(CloseTicketView):
+    """Close button plus a button for submitting the Roblox username for auto-verification."""
+
+    @ui.button(
+        label="Submit Roblox Username",
+        style=discord.ButtonStyle.success,
+        custom_id="ticket_robux_username_v1"
+    )
+    async def submit_username(self, interaction: Interaction, button: ui.Button):
+        channel = interaction.channel
+        if not isinstance(channel, discord.TextChannel):
+            await interaction.response.send_message("This can only be used in a ticket channel.", ephemeral=True)
+            return
+
+        opener_id = _get_opener_id_from_topic(channel.topic)
+        if opener_id is not None and interaction.user.id != opener_id:
+            await interaction.response.send_message("Only the ticket opener can submit a username.", ephemeral=True)
+            return
+
+        await interaction.response.send_modal(
+            RobuxUsernameModal(channel, _get_ticket_id_from_topic(channel.topic))
+        )
+
+
+def _index_add(user_id: int, channel_id: int) -> None:
+    old = _open_by_user.pop(user_id, None)
+    if old is not None:
+        _open_by_channel.pop(old, None)
+    _open_by_user[user_id] = channel_id
+    _open_by_channel[channel_id] = user_id
+
+
+def _index_remove_channel(channel_id: int) -> None:
+    user_id = _open_by_channel.pop(channel_id, None)
+    if user_id is not None and _open_by_user.get(user_id) == channel_id:
+        del _open_by_user[user_id]
+
+
+def _user_lock(user_id: int) -> asyncio.Lock:
+    lock = _open_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _open_locks[user_id] = lock
+    return lock
+
+
+async def build_open_ticket_index(guild: discord.Guild) -> int:
+    """Rebuild the open-ticket index from open DB rows plus the ticket channels' topics."""
+    global _index_ready
+    by_user: dict[int, int] = {}
+
+    try:
+        rows = await execute_async(
+            supabase.table("tickets").select("user_id, channel_id").eq("status", "open").order("id")
+        )
+        for row in rows.data or []:
+            if row.get("user_id") and row.get("channel_id") and guild.get_channel(int(row["channel_id"])):
+                by_user[int(row["user_id"])] = int(row["channel_id"])
+    except Exception as e:
+        print(f"[TICKET INDEX] DB load failed, using channel topics only: {e}")
+
+    category = guild.get_channel(TICKET_CATEGORY_ID)
+    if isinstance(category, discord.CategoryChannel):
+        for channel in category.text_channels:
+            opener_id = _get_opener_id_from_topic(channel.topic)
+            if opener_id is not None:
+                by_user[opener_id] = channel.id
+
+    _open_by_user.clear()
+    _open_by_channel.clear()
+    for user_id, channel_id in by_user.items():
+        _index_add(user_id, channel_id)
+    _index_ready = True
+    return len(by_user)
+
+
+def _pool_channels(category: discord.CategoryChannel) -> list[discord.TextChannel]:
+    return [c for c in category.text_channels if c.topic == TICKET_POOL_TOPIC]
+
+
+def _take_pool_channel(category: discord.CategoryChannel) -> discord.TextChannel | None:
+    for channel in _pool_channels(category):
+        if channel.id not in _claimed_pool:
+            _claimed_pool.add(channel.id)
+            return channel
+    return None
+
+
 async def create_or_get_ticket_channel(guild: discord.Guild, member: discord.Member, reason: str = "other") -> discord.TextChannel | None:
+    async with _user_lock(member.id):
+        channel_id = _open_by_user.get(member.id)
+        if channel_id is not None:
+            ch = guild.get_channel(channel_id)
+            if isinstance(ch, discord.TextChannel):
+                metrics.incr("tickets.duplicate_open")
+                return ch
+            _index_remove_channel(channel_id)
+
+        started = time.perf_counter()
+        ch = await _open_ticket_channel(guild, member, reason)
+        if ch is not None:
+            _index_add(member.id, ch.id)
+            metrics.observe("tickets.open", time.perf_counter() - started)
+        return ch
+
+
+async def _open_ticket_channel(guild: discord.Guild, member: discord.Member, reason: str) -> discord.TextChannel | None:
     # Fetch category
     category = guild.get_channel(TICKET_CATEGORY_ID)
     if category is None:
@@ -249,25 +418,26 @@ async def create_or_get_ticket_channel(guild: discord.Guild, member: discord.Mem
     if not isinstance(category, discord.CategoryChannel):
         return None
 
-    # If the member already has an OPEN ticket in DB, return that channel if it exists
-    try:
-        existing = (
-            supabase.table("tickets")
-            .select("id, channel_id")
-            .eq("user_id", int(member.id))
-            .eq("status", "open")
-            .order("id", desc=True)
-            .limit(1)
-            .execute()
-        )
-        if existing.data:
-            ch_id = existing.data[0].get("channel_id")
-            if ch_id:
-                ch = guild.get_channel(int(ch_id))
-                if isinstance(ch, discord.TextChannel):
-                    return ch
-    except Exception:
-        pass
+    # Before the open-ticket index is built (startup), ask the DB instead
+    if not _index_ready:
+        try:
+            existing = (
+                supabase.table("tickets")
+                .select("id, channel_id")
+                .eq("user_id", int(member.id))
+                .eq("status", "open")
+                .order("id", desc=True)
+                .limit(1)
+                .execute()
+            )
+            if existing.data:
+                ch_id = existing.data[0].get("channel_id")
+                if ch_id:
+                    ch = guild.get_channel(int(ch_id))
+                    if isinstance(ch, discord.TextChannel):
+                        return ch
+        except Exception:
+            pass
 
     # Create a DB ticket row FIRST (this gives us the numeric ticket id)
     ticket_id = None
@@ -301,14 +471,30 @@ async def create_or_get_ticket_channel(guild: discord.Guild, member: discord.Mem
             overwrites[role] = discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True)
 
     topic = f"ticket_opener={member.id} ticket_id={ticket_id} reason={reason}"
+    audit_reason = f"Ticket opened by {member} ({member.id}) - Reason: {reason}"
 
-    ch = await guild.create_text_channel(
-        name=channel_name,
-        category=category,
-        overwrites=overwrites,
-        topic=topic,
-        reason=f"Ticket opened by {member} ({member.id}) - Reason: {reason}"
-    )
+    ch = None
+    pooled = _take_pool_channel(category)
+    if pooled:
+        try:
+            # One PATCH: name, topic and every overwrite at once
+            await pooled.edit(name=channel_name, topic=topic, overwrites=overwrites, reason=audit_reason)
+            ch = pooled
+            metrics.incr("tickets.pool_hit")
+        except discord.HTTPException as e:
+            # Leave it in the pool; it may just have been rate limited
+            _claimed_pool.discard(pooled.id)
+            print(f"[TICKET POOL] Could not use {pooled.id}, creating a channel instead: {e}")
+
+    if ch is None:
+        metrics.incr("tickets.pool_miss")
+        ch = await guild.create_text_channel(
+            name=channel_name,
+            category=category,
+            overwrites=overwrites,
+            topic=topic,
+            reason=audit_reason
+        )
 
     # Save channel_id back to DB (best-effort)
     try:
@@ -316,28 +502,20 @@ async def create_or_get_ticket_channel(guild: discord.Guild, member: discord.Mem
     except Exception:
         pass
 
-    # Log open
-    log_ch = guild.get_channel(LOG_CHANNEL_ID)
-    if log_ch is None:
-        try:
-            log_ch = await guild.fetch_channel(LOG_CHANNEL_ID)
-        except Exception:
-            log_ch = None
-
     reason_display = {
         "robux": "Robux Payment",
         "support": "Support",
         "other": "Other"
     }.get(reason, "Other")
 
-    if log_ch:
-        opener_text = f"{member.mention} • **{member}** (`{member.id}`)"
-        embed_open = discord.Embed(title="Ticket Opened", color=discord.Color(EMBED_COLOR))
-        embed_open.add_field(name="Ticket #", value=f"`{ticket_id}`", inline=True)
-        embed_open.add_field(name="Channel", value=ch.mention, inline=True)
-        embed_open.add_field(name="Reason", value=f"`{reason_display}`", inline=True)
-        embed_open.add_field(name="Opened By", value=opener_text, inline=False)
-        await log_ch.send(embed=embed_open)
+    # Log open
+    opener_text = f"{member.mention} • **{member}** (`{member.id}`)"
+    embed_open = discord.Embed(title="Ticket Opened", color=discord.Color(EMBED_COLOR))
+    embed_open.add_field(name="Ticket #", value=f"`{ticket_id}`", inline=True)
+    embed_open.add_field(name="Channel", value=ch.mention, inline=True)
+    embed_open.add_field(name="Reason", value=f"`{reason_display}`", inline=True)
+    embed_open.add_field(name="Opened By", value=opener_text, inline=False)
+    events.record("ticket_open", embed_open, discord_id=member.id, channel_id=LOG_CHANNEL_ID)
 
     if reason == "robux":
         embed = discord.Embed(
@@ -355,14 +533,16 @@ async def create_or_get_ticket_channel(guild: discord.Guild, member: discord.Mem
             inline=False
         )
         embed.add_field(
-            name="Please Provide",
+            name="How It Works",
             value=(
-                "1. Screenshot proof of your purchase\n"
-                "2. Your Roblox username\n"
-                "3. Which gamepass you purchased (Week/Month/Lifetime)"
+                "1. Buy one of the gamepasses above\n"
+                "2. Click **Submit Roblox Username** below\n"
+                "3. Add the code you get to your Roblox profile's About section\n"
+                "4. Access is granted automatically once Roblox shows the purchase and the code"
             ),
             inline=False
         )
+        embed.set_footer(text="Having trouble? Post a screenshot of your purchase and staff will help.")
     elif reason == "support":
         embed = discord.Embed(
             title="Support Request",
@@ -387,7 +567,8 @@ async def create_or_get_ticket_channel(guild: discord.Guild, member: discord.Mem
         )
 
     staff_mentions = " ".join(f"<@&{rid}>" for rid in STAFF_ROLE_IDS)
-    await ch.send(content=f"{staff_mentions}\n<@{member.id}>", embed=embed, view=CloseTicketView())
+    view = RobuxTicketView() if reason == "robux" else CloseTicketView()
+    await ch.send(content=f"{staff_mentions}\n<@{member.id}>", embed=embed, view=view)
 
     return ch
 
@@ -398,10 +579,17 @@ class Tickets(commands.Cog):
         # Register persistent views so buttons keep working after restart
         self.bot.add_view(CloseTicketView())
         self.bot.add_view(TicketReasonView())  # Register reason view
+        self.bot.add_view(RobuxTicketView())
         self.auto_close_tickets.start()
+        self.top_up_ticket_pool.start()
+        self.transcript_maintenance.start()
 
     def cog_unload(self):
         self.auto_close_tickets.cancel()
+        self.top_up_ticket_pool.cancel()
+        self.transcript_maintenance.cancel()
+
+    transcripts_group = discord.app_commands.Group(name="transcripts", description="Search archived ticket transcripts")
 
     @discord.app_commands.command(name="ticketpanel", description="Send the ticket creation panel (Admin only)")
     @discord.app_commands.default_permissions(administrator=True)
@@ -451,114 +639,251 @@ class Tickets(commands.Cog):
             f"Ticket panel sent to {panel_channel.mention}!", ephemeral=True
         )
 
+    @transcripts_group.command(name="search", description="Full-text search over closed ticket transcripts")
+    @discord.app_commands.describe(
+        query="Words to look for (order ID, username, message text...)",
+        user="Only tickets opened by this user",
+        limit=f"Max results (1-{TRANSCRIPT_SEARCH_MAX_RESULTS})"
+    )
+    async def transcripts_search(self, interaction: Interaction, query: str, user: discord.User = None, limit: int = 10):
+        if not isinstance(interaction.user, discord.Member) or not _has_staff_role(interaction.user):
+            await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+            return
+
+        limit = max(1, min(limit, TRANSCRIPT_SEARCH_MAX_RESULTS))
+        started = time.perf_counter()
+        hits = transcripts.search(query, opener_id=user.id if user else None, limit=limit)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.observe("transcripts.search", elapsed_ms / 1000)
+
+        embed = discord.Embed(title=f"Transcripts: {query[:200]}", color=discord.Color(EMBED_COLOR))
+        if not hits:
+            embed.description = "No matching transcripts."
+        else:
+            lines = []
+            for hit in hits:
+                opener = f"<@{hit.opener_id}>" if hit.opener_id else "unknown"
+                snippet = " ".join(hit.snippet.split())[:200]
+                lines.append(
+                    f"`#{hit.transcript_id}` **{hit.channel_name}** • {opener} • <t:{int(hit.closed_at)}:d>\n> {snippet}"
+                )
+            embed.description = "\n".join(lines)[:4000]
+        embed.set_footer(text=f"{len(hits)} result(s) in {elapsed_ms:.1f} ms • /transcripts view <#> for the full file")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @transcripts_group.command(name="view", description="Get the full transcript file for an archived ticket")
+    @discord.app_commands.describe(transcript_id="Number shown in /transcripts search results")
+    async def transcripts_view(self, interaction: Interaction, transcript_id: int):
+        if not isinstance(interaction.user, discord.Member) or not _has_staff_role(interaction.user):
+            await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+            return
+
+        found = transcripts.get_text(transcript_id)
+        if not found:
+            await interaction.response.send_message(f"No archived transcript `#{transcript_id}`.", ephemeral=True)
+            return
+
+        meta, text = found
+        file = discord.File(io.BytesIO(text.encode("utf-8")), filename=f"transcript-{meta['channel_name']}.txt")
+        opener = f"<@{meta['opener_id']}>" if meta.get("opener_id") else "unknown"
+        await interaction.response.send_message(
+            f"`#{transcript_id}` **{meta['channel_name']}** • opened by {opener} • "
+            f"closed <t:{int(meta['closed_at'])}:f> • {meta['message_count']} messages",
+            file=file,
+            ephemeral=True
+        )
+
+    @transcripts_group.command(name="attachment", description="Get an archived ticket attachment")
+    @discord.app_commands.describe(sha256="sha256 from a transcript's ATTACHMENTS table (8+ characters)")
+    async def transcripts_attachment(self, interaction: Interaction, sha256: str):
+        if not isinstance(interaction.user, discord.Member) or not _has_staff_role(interaction.user):
+            await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+            return
+
+        blob = attachments.find(sha256)
+        if not blob:
+            await interaction.response.send_message("No single archived attachment matches that hash.", ephemeral=True)
+            return
+
+        file = discord.File(attachments.blob_path(blob["sha256"]), filename=blob.get("filename") or blob["sha256"])
+        await interaction.response.send_message(
+            f"`{blob['sha256'][:16]}` • {blob['size']} bytes • first stored <t:{int(blob['stored_at'])}:f>",
+            file=file,
+            ephemeral=True
+        )
+
+    @tasks.loop(hours=24)
+    async def transcript_maintenance(self):
+        """Drop transcripts past retention and compact the archive."""
+        try:
+            removed = await asyncio.to_thread(transcripts.prune)
+            attachments.forget_transcripts(removed)
+            freed = await asyncio.to_thread(attachments.gc)
+            await asyncio.to_thread(transcripts.compact)
+            info = transcripts.stats()
+            blobs = attachments.stats()
+            print(
+                f"[TRANSCRIPTS] Pruned {len(removed)}, archive holds {info['count']} "
+                f"({info['stored_bytes'] / 1e6:.1f} MB stored, {info['raw_bytes'] / 1e6:.1f} MB raw); "
+                f"attachments: {blobs['blobs']} blobs, {blobs['stored_bytes'] / 1e6:.1f} MB, "
+                f"{blobs['saved_bytes'] / 1e6:.1f} MB saved by dedupe, {freed / 1e6:.1f} MB freed"
+            )
+        except Exception as e:
+            print(f"[TRANSCRIPTS MAINTENANCE ERROR] {e}")
+
     @tasks.loop(hours=1)
+    @supervised("auto_close_tickets", interval=3600, timeout=900)
     async def auto_close_tickets(self):
         """Automatically close tickets inactive for X days"""
-        try:
-            guild = self.bot.get_guild(1345153296360542271)
-            if not guild:
-                return
+        guild = self.bot.get_guild(GUILD_ID)
+        if not guild:
+            return 0
+
+        cutoff = datetime.now(timezone.utc) - timedelta(days=TICKET_AUTO_CLOSE_DAYS)
+
+        # Get open tickets
+        open_tickets = await execute_async(supabase.table("tickets").select(
+            "id, channel_id, user_id, last_activity"
+        ).eq("status", "open"))
+
+        if not open_tickets.data:
+            return 0
+
+        closed = 0
+        for ticket in open_tickets.data:
+            channel_id = ticket.get("channel_id")
+            if not channel_id:
+                continue
+
+            channel = guild.get_channel(int(channel_id))
+            if not isinstance(channel, discord.TextChannel):
+                # Channel deleted, mark ticket as closed
+                await execute_async(supabase.table("tickets").update({
+                    "status": "closed",
+                    "closed_at": datetime.now(timezone.utc).isoformat()
+                }).eq("id", ticket["id"]))
+                continue
 
-            cutoff = datetime.now(timezone.utc) - timedelta(days=TICKET_AUTO_CLOSE_DAYS)
+            # Check last message time
+            last_activity = None
+            async for msg in channel.history(limit=1):
+                last_activity = msg.created_at
 
-            # Get open tickets
-            open_tickets = supabase.table("tickets").select(
-                "id, channel_id, user_id, last_activity"
-            ).eq("status", "open").execute()
+            if last_activity and last_activity.replace(tzinfo=timezone.utc) < cutoff:
+                # Send warning then close
+                try:
+                    await channel.send(
+                        f"This ticket has been inactive for {TICKET_AUTO_CLOSE_DAYS} days and will be closed automatically."
+                    )
+                except:
+                    pass
+
+                # Generate transcript
+                user_id = ticket.get("user_id")
+                writer = transcripts.TranscriptWriter(
+                    channel.name,
+                    ticket_id=ticket["id"],
+                    opener_id=user_id,
+                    reason=_get_reason_from_topic(channel.topic),
+                )
+                writer.header(
+                    f"{'='*60}",
+                    f"TICKET TRANSCRIPT: {channel.name} (AUTO-CLOSED)",
+                    f"Closed At: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}",
+                    f"Reason: Inactive for {TICKET_AUTO_CLOSE_DAYS} days",
+                    f"{'='*60}\n",
+                )
+                await _stream_transcript(channel, writer)
+                transcript_text = writer.finish()
+                transcript_file = io.BytesIO(transcript_text.encode('utf-8'))
+
+                # Update DB
+                await execute_async(supabase.table("tickets").update({
+                    "status": "closed",
+                    "closed_at": datetime.now(timezone.utc).isoformat()
+                }).eq("id", ticket["id"]))
+
+                # Log
+                log_ch = guild.get_channel(LOG_CHANNEL_ID)
+                if log_ch:
+                    embed = discord.Embed(
+                        title="Ticket Auto-Closed",
+                        description=f"Inactive for {TICKET_AUTO_CLOSE_DAYS} days",
+                        color=discord.Color.orange()
+                    )
+                    embed.add_field(name="Ticket", value=f"`{channel.name}`", inline=True)
+                    embed.add_field(name="Messages", value=f"`{writer.message_count}`", inline=True)
+                    embed.add_field(name="Opened By", value=f"<@{user_id}>", inline=False)
+
+                    transcript_file.seek(0)
+                    await log_ch.send(
+                        embed=embed,
+                        file=discord.File(transcript_file, filename=f"transcript-{channel.name}.txt")
+                    )
+                    events.record("ticket_close", embed, discord_id=user_id, post=False)
+
+                # Delete channel
+                _index_remove_channel(channel.id)
+                try:
+                    await channel.delete(reason="Auto-closed due to inactivity")
+                except:
+                    pass
+                closed += 1
+
+        return closed
+
+    @auto_close_tickets.before_loop
+    async def before_auto_close(self):
+        await self.bot.wait_until_ready()
 
-            if not open_tickets.data:
+    @commands.Cog.listener()
+    async def on_ready(self):
+        guild = self.bot.get_guild(GUILD_ID)
+        if guild:
+            count = await build_open_ticket_index(guild)
+            print(f"[TICKET INDEX] {count} open ticket(s) indexed")
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        _index_remove_channel(channel.id)
+        _claimed_pool.discard(channel.id)
+
+    @tasks.loop(seconds=TICKET_POOL_TOPUP_SECONDS)
+    async def top_up_ticket_pool(self):
+        """Keep TICKET_POOL_SIZE hidden channels ready in the ticket category."""
+        if not leader.is_leader():
+            return
+        try:
+            guild = self.bot.get_guild(GUILD_ID)
+            category = guild.get_channel(TICKET_CATEGORY_ID) if guild else None
+            if not isinstance(category, discord.CategoryChannel):
                 return
 
-            for ticket in open_tickets.data:
-                channel_id = ticket.get("channel_id")
-                if not channel_id:
-                    continue
-
-                channel = guild.get_channel(int(channel_id))
-                if not isinstance(channel, discord.TextChannel):
-                    # Channel deleted, mark ticket as closed
-                    supabase.table("tickets").update({
-                        "status": "closed",
-                        "closed_at": datetime.now(timezone.utc).isoformat()
-                    }).eq("id", ticket["id"]).execute()
-                    continue
-
-                # Check last message time
-                last_activity = None
-                async for msg in channel.history(limit=1):
-                    last_activity = msg.created_at
-
-                if last_activity and last_activity.replace(tzinfo=timezone.utc) < cutoff:
-                    # Send warning then close
-                    try:
-                        await channel.send(
-                            f"This ticket has been inactive for {TICKET_AUTO_CLOSE_DAYS} days and will be closed automatically."
-                        )
-                    except:
-                        pass
-
-                    # Generate transcript
-                    transcript_lines = []
-                    transcript_lines.append(f"{'='*60}")
-                    transcript_lines.append(f"TICKET TRANSCRIPT: {channel.name} (AUTO-CLOSED)")
-                    transcript_lines.append(f"Closed At: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}")
-                    transcript_lines.append(f"Reason: Inactive for {TICKET_AUTO_CLOSE_DAYS} days")
-                    transcript_lines.append(f"{'='*60}\n")
-
-                    messages = []
-                    async for msg in channel.history(limit=None, oldest_first=True):
-                        messages.append(msg)
-
-                    for msg in messages:
-                        timestamp = msg.created_at.strftime('%Y-%m-%d %H:%M:%S')
-                        author = f"{msg.author} ({msg.author.id})"
-                        content = msg.content or "[No text content]"
-                        transcript_lines.append(f"[{timestamp}] {author}")
-                        transcript_lines.append(f"{content}")
-                        if msg.attachments:
-                            for att in msg.attachments:
-                                transcript_lines.append(f"  [Attachment: {att.filename}]")
-                        transcript_lines.append("")
-
-                    transcript_text = "\n".join(transcript_lines)
-                    transcript_file = io.BytesIO(transcript_text.encode('utf-8'))
-
-                    # Update DB
-                    supabase.table("tickets").update({
-                        "status": "closed",
-                        "closed_at": datetime.now(timezone.utc).isoformat()
-                    }).eq("id", ticket["id"]).execute()
-
-                    # Log
-                    log_ch = guild.get_channel(LOG_CHANNEL_ID)
-                    if log_ch:
-                        user_id = ticket.get("user_id")
-                        embed = discord.Embed(
-                            title="Ticket Auto-Closed",
-                            description=f"Inactive for {TICKET_AUTO_CLOSE_DAYS} days",
-                            color=discord.Color.orange()
-                        )
-                        embed.add_field(name="Ticket", value=f"`{channel.name}`", inline=True)
-                        embed.add_field(name="Messages", value=f"`{len(messages)}`", inline=True)
-                        embed.add_field(name="Opened By", value=f"<@{user_id}>", inline=False)
-
-                        transcript_file.seek(0)
-                        await log_ch.send(
-                            embed=embed,
-                            file=discord.File(transcript_file, filename=f"transcript-{channel.name}.txt")
-                        )
-
-                    # Delete channel
-                    try:
-                        await channel.delete(reason="Auto-closed due to inactivity")
-                    except:
-                        pass
+            pool = _pool_channels(category)
+            _claimed_pool.intersection_update(c.id for c in pool)
+            missing = TICKET_POOL_SIZE - len([c for c in pool if c.id not in _claimed_pool])
+            if missing <= 0:
+                return
 
+            overwrites = {
+                guild.default_role: discord.PermissionOverwrite(view_channel=False),
+                guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True, manage_channels=True, manage_messages=True),
+            }
+            for _ in range(min(missing, TICKET_POOL_CREATES_PER_TICK)):
+                with metrics.timer("tickets.pool_create"):
+                    await guild.create_text_channel(
+                        name=TICKET_POOL_NAME,
+                        category=category,
+                        overwrites=overwrites,
+                        topic=TICKET_POOL_TOPIC,
+                        reason="Ticket channel pool"
+                    )
+            print(f"[TICKET POOL] Created {min(missing, TICKET_POOL_CREATES_PER_TICK)} pool channel(s)")
         except Exception as e:
-            print(f"[AUTO-CLOSE ERROR] {e}")
+            print(f"[TICKET POOL ERROR] {e}")
 
-    @auto_close_tickets.before_loop
-    async def before_auto_close(self):
+    @top_up_ticket_pool.before_loop
+    async def before_top_up(self):
         await self.bot.wait_until_ready()
 
 
@@ -0,0 +1,171 @@
+import os
+import hmac
+import json
+import time
+import asyncio
+import hashlib
+from aiohttp import web
+from discord.ext import commands
+
+from utils import sellauth, outbox
+from utils.luarmor import create_unassigned_key, delete_user
+from utils.plans import compute_expiry, should_whitelist_product, UnknownPlanError
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1").strip()
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = "/webhooks/sellauth"
+
+SELLAUTH_WEBHOOK_SECRET = (os.getenv("SELLAUTH_WEBHOOK_SECRET") or "").strip()
+SIGNATURE_HEADER = os.getenv("SELLAUTH_SIGNATURE_HEADER", "X-Signature").strip()
+
+MAX_BODY_BYTES = 256 * 1024
+
+# The body signature has no timestamp, so a delivery whose invoice last changed longer
+# ago than this is refused as stale (redeem then asks the SellAuth API instead)
+MAX_DELIVERY_AGE_SECONDS = sellauth.DELIVERY_MEMORY_SECONDS
+
+# Create the Luarmor key as soon as a whitelistable order is paid, so redeem only has to attach it
+PREPROVISION_KEYS = os.getenv("WEBHOOK_PREPROVISION", "1").strip() != "0"
+
+
+def sign(body: bytes, secret: str) -> str:
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def signature_ok(body: bytes, header_value: str | None) -> bool:
+    if not header_value:
+        return False
+    received = header_value.strip()
+    if received.lower().startswith("sha256="):
+        received = received[7:]
+    return hmac.compare_digest(sign(body, SELLAUTH_WEBHOOK_SECRET), received.lower())
+
+
+def extract_invoice(body: dict) -> dict | None:
+    """SellAuth wraps the invoice differently per event type; accept the common shapes."""
+    invoice = body.get("invoice") or body.get("data") or body
+    if isinstance(invoice, dict) and invoice.get("id") is not None:
+        return invoice
+    return None
+
+
+class Webhooks(commands.Cog):
+    """Local HTTP receiver for SellAuth order webhooks. Feeds the invoice index used by redeem."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.runner: web.AppRunner | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._provisioning: set[str] = set()
+
+    async def cog_load(self):
+        if not SELLAUTH_WEBHOOK_SECRET:
+            print("[WEBHOOK] SELLAUTH_WEBHOOK_SECRET not set - receiver disabled, redeem uses the API")
+            return
+
+        app = web.Application(client_max_size=MAX_BODY_BYTES)
+        app.router.add_post(WEBHOOK_PATH, self.handle_sellauth)
+        app.router.add_get("/healthz", self.handle_health)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        print(f"[WEBHOOK] Listening on http://{WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    async def cog_unload(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+        for task in list(self._tasks):
+            task.cancel()
+
+    # -----------------------------
+    # HANDLERS
+    # -----------------------------
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"ok": True})
+
+    async def handle_sellauth(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        if not signature_ok(body, request.headers.get(SIGNATURE_HEADER)):
+            print(f"[WEBHOOK] Rejected request from {request.remote}: bad signature")
+            return web.json_response({"error": "invalid signature"}, status=401)
+
+        try:
+            invoice = extract_invoice(json.loads(body))
+        except (ValueError, AttributeError):
+            invoice = None
+        if invoice is None:
+            return web.json_response({"error": "no invoice in payload"}, status=400)
+
+        updated_at = sellauth.invoice_updated_at(invoice)
+        if updated_at is None or updated_at < time.time() - MAX_DELIVERY_AGE_SECONDS:
+            print(f"[WEBHOOK] Rejected stale delivery for invoice {invoice.get('id')} from {request.remote}")
+            return web.json_response({"error": "stale delivery"}, status=400)
+        if not sellauth.remember_delivery(hashlib.sha256(body).hexdigest()):
+            print(f"[WEBHOOK] Ignored repeated delivery for invoice {invoice.get('id')}")
+            return web.json_response({"ok": True, "duplicate": True})
+
+        invoice_id = sellauth.index_invoice(invoice, source="webhook")
+        print(f"[WEBHOOK] Indexed invoice {invoice_id} ({invoice.get('status')})")
+
+        # Answer SellAuth right away; key work happens in the background
+        task = asyncio.create_task(self._after_index(invoice_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({"ok": True, "invoice_id": invoice_id})
+
+    # -----------------------------
+    # PRE-PROVISIONING
+    # -----------------------------
+    async def _after_index(self, invoice_id: str):
+        if invoice_id in self._provisioning:
+            return
+        self._provisioning.add(invoice_id)
+        try:
+            entry = sellauth.indexed_invoice(invoice_id)
+            if not entry:
+                return
+
+            if not entry["paid"]:
+                # Refunded/cancelled before anyone redeemed - drop the spare key
+                if entry.get("prekey"):
+                    sellauth.set_prekey(invoice_id, None)
+                    await delete_user(entry["prekey"])
+                    print(f"[WEBHOOK] Deleted pre-created key for {entry['status']} invoice {invoice_id}")
+                return
+
+            if not PREPROVISION_KEYS or entry.get("prekey") or outbox.get(f"role_redeem:{invoice_id}"):
+                return
+
+            product_name, variant_name = entry["product_name"], entry["variant_name"]
+            if not should_whitelist_product(product_name, variant_name):
+                return
+
+            try:
+                expiry = compute_expiry(product_name, variant_name)
+            except UnknownPlanError as e:
+                # Redeem sends it to staff; don't guess a key length here
+                print(f"[WEBHOOK] Not pre-creating a key for {invoice_id}: {e}")
+                return
+            user_key = await create_unassigned_key(
+                expiry.auth_expire,
+                note=f"{product_name} | {variant_name} | Invoice: {invoice_id} (unclaimed)",
+            )
+            if user_key and outbox.get(f"role_redeem:{invoice_id}"):
+                # Redeemed while we were creating it - nobody will claim this key
+                await delete_user(user_key)
+            elif user_key:
+                sellauth.set_prekey(invoice_id, user_key, expiry.auth_expire)
+                print(f"[WEBHOOK] Pre-created Luarmor key for invoice {invoice_id}")
+        except Exception as e:
+            print(f"[WEBHOOK ERROR] Post-processing invoice {invoice_id} failed: {e}")
+        finally:
+            self._provisioning.discard(invoice_id)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Webhooks(bot))
@@ -1,4 +1,6 @@
 import os
+import time
+import resource
 import asyncio
 import discord
 from discord.ext import commands
@@ -7,12 +9,47 @@ from dotenv import load_dotenv
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 
+from utils.supabase import check_health  # noqa: E402  (utils read .env settings)
+from utils.roblox import roblox  # noqa: E402
+from utils import sellauth, luarmor, attachments, leader  # noqa: E402
+
 TOKEN = (os.getenv("DISCORD_TOKEN") or "").strip()
 STATUS = os.getenv("STATUS", "Redeeming Keys")
 GUILD_ID = 1345153296360542271
 
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix="!", intents=intents)
+# "minimal" = only the intents we use, no member chunking, members fetched on demand
+# "full"    = legacy behaviour (all intents, full member cache, chunk at startup)
+BOT_PROFILE = os.getenv("BOT_PROFILE", "minimal").strip().lower()
+
+STARTED_AT = time.perf_counter()
+
+
+def build_client_options(profile: str) -> dict:
+    if profile == "full":
+        return {
+            "intents": discord.Intents.all(),
+            "member_cache_flags": discord.MemberCacheFlags.all(),
+            "chunk_guilds_at_startup": True,
+        }
+
+    intents = discord.Intents.default()
+    intents.members = True          # role edits / member lookups in our guild
+    intents.message_content = True  # ticket transcripts
+    intents.presences = False
+    intents.typing = False
+    intents.dm_typing = False
+    intents.voice_states = False
+    intents.invites = False
+
+    return {
+        "intents": intents,
+        # Members come from interaction payloads or utils.members.get_or_fetch_member
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+    }
+
+
+bot = commands.Bot(command_prefix="!", **build_client_options(BOT_PROFILE))
 
 # ✅ Only load what you actually use
 EXTENSIONS = [
@@ -20,15 +57,26 @@ EXTENSIONS = [
     "commands.checkorder",
     "commands.tickets",
     "commands.admin",  # Added admin cog to extensions list
+    "commands.robux",
+    "commands.bulk",
+    "commands.reconcile",
+    "commands.ops",
+    "commands.webhooks",
+    "commands.refunds",
 ]
 
 @bot.event
 async def setup_hook():
+    if not await check_health():
+        # Every cog reads and writes Supabase; booting without it only produces confusing failures later
+        raise RuntimeError("Supabase health check failed - refusing to start (see the error above)")
+
     print("🔄 Loading extensions...")
     for ext in EXTENSIONS:
+        started = time.perf_counter()
         try:
             await bot.load_extension(ext)
-            print(f"✅ Loaded extension: {ext}")
+            print(f"✅ Loaded extension: {ext} ({(time.perf_counter() - started) * 1000:.0f}ms)")
         except Exception as e:
             print(f"❌ Extension load failed {ext}: {e}")
 
@@ -51,12 +99,28 @@ async def on_ready():
     await bot.change_presence(activity=discord.Game(STATUS))
     print(f"✅ Bot ready: {bot.user} (ID: {bot.user.id})")
 
+    # Startup benchmark: compare these numbers between BOT_PROFILE=minimal and BOT_PROFILE=full
+    ready_secs = time.perf_counter() - STARTED_AT
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    cached_members = sum(len(g.members) for g in bot.guilds)
+    print(
+        f"[STARTUP] profile={BOT_PROFILE} ready_in={ready_secs:.2f}s "
+        f"max_rss={max_rss_mb:.1f}MB cached_members={cached_members}"
+    )
+
 async def main():
     if not TOKEN:
         raise RuntimeError("DISCORD_TOKEN is missing. Check your .env file next to main.py")
 
-    async with bot:
-        await bot.start(TOKEN)
+    try:
+        async with bot:
+            await bot.start(TOKEN)
+    finally:
+        await leader.step_down()
+        await roblox.close()
+        await sellauth.close()
+        await luarmor.close()
+        await attachments.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,51 @@
+"""
+Refresh tests/plan_names.txt with every product/variant pair in role_redeem.
+
+    python scripts/dump_plan_names.py
+    python -m pytest -q tests/test_plans.py
+
+Run it after adding products so the plan fuzz tests cover the new names.
+"""
+import os
+import sys
+
+from dotenv import load_dotenv
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+sys.path.insert(0, BASE_DIR)
+
+from utils.supabase import get_supabase  # noqa: E402  (needs .env loaded first)
+
+OUT_PATH = os.path.join(BASE_DIR, "tests", "plan_names.txt")
+PAGE_SIZE = 1000
+
+
+def main() -> int:
+    supabase = get_supabase()
+    pairs = set()
+    start = 0
+    while True:
+        rows = (
+            supabase.table("role_redeem")
+            .select("product_name, variant_name")
+            .order("id")
+            .range(start, start + PAGE_SIZE - 1)
+            .execute()
+        ).data or []
+        pairs.update(((r.get("product_name") or "").strip(), (r.get("variant_name") or "").strip()) for r in rows)
+        if len(rows) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+
+    with open(OUT_PATH, "w", encoding="utf-8") as f:
+        f.write("# product | variant as stored in role_redeem (refresh with scripts/dump_plan_names.py)\n")
+        for product, variant in sorted(pairs):
+            if product or variant:
+                f.write(f"{product} | {variant}\n")
+    print(f"Wrote {len(pairs)} name pair(s) to {OUT_PATH}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Replay a SellAuth webhook payload against the bot's local receiver.
+
+    python scripts/replay_webhook.py invoice.json
+    python scripts/replay_webhook.py invoice.json --url http://127.0.0.1:8080/webhooks/sellauth
+
+The body is signed with SELLAUTH_WEBHOOK_SECRET from .env, exactly like SellAuth would.
+The receiver refuses invoices that last changed over an hour ago and repeated
+bodies; --fresh stamps the invoice's updated_at with the current time first.
+"""
+import os
+import sys
+import hmac
+import json
+import hashlib
+import argparse
+import urllib.request
+import urllib.error
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+
+def main() -> int:
+    host = os.getenv("WEBHOOK_HOST", "127.0.0.1").strip()
+    port = os.getenv("WEBHOOK_PORT", "8080").strip()
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("payload", help="JSON file with the webhook body")
+    parser.add_argument("--url", default=f"http://{host}:{port}/webhooks/sellauth")
+    parser.add_argument("--secret", default=(os.getenv("SELLAUTH_WEBHOOK_SECRET") or "").strip())
+    parser.add_argument("--header", default=os.getenv("SELLAUTH_SIGNATURE_HEADER", "X-Signature").strip())
+    parser.add_argument("--fresh", action="store_true", help="set the invoice's updated_at to now before signing")
+    args = parser.parse_args()
+
+    if not args.secret:
+        print("No secret - set SELLAUTH_WEBHOOK_SECRET or pass --secret")
+        return 1
+
+    with open(args.payload, "rb") as f:
+        body = f.read()
+
+    if args.fresh:
+        data = json.loads(body)
+        invoice = data.get("invoice") or data.get("data") or data
+        invoice["updated_at"] = datetime.now(timezone.utc).isoformat()
+        body = json.dumps(data).encode()
+
+    signature = hmac.new(args.secret.encode(), body, hashlib.sha256).hexdigest()
+    request = urllib.request.Request(
+        args.url,
+        data=body,
+        method="POST",
+        headers={"Content-Type": "application/json", args.header: signature},
+    )
+
+    try:
+        with urllib.request.urlopen(request, timeout=10) as resp:
+            print(resp.status, resp.read().decode())
+            return 0
+    except urllib.error.HTTPError as e:
+        print(e.code, e.read().decode())
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+-- Leader lease for running several bot replicas (utils/leader.py, LEADER_BACKEND=supabase).
+-- A lease row rather than pg_advisory_lock: PostgREST hands each request a pooled
+-- connection, so a session-level advisory lock wouldn't stay with the replica.
+create table if not exists bot_leases (
+    name text primary key,
+    holder text not null,
+    expires_at timestamptz not null,
+    acquired_at timestamptz not null default now()
+);
+
+-- Take the lease if it is free or lapsed, or extend it if we already hold it. Atomic.
+create or replace function acquire_lease(p_name text, p_holder text, p_ttl_seconds integer)
+returns boolean as $$
+declare
+    won text;
+begin
+    insert into bot_leases (name, holder, expires_at, acquired_at)
+    values (p_name, p_holder, now() + make_interval(secs => p_ttl_seconds), now())
+    on conflict (name) do update
+        set holder = excluded.holder,
+            expires_at = excluded.expires_at,
+            acquired_at = case when bot_leases.holder = excluded.holder
+                               then bot_leases.acquired_at else now() end
+        where bot_leases.holder = excluded.holder or bot_leases.expires_at < now()
+    returning holder into won;
+    return won is not null;
+end;
+$$ language plpgsql;
+
+create or replace function release_lease(p_name text, p_holder text)
+returns void as $$
+    delete from bot_leases where name = p_name and holder = p_holder;
+$$ language sql;
+
+-- Start of each catch-up job's last successful run, shared by all replicas
+create table if not exists bot_task_cursors (
+    task text primary key,
+    last_ok timestamptz not null
+);
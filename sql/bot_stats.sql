@@ -0,0 +1,22 @@
+-- All /stats counters in one round-trip (commands/admin.py falls back to separate counts without it)
+create or replace function bot_stats(month_ago timestamptz, week_ago timestamptz)
+returns json
+language sql
+stable
+as $$
+    select json_build_object(
+        'total',        (select count(*) from role_redeem),
+        'monthly',      (select count(*) from role_redeem where redeemed_at >= month_ago),
+        'weekly',       (select count(*) from role_redeem where redeemed_at >= week_ago),
+        'active',       (select count(*) from role_redeem where whitelisted),
+        'open_tickets', (select count(*) from tickets where status = 'open'),
+        'variants',     coalesce((
+            select json_object_agg(variant, n)
+            from (
+                select coalesce(variant_name, 'Unknown') as variant, count(*) as n
+                from role_redeem
+                group by 1
+            ) v
+        ), '{}'::json)
+    );
+$$;
@@ -0,0 +1,37 @@
+-- Durable redeem claims (utils/claims.py). A claim is inserted before a redeem grants
+-- anything, so two replicas (or a retry after a crash mid-grant) can't both grant the
+-- same invoice. Finalized (status = 'done') once the role_redeem row is committed.
+create table if not exists redeem_claims (
+    invoice_id text primary key,
+    discord_id bigint not null,
+    holder text not null,
+    status text not null default 'pending',  -- pending | done
+    claimed_at timestamptz not null default now(),
+    done_at timestamptz
+);
+
+-- Take the claim if nobody holds it. With p_takeover_after_seconds, a claim still
+-- pending after that long (interrupted redeem) is taken over instead. Atomic.
+create or replace function claim_redeem(
+    p_invoice_id text,
+    p_discord_id bigint,
+    p_holder text,
+    p_takeover_after_seconds integer default null
+)
+returns boolean as $$
+declare
+    won text;
+begin
+    insert into redeem_claims (invoice_id, discord_id, holder, status, claimed_at)
+    values (p_invoice_id, p_discord_id, p_holder, 'pending', now())
+    on conflict (invoice_id) do update
+        set discord_id = excluded.discord_id,
+            holder = excluded.holder,
+            claimed_at = now()
+        where p_takeover_after_seconds is not null
+          and redeem_claims.status = 'pending'
+          and redeem_claims.claimed_at < now() - make_interval(secs => p_takeover_after_seconds)
+    returning invoice_id into won;
+    return won is not null;
+end;
+$$ language plpgsql;
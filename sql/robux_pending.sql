@@ -0,0 +1,25 @@
+-- Pending Robux gamepass purchases watched by commands/robux.py
+create table if not exists robux_pending (
+    id bigserial primary key,
+    discord_id bigint not null,
+    channel_id bigint not null,
+    ticket_id bigint,
+    roblox_username text not null,
+    roblox_user_id bigint not null,
+    gamepass_id bigint,
+    status text not null default 'pending',  -- pending | fulfilled | expired | cancelled
+    created_at timestamptz not null default now(),
+    fulfilled_at timestamptz
+);
+
+create index if not exists robux_pending_status_idx on robux_pending (status);
+
+-- Code the buyer puts in their Roblox profile to prove the account is theirs
+alter table robux_pending add column if not exists verify_code text;
+create index if not exists gamepass_redemptions_roblox_user_idx on gamepass_redemptions (roblox_user_id);
+
+-- A pass can only be redeemed once per Roblox account. The redemption row is inserted
+-- before access is granted, so this makes a concurrent second fulfilment fail instead
+-- of granting twice. (Remove duplicate rows first if creating it fails.)
+create unique index if not exists gamepass_redemptions_user_pass_uidx
+    on gamepass_redemptions (roblox_user_id, gamepass_id);
@@ -0,0 +1,3 @@
+-- Keyset pagination for /userlookup purchase history (utils/history.py)
+create index if not exists role_redeem_discord_history_idx
+    on role_redeem (discord_id, redeemed_at desc, id desc);
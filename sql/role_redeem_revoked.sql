@@ -0,0 +1,5 @@
+-- Refund/chargeback revocation flag for the SellAuth sweeper (utils/refunds.py)
+alter table role_redeem add column if not exists revoked_at timestamptz;
+alter table role_redeem add column if not exists revoke_reason text;
+
+create index if not exists role_redeem_invoice_id_idx on role_redeem (invoice_id);
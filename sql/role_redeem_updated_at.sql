@@ -0,0 +1,17 @@
+-- Change tracking for the Luarmor drift reconciler (utils/reconcile.py)
+alter table role_redeem add column if not exists updated_at timestamptz not null default now();
+
+create or replace function role_redeem_touch_updated_at() returns trigger as $$
+begin
+    new.updated_at = now();
+    return new;
+end;
+$$ language plpgsql;
+
+drop trigger if exists role_redeem_touch_updated_at on role_redeem;
+create trigger role_redeem_touch_updated_at
+    before update on role_redeem
+    for each row execute function role_redeem_touch_updated_at();
+
+create index if not exists role_redeem_updated_at_idx on role_redeem (updated_at);
+create index if not exists role_redeem_whitelisted_discord_idx on role_redeem (whitelisted, discord_id);
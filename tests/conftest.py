@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Local SQLite state (events, outbox, ...) goes to a throwaway directory, never ./data
+os.environ.setdefault("BOT_DATA_DIR", tempfile.mkdtemp(prefix="shopbot-tests-"))
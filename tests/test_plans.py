@@ -0,0 +1,139 @@
+"""
+Plan resolution fuzz tests. Run from the repo root: python -m pytest -q
+
+Every product/variant pair in plan_names.txt (dumped from role_redeem) must
+resolve, and agree with a naive reading of the name. Generated names check
+that counts multiply and that unrecognised names raise instead of becoming
+lifetime.
+"""
+import os
+import random
+import re
+from datetime import datetime, timezone
+
+import pytest
+
+from utils.plans import UNIT_DAYS, UnknownPlanError, compute_expiry, order_expiry, plan_for_days, resolve_plan
+
+NAMES_PATH = os.path.join(os.path.dirname(__file__), "plan_names.txt")
+SEED = 20261019
+
+
+def _seen_names():
+    with open(NAMES_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                product, _, variant = line.partition("|")
+                yield product.strip() or None, variant.strip() or None
+
+
+def _expected_days(text: str):
+    """Independent, deliberately simple reading of a name. None = lifetime, False = no idea."""
+    t = text.lower()
+    m = re.search(r"(\d+)\s*-?\s*(day|week|month|year)s?\b", t)
+    if m:
+        return int(m.group(1)) * UNIT_DAYS[m.group(2)]
+    if "life" in t or "perm" in t:
+        return None
+    for word, days in (("day", 1), ("week", 7), ("month", 30), ("year", 365), ("annual", 365)):
+        if re.search(rf"\b{word}(s|ly)?\b", t):
+            return days
+    return False
+
+
+@pytest.mark.parametrize("product,variant", list(_seen_names()))
+def test_seen_names_resolve(product, variant):
+    plan = resolve_plan(product, variant)
+    expected = _expected_days(variant or "")
+    if expected is False:
+        expected = _expected_days(product or "")
+    assert expected is not False, f"fixture name nobody can read: {product!r} | {variant!r}"
+    assert plan.days == expected
+
+
+@pytest.mark.parametrize("variant,days", [
+    ("Week", 7),
+    ("Month", 30),
+    ("Year", 365),
+    ("Lifetime", None),
+    ("Life Time", None),
+    ("Permanent", None),
+    ("1 Day", 1),
+    ("2 Weeks", 14),
+    ("3 Months", 90),
+    ("2 Years", 730),
+    ("14d", 14),
+    ("3-month", 90),
+    ("Weekly", 7),
+    ("Monthly", 30),
+    ("Annual", 365),
+])
+def test_known_variants(variant, days):
+    assert resolve_plan("Script Union - Fix it up", variant).days == days
+
+
+def test_plan_names_use_singular_for_one():
+    assert resolve_plan(None, "1 Day").name == "1 Day"
+    assert resolve_plan(None, "2 Weeks").name == "2 Weeks"
+    assert plan_for_days(1).name == "1 Day"
+
+
+@pytest.mark.parametrize("variant", ["Weekend", "Standard", "Default", "", "0 days", "Premium", "3D Pack", "2w Bundle"])
+def test_unknown_names_raise(variant):
+    with pytest.raises(UnknownPlanError):
+        resolve_plan("Fix-It-Up Premium Script", variant)
+
+
+@pytest.mark.parametrize("product,variant", [
+    ("Aged Alt Account", "Aged Alt Account"),
+    ("Roblox Alt", "Bundle"),
+    ("Roblox Alt", "Default"),
+    ("3D Pack", None),
+])
+def test_products_without_a_key_have_no_expiry(product, variant):
+    # Not whitelisted on Luarmor: redeems with expires_at = None, never sent to staff
+    assert order_expiry(product, variant) is None
+
+
+def test_whitelisted_products_still_need_a_plan():
+    assert order_expiry("Script Union - Fix it up", "Month").expires_at is not None
+    assert order_expiry("Script Union - Fix it up", "Lifetime").lifetime
+    with pytest.raises(UnknownPlanError):
+        order_expiry("Script Union - Fix it up", "Bundle")
+
+
+def test_variant_wins_over_product():
+    assert resolve_plan("Script Union - Fix it up (Lifetime)", "Month").days == 30
+    assert resolve_plan("Script Union - Fix it up (Week)", None).days == 7
+
+
+def test_fuzz_counts_multiply():
+    rng = random.Random(SEED)
+    for _ in range(2000):
+        count = rng.randint(1, 400)
+        unit = rng.choice(list(UNIT_DAYS))
+        word = unit + ("s" if count != 1 or rng.random() < 0.3 else "")
+        word = "".join(c.upper() if rng.random() < 0.5 else c for c in word)
+        sep = rng.choice(["", " ", "  ", "-", " - "])
+        name = f"{rng.choice(['', 'Fix it up ', 'Premium (', '['])}{count}{sep}{word}{rng.choice(['', ')', ' access', ']'])}"
+        assert resolve_plan(None, name).days == count * UNIT_DAYS[unit], name
+
+
+def test_fuzz_unrecognised_never_lifetime():
+    rng = random.Random(SEED)
+    alphabet = "abcfghijknopqrstuvxz _-()"  # no unit words or "life" can be spelled from these
+    for _ in range(2000):
+        name = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 30)))
+        with pytest.raises(UnknownPlanError):
+            resolve_plan(None, name)
+
+
+def test_db_and_luarmor_expiry_agree():
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for product, variant in _seen_names():
+        expiry = compute_expiry(product, variant, now)
+        if expiry.lifetime:
+            assert expiry.expires_at is None
+        else:
+            assert int(datetime.fromisoformat(expiry.expires_at).timestamp()) == expiry.auth_expire
@@ -0,0 +1,200 @@
+"""
+Supabase round-trips per budgeted command. Run from the repo root: python -m pytest -q
+
+Each @query_budget callback runs against utils.memory_db.MemoryClient inside
+track(), with Discord objects faked and Luarmor/SellAuth calls patched out. The
+count must equal what the command is expected to make and stay within the
+budget on its decorator. Needs discord.py (skipped without it).
+"""
+import asyncio
+import glob
+import os
+import types
+
+import pytest
+
+pytest.importorskip("discord")
+
+from utils import keypool  # noqa: E402
+from utils.memory_db import MemoryClient  # noqa: E402
+from utils.queries import track  # noqa: E402
+from utils.supabase import reset_client, set_client  # noqa: E402
+
+from commands import admin, checkorder, code_redeem, role_redeem  # noqa: E402
+
+STAFF_ROLE_ID = next(iter(admin.ADMIN_STAFF_ROLE_IDS))
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str = "Role"):
+        self.id = role_id
+        self.name = name
+
+
+class FakeMessage:
+    async def edit(self, **_):
+        pass
+
+
+class FakeMember:
+    def __init__(self, member_id: int, role_ids=()):
+        self.id = member_id
+        self.roles = [FakeRole(r) for r in role_ids]
+        self.mention = f"<@{member_id}>"
+        self.display_avatar = types.SimpleNamespace(url="https://example.invalid/avatar.png")
+
+    async def add_roles(self, *roles, **_):
+        self.roles.extend(roles)
+
+    async def remove_roles(self, *roles, **_):
+        self.roles = [r for r in self.roles if r not in roles]
+
+    async def send(self, *_, **__):
+        return FakeMessage()
+
+    def __str__(self):
+        return f"member{self.id}"
+
+
+class FakeGuild:
+    def get_role(self, role_id):
+        return FakeRole(role_id)
+
+
+class FakeResponse:
+    def __init__(self, sent):
+        self._sent = sent
+
+    async def defer(self, **_):
+        pass
+
+    async def send_message(self, content=None, **kwargs):
+        self._sent.append(content or kwargs)
+
+
+class FakeFollowup:
+    def __init__(self, sent):
+        self._sent = sent
+
+    async def send(self, content=None, **kwargs):
+        self._sent.append(content or kwargs)
+        return FakeMessage()
+
+
+class FakeInteraction:
+    def __init__(self, user: FakeMember):
+        self.sent = []
+        self.user = user
+        self.guild = FakeGuild()
+        self.client = types.SimpleNamespace(get_guild=lambda _id: self.guild)
+        self.response = FakeResponse(self.sent)
+        self.followup = FakeFollowup(self.sent)
+
+
+@pytest.fixture
+def db():
+    client = MemoryClient()
+    set_client(client)
+    yield client
+    reset_client()
+
+
+def _run(callback, *args, **kwargs) -> int:
+    """Round-trips made by one invocation; also checks the decorator's budget."""
+    with track("test") as tally:
+        asyncio.run(callback(*args, **kwargs))
+    assert tally.count <= callback.query_budget, tally.targets
+    return tally.count
+
+
+def _cog(**attrs):
+    # Callbacks only use self.bot, so the cog itself (and its task loops) isn't needed
+    return types.SimpleNamespace(**attrs)
+
+
+def _staff():
+    return FakeInteraction(FakeMember(1, role_ids=[STAFF_ROLE_ID]))
+
+
+async def _nothing(*_, **__):
+    return None
+
+
+def test_whitelist(db, monkeypatch):
+    async def provision(*_, **__):
+        return {"user_key": "k", "expires_at": None}
+
+    monkeypatch.setattr(keypool, "provision", provision)
+    assert _run(admin.Admin.whitelist.callback, _cog(), _staff(), FakeMember(2), 7) == 1
+
+
+def test_blacklist_and_unblacklist(db, monkeypatch):
+    monkeypatch.setattr(admin, "delete_user_by_discord", _nothing)
+    assert _run(admin.Admin.blacklist.callback, _cog(), _staff(), FakeMember(2), "chargeback") == 2
+    assert _run(admin.Admin.unblacklist.callback, _cog(), _staff(), FakeMember(2)) == 2
+
+
+def test_applyref(db, monkeypatch):
+    monkeypatch.setattr(admin, "add_time_to_user", _nothing)
+    db.table("referrals").insert({
+        "referral_code": "REF-ABC123", "referrer_discord_id": 3, "bonus_days_per_referral": 3, "uses": 0,
+    }).execute()
+    assert _run(admin.Admin.applyref.callback, _cog(), _staff(), "ref-abc123", FakeMember(2)) == 4
+
+
+def test_referrals(db):
+    db.table("referrals").insert({
+        "referral_code": "REF-ABC123", "referrer_discord_id": 1, "bonus_days_per_referral": 3, "uses": 1,
+    }).execute()
+    db.table("referral_uses").insert({"referrer_discord_id": 1, "referred_discord_id": 2}).execute()
+    assert _run(admin.Admin.referrals.callback, _cog(), _staff()) == 2
+
+
+def test_stats_with_rpc(db):
+    db.register_rpc("bot_stats", lambda _client, **_: {
+        "total": 0, "monthly": 0, "weekly": 0, "active": 0, "open_tickets": 0, "variants": {},
+    })
+    assert _run(admin.Admin.stats.callback, _cog(), _staff()) == 1
+
+
+def test_stats_fallback_stays_in_budget(db):
+    # bot_stats not installed: the failed RPC plus six separate counts
+    assert _run(admin.Admin.stats.callback, _cog(), _staff()) == 7
+
+
+def test_role_redeem(db):
+    db.table("role_redeem").insert({"code": "abc", "role_id": 42}).execute()
+    cog = _cog(bot=types.SimpleNamespace(get_guild=lambda _id: FakeGuild()))
+    interaction = FakeInteraction(FakeMember(2))
+    assert _run(role_redeem.RoleRedeem.role_redeem.callback, cog, interaction, "abc") == 2
+
+
+def test_redeem_button(db, tmp_path):
+    product = tmp_path / "product.txt"
+    product.write_text("file")
+    db.table("role_redeem").insert({"role_id": 42, "redeemed": False}).execute()
+    button = types.SimpleNamespace(required_role=42, product_path=str(product), label="Product")
+    interaction = FakeInteraction(FakeMember(2, role_ids=[42]))
+    assert _run(code_redeem.DynamicRedeemButton.callback, button, interaction) == 2
+
+
+def test_checkorder(db, monkeypatch):
+    monkeypatch.setattr(checkorder, "fetch_invoice", _nothing)
+    cog = _cog()
+    assert _run(checkorder.CheckOrder.checkorder.callback, cog, _staff(), "inv-1, inv-2") == 1
+
+
+def test_every_budget_is_tested():
+    # A budgeted command without a test above would drift unnoticed
+    tested = {"whitelist", "blacklist", "unblacklist", "applyref", "referrals", "stats",
+              "role_redeem", "callback", "checkorder"}
+    commands_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "commands")
+    declared = set()
+    for path in glob.glob(os.path.join(commands_dir, "*.py")):
+        with open(path, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f.read().splitlines()]
+        for i, line in enumerate(lines):
+            if line.startswith("@query_budget("):
+                func = next(l for l in lines[i + 1:] if l.startswith("async def "))
+                declared.add(func[len("async def "):].split("(")[0])
+    assert declared <= tested, f"add a test for: {sorted(declared - tested)}"
@@ -0,0 +1,175 @@
+"""
+Admission control: turn away abusive or malformed traffic before it costs I/O.
+
+- Per-user token buckets per scope (redeem, ticket, command).
+- A global concurrency cap per upstream (SellAuth, Luarmor); callers that can't
+  get a slot within UPSTREAM_QUEUE_SECONDS are rejected instead of piling up.
+- Invoice ID format pre-validation.
+- A negative cache of invoice IDs SellAuth recently said don't exist.
+
+Every rejection is counted in utils.metrics as admission.rejected.<reason>.
+"""
+import re
+import time
+import asyncio
+import functools
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Tuple
+
+import discord
+
+from utils import metrics
+
+# scope -> (burst capacity, tokens refilled per second)
+RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "redeem": (3, 1 / 20),     # 3 quick tries, then one every 20s
+    "ticket": (2, 1 / 30),
+    "command": (5, 1 / 3),
+}
+MAX_TRACKED_BUCKETS = 10_000
+
+# upstream -> max in-flight requests across the whole bot
+UPSTREAM_LIMITS: Dict[str, int] = {
+    "sellauth": 6,
+    "luarmor": 4,
+}
+UPSTREAM_QUEUE_SECONDS = 5.0
+
+INVOICE_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{2,63}$")
+
+MISSING_TTL_SECONDS = 600
+MAX_MISSING_ENTRIES = 5_000
+
+
+class UpstreamBusy(RuntimeError):
+    """Raised when an upstream's concurrency cap stays full for UPSTREAM_QUEUE_SECONDS."""
+
+
+def reject(reason: str) -> None:
+    metrics.incr(f"admission.rejected.{reason}")
+
+
+# -----------------------------
+# TOKEN BUCKETS
+# -----------------------------
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consume one token. Returns 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+_buckets: "OrderedDict[Tuple[str, int], TokenBucket]" = OrderedDict()
+
+
+def check_rate(scope: str, user_id: int) -> float:
+    """0 if the user may proceed, otherwise seconds to wait (and the rejection is counted)."""
+    capacity, rate = RATE_LIMITS[scope]
+    key = (scope, user_id)
+    bucket = _buckets.get(key)
+    if bucket is None:
+        bucket = TokenBucket(capacity, rate)
+        _buckets[key] = bucket
+        if len(_buckets) > MAX_TRACKED_BUCKETS:
+            _buckets.popitem(last=False)
+    else:
+        _buckets.move_to_end(key)
+
+    wait = bucket.take()
+    if wait:
+        reject(f"rate_{scope}")
+    return wait
+
+
+def rate_limited(scope: str = "command"):
+    """
+    Decorator for interaction callbacks (commands, buttons, selects): answer with a
+    "slow down" message instead of running the callback when the user is over their rate.
+    Put it directly above the function, below the app_commands/ui decorators.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            interaction = next((a for a in args if isinstance(a, discord.Interaction)), None)
+            if interaction is not None:
+                wait = check_rate(scope, interaction.user.id)
+                if wait:
+                    await interaction.response.send_message(
+                        f"You're doing that too fast. Try again in {int(wait) + 1}s.", ephemeral=True
+                    )
+                    return
+            return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# -----------------------------
+# UPSTREAM CONCURRENCY
+# -----------------------------
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+@asynccontextmanager
+async def upstream(name: str) -> AsyncIterator[None]:
+    """Hold one of the upstream's slots for the duration of the block."""
+    semaphore = _semaphores.get(name)
+    if semaphore is None:
+        semaphore = _semaphores[name] = asyncio.Semaphore(UPSTREAM_LIMITS[name])
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=UPSTREAM_QUEUE_SECONDS)
+    except asyncio.TimeoutError:
+        reject(f"busy_{name}")
+        raise UpstreamBusy(f"{name} is at its concurrency cap") from None
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+# -----------------------------
+# INVOICE IDS
+# -----------------------------
+def valid_invoice_id(invoice_id: str) -> bool:
+    if INVOICE_ID_PATTERN.match(invoice_id or ""):
+        return True
+    reject("invoice_format")
+    return False
+
+
+_missing: "OrderedDict[str, float]" = OrderedDict()
+
+
+def remember_missing(invoice_id: str) -> None:
+    _missing[invoice_id] = time.monotonic() + MISSING_TTL_SECONDS
+    _missing.move_to_end(invoice_id)
+    while len(_missing) > MAX_MISSING_ENTRIES:
+        _missing.popitem(last=False)
+
+
+def forget_missing(invoice_id: str) -> None:
+    _missing.pop(invoice_id, None)
+
+
+def recently_missing(invoice_id: str) -> bool:
+    expires = _missing.get(invoice_id)
+    if expires is None:
+        return False
+    if expires < time.monotonic():
+        del _missing[invoice_id]
+        return False
+    reject("invoice_missing")
+    return True
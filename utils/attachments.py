@@ -0,0 +1,272 @@
+"""
+Content-addressed store for ticket attachments (data/attachments/).
+
+Discord CDN links expire, so the close path downloads every attachment into
+data/attachments/<aa>/<bb>/<sha256>. Identical files (the same receipt posted
+three times) are stored once; data/attachments.db records which transcript
+referenced which blob under which filename.
+"""
+import os
+import time
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+import aiohttp
+from aiohttp import ClientTimeout
+
+from utils import metrics
+from utils.localdb import connect, lock_for, data_path
+
+DB_NAME = "attachments"
+
+MAX_CONCURRENT_DOWNLOADS = 4
+MAX_ATTACHMENT_BYTES = 25 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT = ClientTimeout(total=120, sock_read=30)
+
+# fetch() stores a blob before the transcript is linked to it; gc leaves blobs
+# fetched this recently alone so it can't delete one in between
+GC_GRACE_SECONDS = 24 * 3600
+
+_SCHEMA = """
+create table if not exists blobs (
+    sha256 text primary key,
+    size integer not null,
+    content_type text,
+    stored_at real not null
+);
+create table if not exists refs (
+    transcript_id integer not null,
+    sha256 text not null,
+    filename text not null
+);
+create index if not exists refs_transcript_idx on refs (transcript_id);
+create index if not exists refs_sha_idx on refs (sha256);
+"""
+
+# Columns added after the first release (older data/attachments.db files lack them)
+_ADDED_COLUMNS = {"fetched_at": "real"}  # last time fetch() returned the blob
+
+_ready = False
+_session: Optional[aiohttp.ClientSession] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+@dataclass
+class StoredAttachment:
+    filename: str
+    url: str
+    sha256: Optional[str] = None
+    size: int = 0
+    duplicate: bool = False
+    error: Optional[str] = None
+
+
+def _db():
+    global _ready
+    conn = connect(DB_NAME)
+    if not _ready:
+        with lock_for(DB_NAME):
+            conn.executescript(_SCHEMA)
+            have = {r["name"] for r in conn.execute("pragma table_info(blobs)").fetchall()}
+            for column, kind in _ADDED_COLUMNS.items():
+                if column not in have:
+                    conn.execute(f"alter table blobs add column {column} {kind}")
+        _ready = True
+    return conn
+
+
+def _get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(timeout=DOWNLOAD_TIMEOUT)
+    return _session
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    return _semaphore
+
+
+async def close() -> None:
+    if _session and not _session.closed:
+        await _session.close()
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(os.path.dirname(data_path("attachments.db")), "attachments", sha256[:2], sha256[2:4], sha256)
+
+
+def _tmp_path() -> str:
+    folder = os.path.join(os.path.dirname(data_path("attachments.db")), "attachments", "tmp")
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{os.getpid()}-{time.monotonic_ns()}.part")
+
+
+# -----------------------------
+# DOWNLOAD
+# -----------------------------
+async def fetch(url: str, filename: str, size_hint: Optional[int] = None) -> StoredAttachment:
+    """Stream one attachment into the store (bounded concurrency, size-capped, SHA-256 deduped)."""
+    result = StoredAttachment(filename=filename, url=url)
+    if size_hint and size_hint > MAX_ATTACHMENT_BYTES:
+        result.error = f"too large ({size_hint} bytes)"
+        metrics.incr("attachments.skipped_too_large")
+        return result
+
+    async with _get_semaphore():
+        tmp = _tmp_path()
+        digest = hashlib.sha256()
+        size = 0
+        content_type = None
+        try:
+            with metrics.timer("attachments.download"):
+                async with _get_session().get(url) as resp:
+                    if resp.status != 200:
+                        result.error = f"HTTP {resp.status}"
+                        return result
+                    content_type = resp.headers.get("Content-Type")
+                    with open(tmp, "wb") as f:
+                        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                            size += len(chunk)
+                            if size > MAX_ATTACHMENT_BYTES:
+                                result.error = "too large"
+                                metrics.incr("attachments.skipped_too_large")
+                                return result
+                            digest.update(chunk)
+                            f.write(chunk)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            result.error = str(e) or type(e).__name__
+            return result
+        finally:
+            if result.error and os.path.exists(tmp):
+                os.remove(tmp)
+
+    result.sha256 = digest.hexdigest()
+    result.size = size
+    metrics.incr("attachments.bytes_downloaded", size)
+
+    final = blob_path(result.sha256)
+    conn = _db()
+    # Under the DB lock, so gc can't remove the blob between this check and fetched_at being set
+    with lock_for(DB_NAME):
+        if os.path.exists(final):
+            os.remove(tmp)
+            result.duplicate = True
+        else:
+            os.makedirs(os.path.dirname(final), exist_ok=True)
+            os.replace(tmp, final)
+        now = time.time()
+        conn.execute(
+            "insert into blobs (sha256, size, content_type, stored_at, fetched_at) values (?, ?, ?, ?, ?)"
+            " on conflict (sha256) do update set fetched_at = excluded.fetched_at",
+            (result.sha256, size, content_type, now, now),
+        )
+    if result.duplicate:
+        metrics.incr("attachments.duplicates")
+        metrics.incr("attachments.bytes_deduped", size)
+    metrics.incr("attachments.stored")
+    return result
+
+
+def link(transcript_id: int, stored: Iterable[StoredAttachment]) -> None:
+    """Record which blobs a transcript references."""
+    rows = [(transcript_id, s.sha256, s.filename) for s in stored if s.sha256]
+    if not rows:
+        return
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.executemany("insert into refs (transcript_id, sha256, filename) values (?, ?, ?)", rows)
+
+
+def summarize(stored: List[StoredAttachment], elapsed: float) -> str:
+    """One log line: files, bytes, throughput and what dedupe saved."""
+    ok = [s for s in stored if s.sha256]
+    total = sum(s.size for s in ok)
+    saved = sum(s.size for s in ok if s.duplicate)
+    failed = len(stored) - len(ok)
+    rate = total / elapsed / 1e6 if elapsed > 0 else 0.0
+    return (
+        f"{len(ok)}/{len(stored)} file(s), {total / 1e6:.2f} MB in {elapsed:.2f}s ({rate:.2f} MB/s), "
+        f"{sum(1 for s in ok if s.duplicate)} duplicate(s) ({saved / 1e6:.2f} MB saved)"
+        + (f", {failed} failed" if failed else "")
+    )
+
+
+# -----------------------------
+# LOOKUP / MAINTENANCE
+# -----------------------------
+def find(sha_prefix: str) -> Optional[dict]:
+    """Blob row (plus one known filename) for a full or abbreviated SHA-256."""
+    prefix = sha_prefix.strip().lower()
+    if len(prefix) < 8:
+        return None
+    conn = _db()
+    with lock_for(DB_NAME):
+        rows = conn.execute(
+            "select b.*, (select filename from refs r where r.sha256 = b.sha256 limit 1) as filename"
+            " from blobs b where b.sha256 >= ? and b.sha256 < ? limit 2",
+            (prefix, prefix + "g"),
+        ).fetchall()
+    if len(rows) != 1:
+        return None
+    return dict(rows[0])
+
+
+def forget_transcripts(transcript_ids: List[int]) -> None:
+    if not transcript_ids:
+        return
+    conn = _db()
+    with lock_for(DB_NAME):
+        for i in range(0, len(transcript_ids), 500):
+            chunk = transcript_ids[i:i + 500]
+            conn.execute(f"delete from refs where transcript_id in ({','.join('?' * len(chunk))})", chunk)
+
+
+def gc(grace_seconds: float = GC_GRACE_SECONDS) -> int:
+    """
+    Delete blobs no transcript references any more. Blobs fetched within
+    grace_seconds are kept (their transcript may not be linked yet). Returns bytes freed.
+    """
+    cutoff = time.time() - grace_seconds
+    unreferenced = (
+        "sha256 not in (select distinct sha256 from refs) and coalesce(fetched_at, stored_at) < ?"
+    )
+    conn = _db()
+    with lock_for(DB_NAME):
+        rows = conn.execute(f"select sha256, size from blobs where {unreferenced}", (cutoff,)).fetchall()
+    freed = 0
+    for row in rows:
+        with lock_for(DB_NAME):
+            # Re-checked per blob: a fetch or link since the select keeps it
+            deleted = conn.execute(
+                f"delete from blobs where sha256 = ? and {unreferenced}", (row["sha256"], cutoff)
+            ).rowcount
+            if not deleted:
+                continue
+            try:
+                os.remove(blob_path(row["sha256"]))
+            except FileNotFoundError:
+                pass
+        freed += row["size"]
+    return freed
+
+
+def stats() -> dict:
+    conn = _db()
+    with lock_for(DB_NAME):
+        stored = conn.execute("select count(*), coalesce(sum(size), 0) from blobs").fetchone()
+        referenced = conn.execute(
+            "select count(*), coalesce(sum(b.size), 0) from refs r join blobs b on b.sha256 = r.sha256"
+        ).fetchone()
+    return {
+        "blobs": stored[0],
+        "stored_bytes": stored[1],
+        "refs": referenced[0],
+        "referenced_bytes": referenced[1],
+        "saved_bytes": referenced[1] - stored[1],
+    }
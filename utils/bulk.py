@@ -0,0 +1,117 @@
+import asyncio
+import csv
+import io
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class RateLimiter:
+    """Spaces calls out to at most `rate` per second across all callers."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = asyncio.Lock()
+        self._next_at = 0.0
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if self._next_at > now:
+                await asyncio.sleep(self._next_at - now)
+                now = self._next_at
+            self._next_at = now + self.interval
+
+
+@dataclass
+class BulkResult:
+    item: Dict[str, Any]
+    ok: bool
+    detail: str = ""
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+# worker(item) -> (ok, detail) or (ok, detail, extra)
+Worker = Callable[[Dict[str, Any]], Awaitable[Tuple]]
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+async def run_bulk(
+    items: Sequence[Dict[str, Any]],
+    worker: Worker,
+    concurrency: int = 4,
+    rate_per_sec: float = 3.0,
+    on_progress: Optional[ProgressCallback] = None,
+    progress_interval: float = 2.0,
+) -> List[BulkResult]:
+    """
+    Run `worker` over every item with bounded concurrency and a shared rate limit.
+    Results keep input order. `on_progress(done, total)` is throttled to one call
+    per `progress_interval` seconds, plus a final call at the end.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate_per_sec)
+    results: List[Optional[BulkResult]] = [None] * len(items)
+    done = 0
+    last_progress = 0.0
+
+    async def _run(index: int, item: Dict[str, Any]):
+        nonlocal done, last_progress
+        async with semaphore:
+            await limiter.wait()
+            try:
+                outcome = await worker(item)
+                ok, detail = outcome[0], outcome[1]
+                extra = outcome[2] if len(outcome) > 2 else {}
+                results[index] = BulkResult(item, bool(ok), str(detail), extra)
+            except Exception as e:
+                results[index] = BulkResult(item, False, f"error: {e}")
+
+        done += 1
+        if on_progress and time.monotonic() - last_progress >= progress_interval:
+            last_progress = time.monotonic()
+            try:
+                await on_progress(done, len(items))
+            except Exception as e:
+                print(f"[BULK] Progress update failed: {e}")
+
+    await asyncio.gather(*(_run(i, item) for i, item in enumerate(items)))
+
+    if on_progress:
+        try:
+            await on_progress(len(items), len(items))
+        except Exception as e:
+            print(f"[BULK] Progress update failed: {e}")
+
+    return [r for r in results if r is not None]
+
+
+def read_csv_rows(data: bytes, columns: Sequence[str]) -> List[Dict[str, str]]:
+    """
+    Parse an uploaded CSV into dicts keyed by `columns`.
+    A header row is skipped if its first cell isn't a number. Blank lines are ignored.
+    """
+    text = data.decode("utf-8-sig", errors="replace")
+    rows = []
+    for line_no, raw in enumerate(csv.reader(io.StringIO(text)), start=1):
+        cells = [c.strip() for c in raw]
+        if not any(cells):
+            continue
+        if line_no == 1 and cells[0] and not cells[0].isdigit():
+            continue
+        row = {"line": str(line_no)}
+        for i, col in enumerate(columns):
+            row[col] = cells[i] if i < len(cells) else ""
+        rows.append(row)
+    return rows
+
+
+def results_to_csv(results: Iterable[BulkResult], columns: Sequence[str]) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow([*columns, "status", "detail"])
+    for r in results:
+        writer.writerow([*(r.item.get(c, "") for c in columns), "ok" if r.ok else "failed", r.detail])
+    return out.getvalue().encode("utf-8")
@@ -0,0 +1,124 @@
+"""
+Durable "this invoice is being redeemed" claims.
+
+A claim is taken right before anything is granted and finalized once the redeem
+is committed to the outbox. A crash in between leaves a pending claim behind, so
+the invoice reads as already redeemed instead of being granted a second time
+(staff /redeem can take over a claim left pending for STALE_SECONDS).
+
+Each claim is written to data/claims.db first and then to Supabase
+(redeem_claims, see sql/redeem_claims.sql). The Supabase row is what makes a
+claim hold across replicas; the local row lets this replica refuse a repeat
+without a round-trip. Taking a claim needs Supabase, like the redeem checks do.
+"""
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from utils import outbox
+from utils.localdb import connect, lock_for
+from utils.supabase import get_supabase, execute_async
+from utils.leader import INSTANCE_ID
+
+DB_NAME = "claims"
+
+STALE_SECONDS = 600  # a pending claim this old was interrupted (crash/restart mid-grant)
+
+_SCHEMA = """
+create table if not exists claims (
+    invoice_id text primary key,
+    discord_id integer not null,
+    status text not null,           -- pending | done
+    claimed_at real not null
+);
+"""
+
+_ready = False
+
+supabase = get_supabase()
+
+
+def _db():
+    global _ready
+    conn = connect(DB_NAME)
+    if not _ready:
+        with lock_for(DB_NAME):
+            conn.executescript(_SCHEMA)
+        _ready = True
+    return conn
+
+
+def _forget(invoice_id: str) -> None:
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.execute("delete from claims where invoice_id = ?", (invoice_id,))
+
+
+def status(invoice_id: str) -> Optional[str]:
+    """Local claim status ("pending" | "done"), or None if this replica never claimed it."""
+    conn = _db()
+    with lock_for(DB_NAME):
+        row = conn.execute("select status from claims where invoice_id = ?", (invoice_id,)).fetchone()
+    return row["status"] if row else None
+
+
+async def claim(invoice_id: str, discord_id: int, takeover_after: Optional[int] = None) -> bool:
+    """
+    Claim an invoice before granting it. False if it is already claimed here or on
+    another replica. takeover_after lets the caller take a claim that has been
+    pending that many seconds (staff only). Raises if Supabase can't be reached.
+    """
+    now = time.time()
+    conn = _db()
+    with lock_for(DB_NAME):
+        row = conn.execute("select status, claimed_at from claims where invoice_id = ?", (invoice_id,)).fetchone()
+        if row and not (
+            takeover_after is not None and row["status"] == "pending" and row["claimed_at"] < now - takeover_after
+        ):
+            return False
+        conn.execute(
+            "insert or replace into claims (invoice_id, discord_id, status, claimed_at) values (?, ?, 'pending', ?)",
+            (invoice_id, int(discord_id), now),
+        )
+
+    try:
+        resp = await execute_async(supabase.rpc("claim_redeem", {
+            "p_invoice_id": invoice_id,
+            "p_discord_id": int(discord_id),
+            "p_holder": INSTANCE_ID,
+            "p_takeover_after_seconds": takeover_after,
+        }))
+    except Exception:
+        _forget(invoice_id)
+        raise
+    if resp.data is not True:
+        _forget(invoice_id)
+        return False
+    return True
+
+
+def finalize(invoice_id: str) -> None:
+    """Mark a claim done once the redeem is in the outbox (the Supabase side is replayed from there)."""
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.execute("update claims set status = 'done' where invoice_id = ?", (invoice_id,))
+    outbox.enqueue(
+        "redeem_claims",
+        {"status": "done", "done_at": datetime.now(timezone.utc).isoformat()},
+        dedup_key=f"redeem_claim_done:{invoice_id}",
+        op="update",
+        match={"invoice_id": invoice_id},
+    )
+
+
+async def release(invoice_id: str) -> None:
+    """Give a claim back when the redeem stopped before granting anything."""
+    try:
+        await execute_async(
+            supabase.table("redeem_claims").delete().eq("invoice_id", invoice_id).eq("holder", INSTANCE_ID)
+        )
+    except Exception as e:
+        # The claim stays pending: the invoice reads as redeemed until staff look at it
+        print(f"[CLAIMS] Could not release claim on {invoice_id}: {e}")
+        return
+    _forget(invoice_id)
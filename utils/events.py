@@ -0,0 +1,182 @@
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import discord
+
+from utils.localdb import connect, lock_for
+
+DB_NAME = "events"
+DEFAULT_LOG_CHANNEL_ID = 1449252986911068273
+RETENTION_DAYS = 90  # posted events older than this are pruned (see prune())
+
+_SCHEMA = """
+create table if not exists events (
+    id integer primary key autoincrement,
+    created_at real not null,
+    kind text not null,
+    discord_id integer,
+    actor_id integer,
+    channel_id integer not null,
+    embed text not null,
+    posted_at real,
+    error text
+);
+create index if not exists events_unposted_idx on events (channel_id, id) where posted_at is null;
+create index if not exists events_discord_idx on events (discord_id, id);
+create index if not exists events_kind_idx on events (kind, id);
+create index if not exists events_created_idx on events (created_at);
+"""
+
+_ready = False
+
+
+@dataclass
+class Event:
+    id: int
+    created_at: float
+    kind: str
+    discord_id: Optional[int]
+    actor_id: Optional[int]
+    channel_id: int
+    embed: Dict[str, Any]
+    posted_at: Optional[float]
+    error: Optional[str]
+
+    def to_embed(self) -> discord.Embed:
+        return discord.Embed.from_dict(self.embed)
+
+
+def _db():
+    global _ready
+    conn = connect(DB_NAME)
+    if not _ready:
+        with lock_for(DB_NAME):
+            conn.executescript(_SCHEMA)
+        _ready = True
+    return conn
+
+
+def _row_to_event(row) -> Event:
+    return Event(
+        id=row["id"],
+        created_at=row["created_at"],
+        kind=row["kind"],
+        discord_id=row["discord_id"],
+        actor_id=row["actor_id"],
+        channel_id=row["channel_id"],
+        embed=json.loads(row["embed"]),
+        posted_at=row["posted_at"],
+        error=row["error"],
+    )
+
+
+def record(
+    kind: str,
+    embed: discord.Embed,
+    discord_id: Optional[int] = None,
+    actor_id: Optional[int] = None,
+    channel_id: int = DEFAULT_LOG_CHANNEL_ID,
+    post: bool = True,
+) -> int:
+    """
+    Append an event to the local journal. The log-channel post happens later,
+    batched by the flusher in commands/ops.py, so callers never wait on Discord.
+    post=False only journals it (for posts that carry files and are sent directly).
+    """
+    if not embed.timestamp:
+        embed.timestamp = discord.utils.utcnow()
+    now = time.time()
+    conn = _db()
+    with lock_for(DB_NAME):
+        cur = conn.execute(
+            "insert into events (created_at, kind, discord_id, actor_id, channel_id, embed, posted_at)"
+            " values (?, ?, ?, ?, ?, ?, ?)",
+            (
+                now,
+                kind,
+                int(discord_id) if discord_id else None,
+                int(actor_id) if actor_id else None,
+                int(channel_id),
+                json.dumps(embed.to_dict()),
+                None if post else now,
+            ),
+        )
+    return cur.lastrowid
+
+
+def unposted(limit: int = 100) -> List[Event]:
+    """Oldest events not yet posted to their log channel."""
+    conn = _db()
+    with lock_for(DB_NAME):
+        rows = conn.execute(
+            "select * from events where posted_at is null order by id limit ?", (limit,)
+        ).fetchall()
+    return [_row_to_event(r) for r in rows]
+
+
+def mark_posted(ids: List[int], error: Optional[str] = None) -> None:
+    if not ids:
+        return
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.executemany(
+            "update events set posted_at = ?, error = ? where id = ?",
+            [(time.time(), error, i) for i in ids],
+        )
+
+
+def prune(retention_days: int = RETENTION_DAYS) -> int:
+    """Drop posted events older than retention_days. Unposted events are never pruned."""
+    cutoff = time.time() - retention_days * 86400
+    conn = _db()
+    with lock_for(DB_NAME):
+        cur = conn.execute("delete from events where posted_at is not null and created_at < ?", (cutoff,))
+    return cur.rowcount
+
+
+def get(event_id: int) -> Optional[Event]:
+    conn = _db()
+    with lock_for(DB_NAME):
+        row = conn.execute("select * from events where id = ?", (int(event_id),)).fetchone()
+    return _row_to_event(row) if row else None
+
+
+def backlog() -> int:
+    conn = _db()
+    with lock_for(DB_NAME):
+        return conn.execute("select count(*) from events where posted_at is null").fetchone()[0]
+
+
+def query(
+    kind: Optional[str] = None,
+    discord_id: Optional[int] = None,
+    since: Optional[float] = None,
+    limit: int = 25,
+) -> List[Event]:
+    """Newest-first search over the journal. Matches the subject or the staff member who acted."""
+    clauses, params = [], []
+    if kind:
+        clauses.append("kind = ?")
+        params.append(kind)
+    if discord_id:
+        clauses.append("(discord_id = ? or actor_id = ?)")
+        params += [int(discord_id), int(discord_id)]
+    if since:
+        clauses.append("created_at >= ?")
+        params.append(since)
+    where = f"where {' and '.join(clauses)}" if clauses else ""
+
+    conn = _db()
+    with lock_for(DB_NAME):
+        rows = conn.execute(
+            f"select * from events {where} order by id desc limit ?", (*params, limit)
+        ).fetchall()
+    return [_row_to_event(r) for r in rows]
+
+
+def kinds() -> List[str]:
+    conn = _db()
+    with lock_for(DB_NAME):
+        return [r[0] for r in conn.execute("select distinct kind from events order by kind").fetchall()]
@@ -0,0 +1,72 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Source name -> (coroutine factory, deadline in seconds for the first render)
+Sources = Dict[str, Tuple[Callable[[], Awaitable[Any]], float]]
+
+
+@dataclass
+class SourceResult:
+    status: str  # "ok" | "pending" | "failed"
+    value: Any = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+
+def _result_of(task: asyncio.Task) -> SourceResult:
+    if task.cancelled():
+        return SourceResult("failed", error="cancelled")
+    exc = task.exception()
+    if exc is not None:
+        return SourceResult("failed", error=f"{type(exc).__name__}: {exc}"[:100])
+    return SourceResult("ok", task.result())
+
+
+async def fan_out(sources: Sources) -> Tuple[Dict[str, SourceResult], Dict[str, asyncio.Task]]:
+    """
+    Start every source at once and wait for each up to its own deadline.
+    Returns (results, still_running) - slow sources keep running in the background
+    so the caller can render now and fill them in later with collect_late().
+    """
+    tasks = {name: asyncio.create_task(factory()) for name, (factory, _) in sources.items()}
+
+    async def _wait(name: str, deadline: float):
+        try:
+            await asyncio.wait_for(asyncio.shield(tasks[name]), deadline)
+        except asyncio.TimeoutError:
+            pass
+        except Exception:
+            pass  # surfaced through _result_of
+
+    await asyncio.gather(*(_wait(name, deadline) for name, (_, deadline) in sources.items()))
+
+    results: Dict[str, SourceResult] = {}
+    pending: Dict[str, asyncio.Task] = {}
+    for name, task in tasks.items():
+        if task.done():
+            results[name] = _result_of(task)
+        else:
+            results[name] = SourceResult("pending")
+            pending[name] = task
+    return results, pending
+
+
+async def collect_late(pending: Dict[str, asyncio.Task], timeout: float) -> Dict[str, SourceResult]:
+    """Wait up to `timeout` for sources that missed their first deadline; cancel the rest."""
+    if not pending:
+        return {}
+
+    await asyncio.wait(pending.values(), timeout=timeout)
+
+    results: Dict[str, SourceResult] = {}
+    for name, task in pending.items():
+        if task.done():
+            results[name] = _result_of(task)
+        else:
+            task.cancel()
+            results[name] = SourceResult("failed", error="timed out")
+    return results
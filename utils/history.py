@@ -0,0 +1,89 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.supabase import get_supabase, execute_async
+
+PAGE_SIZE = 5
+PAGE_CACHE_TTL = 60  # seconds a rendered page/count is reused
+HISTORY_COLUMNS = "id, product_name, variant_name, invoice_id, redeemed_at"
+
+# Keyset cursor: (redeemed_at, id) of the last row on the previous page
+Cursor = Tuple[str, int]
+
+supabase = get_supabase()
+
+
+@dataclass
+class HistoryPage:
+    rows: List[Dict[str, Any]]
+    next_cursor: Optional[Cursor]
+
+
+# (discord_id, cursor) -> (page, expires_at);  discord_id -> (count, expires_at)
+_page_cache: Dict[Tuple[int, Optional[Cursor]], Tuple[HistoryPage, float]] = {}
+_count_cache: Dict[int, Tuple[int, float]] = {}
+
+
+def _cached(cache: dict, key):
+    entry = cache.get(key)
+    if entry and entry[1] >= time.monotonic():
+        return entry[0]
+    cache.pop(key, None)
+    return None
+
+
+def invalidate(discord_id: int) -> None:
+    """Drop cached pages for a user (call after they redeem something)."""
+    discord_id = int(discord_id)
+    _count_cache.pop(discord_id, None)
+    for key in [k for k in _page_cache if k[0] == discord_id]:
+        _page_cache.pop(key, None)
+
+
+async def fetch_page(discord_id: int, cursor: Optional[Cursor] = None, page_size: int = PAGE_SIZE) -> HistoryPage:
+    """
+    One page of a user's redemptions, newest first.
+    Keyset pagination on (discord_id, redeemed_at, id) - served by
+    role_redeem_discord_history_idx, cost does not grow with the page number.
+    """
+    discord_id = int(discord_id)
+    cached = _cached(_page_cache, (discord_id, cursor))
+    if cached is not None:
+        return cached
+
+    query = supabase.table("role_redeem").select(HISTORY_COLUMNS).eq("discord_id", discord_id)
+    if cursor:
+        redeemed_at, row_id = cursor
+        query = query.or_(
+            f'redeemed_at.lt."{redeemed_at}",and(redeemed_at.eq."{redeemed_at}",id.lt.{int(row_id)})'
+        )
+    query = query.order("redeemed_at", desc=True).order("id", desc=True).limit(page_size + 1)
+
+    res = await execute_async(query)
+    rows = res.data or []
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor = None
+    if has_more and rows and rows[-1].get("redeemed_at"):
+        next_cursor = (rows[-1]["redeemed_at"], rows[-1]["id"])
+
+    page = HistoryPage(rows, next_cursor)
+    _page_cache[(discord_id, cursor)] = (page, time.monotonic() + PAGE_CACHE_TTL)
+    return page
+
+
+async def count(discord_id: int) -> int:
+    """Total redemptions for a user (exact count, at most one row transferred)."""
+    discord_id = int(discord_id)
+    cached = _cached(_count_cache, discord_id)
+    if cached is not None:
+        return cached
+
+    res = await execute_async(
+        supabase.table("role_redeem").select("id", count="exact").eq("discord_id", discord_id).limit(1)
+    )
+    total = res.count or 0
+    _count_cache[discord_id] = (total, time.monotonic() + PAGE_CACHE_TTL)
+    return total
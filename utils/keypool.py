@@ -0,0 +1,278 @@
+"""
+Pool of pre-created, unassigned Luarmor keys.
+
+Granting access normally costs a POST (and, for existing users, a GET + PATCH).
+With a warm pool it is a GET (to confirm the user has no key yet) and one PATCH
+that attaches a ready key to the discord_id.
+The Ops cog refills the pool in the background (sized from the recent redeem
+rate) and periodically reclaims keys that were left half-claimed or lost track of.
+
+The pool lives in each replica's local DB, so only the leader (utils.leader)
+hands out or adopts pool keys; a replica that loses leadership surrenders its
+ready keys, which the new leader adopts on its next reclaim.
+"""
+import math
+import time
+from typing import Any, Dict, Optional
+
+from utils import metrics, leader
+from utils.localdb import connect, lock_for
+from utils.luarmor import (
+    create_or_update_user,
+    create_unassigned_key,
+    assign_key,
+    delete_user,
+    get_all_users,
+    has_user,
+    expires_at_from,
+)
+from utils.plans import PlanExpiry, compute_expiry
+from utils.reconcile import load_state as load_reconcile_state
+
+DB_NAME = "keypool"
+
+POOL_MIN = 3                 # never keep fewer ready keys than this
+POOL_MAX = 25                # ...or more than this
+REFILL_HORIZON_HOURS = 6     # keep enough keys for this long at the recent redeem rate
+RATE_WINDOW_HOURS = 24       # redeem rate is measured over this window
+REFILL_BATCH = 5             # keys created per refill tick
+CLAIM_STALE_SECONDS = 300    # a claim older than this was interrupted (crash/restart)
+
+POOL_NOTE = "keypool:unassigned"
+# Pool keys get a short placeholder expiry; assignment always sets the real one
+PLACEHOLDER_EXPIRE_SECONDS = 3600
+
+_SCHEMA = """
+create table if not exists pool (
+    user_key text primary key,
+    status text not null,           -- ready | claimed
+    created_at real not null,
+    claimed_at real
+);
+create table if not exists takes (
+    at real not null,
+    hit integer not null
+);
+create index if not exists takes_at_idx on takes (at);
+"""
+
+_ready = False
+
+
+def _db():
+    global _ready
+    conn = connect(DB_NAME)
+    if not _ready:
+        with lock_for(DB_NAME):
+            conn.executescript(_SCHEMA)
+        _ready = True
+    return conn
+
+
+# -----------------------------
+# LOCAL BOOKKEEPING
+# -----------------------------
+def _claim() -> Optional[str]:
+    conn = _db()
+    with lock_for(DB_NAME):
+        row = conn.execute(
+            "select user_key from pool where status = 'ready' order by created_at limit 1"
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute(
+            "update pool set status = 'claimed', claimed_at = ? where user_key = ?",
+            (time.time(), row["user_key"]),
+        )
+    return row["user_key"]
+
+
+def _release(user_key: str) -> None:
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.execute("update pool set status = 'ready', claimed_at = null where user_key = ?", (user_key,))
+
+
+def _forget(user_key: str) -> None:
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.execute("delete from pool where user_key = ?", (user_key,))
+
+
+def _add(user_key: str) -> None:
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.execute(
+            "insert or ignore into pool (user_key, status, created_at) values (?, 'ready', ?)",
+            (user_key, time.time()),
+        )
+
+
+def _record_take(hit: bool) -> None:
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.execute("insert into takes (at, hit) values (?, ?)", (time.time(), int(hit)))
+
+
+def stats() -> Dict[str, int]:
+    conn = _db()
+    with lock_for(DB_NAME):
+        rows = conn.execute("select status, count(*) from pool group by status").fetchall()
+    counts = {"ready": 0, "claimed": 0}
+    counts.update({r[0]: r[1] for r in rows})
+    return counts
+
+
+def redeem_rate_per_hour() -> float:
+    since = time.time() - RATE_WINDOW_HOURS * 3600
+    conn = _db()
+    with lock_for(DB_NAME):
+        (count,) = conn.execute("select count(*) from takes where at >= ?", (since,)).fetchone()
+    return count / RATE_WINDOW_HOURS
+
+
+def target_size() -> int:
+    wanted = math.ceil(redeem_rate_per_hour() * REFILL_HORIZON_HOURS)
+    return max(POOL_MIN, min(POOL_MAX, wanted))
+
+
+def _known_luarmor_ids() -> set[str]:
+    """discord_ids that already had a Luarmor key at the last reconcile run."""
+    return set(load_reconcile_state().get("luarmor", {}))
+
+
+async def _may_use_pool(discord_id: int) -> bool:
+    """
+    Only attach a pooled key when Luarmor confirms the user has none yet.
+    The reconcile snapshot is just a shortcut for users we already know about:
+    it is empty before the first run and misses anyone who redeemed since.
+    """
+    if not leader.is_leader():
+        return False  # standby replicas skip the pool: the leader may adopt the same keys
+    if str(discord_id) in _known_luarmor_ids():
+        return False
+    with metrics.timer("keypool.lookup"):
+        existing = await has_user(discord_id)
+    # A failed lookup (None) is treated like "has a key": the fallback path handles both
+    return existing is False
+
+
+# -----------------------------
+# PROVISION
+# -----------------------------
+async def provision(
+    discord_id: int,
+    plan_name: str,
+    note: str = "",
+    expiry: Optional[PlanExpiry] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Drop-in for create_or_update_user: attach a pooled key with one PATCH when we
+    can, otherwise take the normal create/update path. Same return shape.
+    """
+    if expiry is None:
+        expiry = compute_expiry(plan_name, plan_name)
+
+    # Existing Luarmor users keep (and extend) their key instead of getting a second one
+    user_key = _claim() if await _may_use_pool(discord_id) else None
+
+    if user_key:
+        with metrics.timer("keypool.assign"):
+            assigned = await assign_key(user_key, discord_id, auth_expire=expiry.auth_expire, note=note)
+        if assigned:
+            _forget(user_key)
+            _record_take(hit=True)
+            metrics.incr("keypool.hit")
+            print(f"[KEYPOOL] Assigned pooled key to {discord_id}")
+            return {"user_key": user_key, "expires_at": expires_at_from(expiry.auth_expire)}
+        # The pooled key is still unassigned and good for the next redeem
+        _release(user_key)
+        metrics.incr("keypool.assign_failed")
+
+    _record_take(hit=False)
+    metrics.incr("keypool.miss")
+    with metrics.timer("keypool.fallback"):
+        return await create_or_update_user(discord_id=discord_id, plan_name=plan_name, note=note, expiry=expiry)
+
+
+# -----------------------------
+# MAINTENANCE (driven by commands/ops.py)
+# -----------------------------
+async def refill() -> int:
+    """Create keys until the pool reaches its target (at most REFILL_BATCH per call)."""
+    needed = min(target_size() - stats()["ready"], REFILL_BATCH)
+    created = 0
+    for _ in range(max(0, needed)):
+        with metrics.timer("keypool.refill"):
+            user_key = await create_unassigned_key(
+                int(time.time()) + PLACEHOLDER_EXPIRE_SECONDS, note=POOL_NOTE
+            )
+        if not user_key:
+            metrics.incr("keypool.refill_failed")
+            break
+        _add(user_key)
+        created += 1
+    if created:
+        print(f"[KEYPOOL] Refilled {created} key(s), ready={stats()['ready']} target={target_size()}")
+    return created
+
+
+async def reclaim() -> Dict[str, int]:
+    """
+    Reconcile the local pool with Luarmor:
+    - interrupted claims go back to ready (or are dropped if they did get assigned)
+    - rows whose key no longer exists are dropped
+    - unassigned pool keys we lost track of are adopted, or deleted above POOL_MAX
+    """
+    result = {"released": 0, "dropped": 0, "adopted": 0, "deleted": 0}
+    fetched_at = time.time()
+    users = await get_all_users()
+    if not users:
+        return result
+    by_key = {u.get("user_key"): u for u in users if u.get("user_key")}
+
+    conn = _db()
+    with lock_for(DB_NAME):
+        rows = [dict(r) for r in conn.execute("select * from pool").fetchall()]
+        conn.execute("delete from takes where at < ?", (time.time() - RATE_WINDOW_HOURS * 3600,))
+    local = {r["user_key"] for r in rows}
+    stale_before = time.time() - CLAIM_STALE_SECONDS
+
+    for row in rows:
+        if row["created_at"] >= fetched_at:
+            continue  # created after the listing was taken
+        user = by_key.get(row["user_key"])
+        if user is None or user.get("discord_id"):
+            _forget(row["user_key"])
+            result["dropped"] += 1
+        elif row["status"] == "claimed" and (row["claimed_at"] or 0) < stale_before:
+            _release(row["user_key"])
+            result["released"] += 1
+
+    ready = stats()["ready"]
+    for user_key, user in by_key.items():
+        if user_key in local or user.get("discord_id") or user.get("note") != POOL_NOTE:
+            continue
+        if ready < POOL_MAX:
+            _add(user_key)
+            ready += 1
+            result["adopted"] += 1
+        elif await delete_user(user_key):
+            result["deleted"] += 1
+
+    if any(result.values()):
+        print(f"[KEYPOOL] Reclaim: {result}")
+    return result
+
+
+def surrender() -> int:
+    """
+    Forget this replica's ready keys after losing leadership. The keys stay in
+    Luarmor (unassigned, POOL_NOTE) for the new leader's reclaim to adopt.
+    """
+    conn = _db()
+    with lock_for(DB_NAME):
+        cur = conn.execute("delete from pool where status = 'ready'")
+    if cur.rowcount:
+        print(f"[KEYPOOL] Surrendered {cur.rowcount} ready key(s) to the new leader")
+    return cur.rowcount
@@ -0,0 +1,264 @@
+"""
+Leader election so several bot replicas can run side by side.
+
+Every replica serves interactions; singleton background work (the @supervised
+jobs, the key pool and ticket pool maintenance, the sweeps) only runs on the
+replica holding the lease. The Ops cog calls renew() every RENEW_SECONDS; a
+lease that isn't renewed lapses after LEASE_SECONDS, so a crashed leader is
+replaced within about that long. A clean shutdown releases it right away.
+
+The backend also keeps a small per-task cursor (start of the last successful
+run) shared by all replicas, so a job's catch-up after a failover starts where
+the previous leader stopped instead of where this replica last ran it.
+
+Backends (LEADER_BACKEND):
+- "file":     exclusive flock on LEADER_LOCK_PATH - replicas on one host, local testing (default)
+- "supabase": lease row in bot_leases, see sql/bot_leases.sql
+- "none":     this process is always the leader
+"""
+import os
+import json
+import time
+import socket
+import asyncio
+from datetime import datetime, timezone
+from typing import Optional
+
+from utils.supabase import get_supabase, execute_async
+from utils.localdb import data_path
+
+LEADER_BACKEND = os.getenv("LEADER_BACKEND", "file").strip().lower()
+LEADER_LOCK_PATH = os.getenv("LEADER_LOCK_PATH", "").strip() or data_path("leader.lock")
+INSTANCE_ID = os.getenv("LEADER_INSTANCE_ID", "").strip() or f"{socket.gethostname()}:{os.getpid()}"
+
+LEASE_NAME = "shopbot"
+LEASE_SECONDS = 15
+RENEW_SECONDS = 5
+SAFETY_MARGIN_SECONDS = 2    # stop acting as leader this long before the lease could lapse
+FIRST_ELECTION_WAIT = 10.0   # how long jobs wait for the first round after startup
+
+supabase = get_supabase()
+
+
+# -----------------------------
+# BACKENDS
+# -----------------------------
+class FileLease:
+    """flock-based lease: held for as long as this process keeps the file open."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    async def acquire(self) -> bool:
+        import fcntl
+
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, INSTANCE_ID.encode("utf-8"))
+        self._fd = fd
+        return True
+
+    async def release(self) -> None:
+        import fcntl
+
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    async def holder(self) -> Optional[str]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _cursor_file(self) -> dict:
+        try:
+            with open(self.path + ".cursors.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    async def load_cursor(self, task: str) -> Optional[float]:
+        return self._cursor_file().get(task)
+
+    async def save_cursor(self, task: str, ts: float) -> None:
+        cursors = self._cursor_file()
+        cursors[task] = ts
+        tmp = self.path + ".cursors.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cursors, f)
+        os.replace(tmp, self.path + ".cursors.json")
+
+
+class SupabaseLease:
+    """Lease row taken/extended atomically by the acquire_lease() SQL function."""
+
+    async def acquire(self) -> bool:
+        resp = await execute_async(supabase.rpc("acquire_lease", {
+            "p_name": LEASE_NAME, "p_holder": INSTANCE_ID, "p_ttl_seconds": LEASE_SECONDS,
+        }))
+        return resp.data is True
+
+    async def release(self) -> None:
+        await execute_async(supabase.rpc("release_lease", {"p_name": LEASE_NAME, "p_holder": INSTANCE_ID}))
+
+    async def holder(self) -> Optional[str]:
+        resp = await execute_async(
+            supabase.table("bot_leases").select("holder, expires_at").eq("name", LEASE_NAME).limit(1)
+        )
+        return resp.data[0]["holder"] if resp.data else None
+
+    async def load_cursor(self, task: str) -> Optional[float]:
+        resp = await execute_async(
+            supabase.table("bot_task_cursors").select("last_ok").eq("task", task).limit(1)
+        )
+        if not resp.data:
+            return None
+        return datetime.fromisoformat(resp.data[0]["last_ok"].replace("Z", "+00:00")).timestamp()
+
+    async def save_cursor(self, task: str, ts: float) -> None:
+        await execute_async(supabase.table("bot_task_cursors").upsert({
+            "task": task, "last_ok": datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(),
+        }, on_conflict="task"))
+
+
+class NoLease:
+    async def acquire(self) -> bool:
+        return True
+
+    async def release(self) -> None:
+        pass
+
+    async def holder(self) -> Optional[str]:
+        return INSTANCE_ID
+
+    async def load_cursor(self, task: str) -> Optional[float]:
+        return None  # single replica: the local run history is authoritative
+
+    async def save_cursor(self, task: str, ts: float) -> None:
+        pass
+
+
+def _make_backend():
+    if LEADER_BACKEND == "supabase":
+        return SupabaseLease()
+    if LEADER_BACKEND == "none":
+        return NoLease()
+    if LEADER_BACKEND != "file":
+        raise ValueError(f"Unknown LEADER_BACKEND '{LEADER_BACKEND}'")
+    return FileLease(LEADER_LOCK_PATH)
+
+
+_backend = _make_backend()
+_leader = False
+_valid_until = 0.0          # monotonic deadline of the lease as this replica last saw it
+_since: Optional[float] = None
+_settled: Optional[asyncio.Event] = None
+
+
+def _settled_event() -> asyncio.Event:
+    global _settled
+    if _settled is None:
+        _settled = asyncio.Event()
+    return _settled
+
+
+# -----------------------------
+# API
+# -----------------------------
+def is_leader() -> bool:
+    return _leader and time.monotonic() < _valid_until
+
+
+async def confirm() -> bool:
+    """is_leader(), but right after startup wait (briefly) for the first election round."""
+    if not _settled_event().is_set():
+        try:
+            await asyncio.wait_for(_settled_event().wait(), timeout=FIRST_ELECTION_WAIT)
+        except asyncio.TimeoutError:
+            pass
+    return is_leader()
+
+
+async def renew() -> Optional[bool]:
+    """
+    Take or extend the lease. Returns True when this replica just became leader,
+    False when it just lost leadership, None when nothing changed.
+    """
+    global _leader, _valid_until, _since
+    was_leader = is_leader()
+    started = time.monotonic()
+    try:
+        won = await asyncio.wait_for(_backend.acquire(), timeout=RENEW_SECONDS)
+    except Exception as e:
+        print(f"[LEADER] Lease renewal failed: {type(e).__name__}: {e}")
+        won = False
+
+    _leader = won
+    _valid_until = started + LEASE_SECONDS - SAFETY_MARGIN_SECONDS if won else 0.0
+    _settled_event().set()
+
+    if won and not was_leader:
+        _since = time.time()
+        print(f"[LEADER] {INSTANCE_ID} is now the leader ({LEADER_BACKEND})")
+        return True
+    if was_leader and not won:
+        _since = None
+        print(f"[LEADER] {INSTANCE_ID} lost leadership")
+        return False
+    return None
+
+
+async def step_down() -> None:
+    """Release the lease (shutdown) so another replica can take over immediately."""
+    global _leader, _valid_until, _since
+    was_leader = _leader
+    _leader, _valid_until, _since = False, 0.0, None
+    if not was_leader:
+        return
+    try:
+        await _backend.release()
+        print(f"[LEADER] {INSTANCE_ID} released the lease")
+    except Exception as e:
+        print(f"[LEADER] Lease release failed: {e}")
+
+
+async def load_cursor(task: str) -> Optional[float]:
+    """Start of the task's last successful run on any replica (None if unknown or unreachable)."""
+    try:
+        return await _backend.load_cursor(task)
+    except Exception as e:
+        print(f"[LEADER] Could not read cursor for {task}: {e}")
+        return None
+
+
+async def save_cursor(task: str, ts: float) -> None:
+    try:
+        await _backend.save_cursor(task, ts)
+    except Exception as e:
+        print(f"[LEADER] Could not save cursor for {task}: {e}")
+
+
+async def status() -> dict:
+    try:
+        holder = await _backend.holder()
+    except Exception as e:
+        holder = f"unknown ({e})"
+    return {
+        "backend": LEADER_BACKEND,
+        "instance": INSTANCE_ID,
+        "leader": is_leader(),
+        "since": _since,
+        "holder": holder,
+    }
@@ -0,0 +1,50 @@
+import os
+import sqlite3
+import threading
+from typing import Dict
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.getenv("BOT_DATA_DIR", os.path.join(BASE_DIR, "data"))
+
+_connections: Dict[str, sqlite3.Connection] = {}
+_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def data_path(filename: str) -> str:
+    """Absolute path for a file in the bot's local data directory (created on demand)."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, filename)
+
+
+def connect(name: str) -> sqlite3.Connection:
+    """
+    Shared SQLite connection for data/<name>.db.
+    WAL + synchronous=NORMAL keeps single-row inserts well under a millisecond
+    while still surviving a process crash.
+    """
+    with _registry_lock:
+        conn = _connections.get(name)
+        if conn is None:
+            conn = sqlite3.connect(data_path(f"{name}.db"), check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            _connections[name] = conn
+            _locks[name] = threading.Lock()
+        return conn
+
+
+def lock_for(name: str) -> threading.Lock:
+    """Lock guarding the shared connection (it is also used from worker threads)."""
+    connect(name)
+    return _locks[name]
+
+
+def close_all() -> None:
+    with _registry_lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+        _locks.clear()
@@ -4,7 +4,9 @@ import aiohttp
 from aiohttp import ClientTimeout
 from typing import Optional, Dict, Any
 from datetime import datetime, timezone
-import re
+
+from utils.plans import PlanExpiry, compute_expiry
+from utils.admission import upstream, UpstreamBusy
 
 LUARMOR_API_KEY = (os.getenv("LUARMOR_API_KEY") or "").strip()
 LUARMOR_PROJECT_ID = (os.getenv("LUARMOR_PROJECT_ID") or "").strip()
@@ -14,6 +16,8 @@ BASE_URL = "https://api.luarmor.net/v3"
 MAX_RETRIES = 3
 RETRY_DELAY = 2  # seconds (exponential backoff)
 
+_session: Optional[aiohttp.ClientSession] = None
+
 
 def _headers() -> Dict[str, str]:
     return {
@@ -22,20 +26,42 @@ def _headers() -> Dict[str, str]:
     }
 
 
+def _get_session() -> aiohttp.ClientSession:
+    """One pooled session for every Luarmor call (keeps connections and DNS warm)."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300))
+    return _session
+
+
+async def close() -> None:
+    if _session and not _session.closed:
+        await _session.close()
+
+
+def expires_at_from(auth_expire: Optional[int]) -> Optional[datetime]:
+    """Luarmor auth_expire -> aware datetime (None for lifetime)."""
+    if auth_expire and auth_expire != -1:
+        return datetime.fromtimestamp(auth_expire, tz=timezone.utc)
+    return None
+
+
 async def _request_with_retry(
     method: str,
     url: str,
     session: aiohttp.ClientSession,
     json: Optional[Dict[str, Any]] = None,
     params: Optional[Dict[str, Any]] = None,
+    timeout: Optional[ClientTimeout] = None,
 ) -> Optional[Dict[str, Any]]:
     """Make a request with retry logic for rate limits and server errors."""
     
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            async with session.request(
+            async with upstream("luarmor"), session.request(
                 method,
                 url,
+                timeout=timeout,
                 headers=_headers(),
                 json=json,
                 params=params,
@@ -51,20 +77,16 @@ async def _request_with_retry(
                     except:
                         return {"raw": text}
 
-                # Retryable errors
-                if resp.status in (401, 403, 429, 500, 502, 503, 504):
-                    if attempt < MAX_RETRIES:
-                        await asyncio.sleep(RETRY_DELAY * attempt)
-                        continue
-
-                return None
+                # Only these are worth retrying
+                if resp.status not in (401, 403, 429, 500, 502, 503, 504):
+                    return None
 
-        except aiohttp.ClientError as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError, UpstreamBusy) as e:
             print(f"[LUARMOR] Network error: {e}")
-            if attempt < MAX_RETRIES:
-                await asyncio.sleep(RETRY_DELAY * attempt)
-                continue
-            return None
+
+        # Back off outside the request so the waiting attempt doesn't hold a Luarmor slot
+        if attempt < MAX_RETRIES:
+            await asyncio.sleep(RETRY_DELAY * attempt)
 
     return None
 
@@ -73,9 +95,12 @@ async def create_or_update_user(
     discord_id: int,
     plan_name: str,
     note: str = "",
+    expiry: Optional[PlanExpiry] = None,
 ) -> Optional[Dict[str, Any]]:
     """
     Creates a Luarmor user or updates expiry if they already exist.
+    Pass `expiry` (from utils.plans) so Luarmor gets exactly the expiry stored in the DB;
+    otherwise it is derived from plan_name.
     Returns dict: { user_key, expires_at } or None on failure.
     """
     print(f"[LUARMOR] create_or_update_user called for discord_id={discord_id}, plan={plan_name}")
@@ -85,7 +110,9 @@ async def create_or_update_user(
         print("[LUARMOR] ❌ API key or project ID not configured")
         return None
 
-    auth_expire = compute_expiry_timestamp(plan_name, plan_name)
+    if expiry is None:
+        expiry = compute_expiry(plan_name, plan_name)
+    auth_expire = expiry.auth_expire
     
     payload = {
         "discord_id": str(discord_id),
@@ -99,43 +126,70 @@ async def create_or_update_user(
     url = f"{BASE_URL}/projects/{LUARMOR_PROJECT_ID}/users"
 
     timeout = ClientTimeout(total=15)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        data = await _request_with_retry("POST", url, session, json=payload)
-
-        if data and data.get("success"):
-            print(f"[LUARMOR] ✅ New user created: {data.get('user_key')}")
-            return {
-                "user_key": data.get("user_key"),
-                "expires_at": (
-                    datetime.fromtimestamp(auth_expire, tz=timezone.utc)
-                    if auth_expire and auth_expire != -1
-                    else None
-                ),
-            }
-
-        # User might already exist - try to fetch and update
-        print("[LUARMOR] User may exist, attempting to fetch and update...")
-        user = await get_user_by_discord(discord_id)
-        if not user:
-            print("[LUARMOR] ❌ Could not find existing user")
-            return None
-
-        print(f"[LUARMOR] Found existing user: {user.get('user_key')}")
-        updated = await update_user_expiry(user["user_key"], auth_expire)
-        if not updated:
-            print("[LUARMOR] ❌ Failed to update existing user")
-            return None
-
-        print(f"[LUARMOR] ✅ Updated existing user: {user.get('user_key')}")
+    data = await _request_with_retry("POST", url, _get_session(), json=payload, timeout=timeout)
+
+    if data and data.get("success"):
+        print(f"[LUARMOR] ✅ New user created: {data.get('user_key')}")
         return {
-            "user_key": user["user_key"],
-            "expires_at": (
-                datetime.fromtimestamp(auth_expire, tz=timezone.utc)
-                if auth_expire and auth_expire != -1
-                else None
-            ),
+            "user_key": data.get("user_key"),
+            "expires_at": expires_at_from(auth_expire),
         }
 
+    # User might already exist - try to fetch and update
+    print("[LUARMOR] User may exist, attempting to fetch and update...")
+    user = await get_user_by_discord(discord_id)
+    if not user:
+        print("[LUARMOR] ❌ Could not find existing user")
+        return None
+
+    print(f"[LUARMOR] Found existing user: {user.get('user_key')}")
+    updated = await update_user_expiry(user["user_key"], auth_expire)
+    if not updated:
+        print("[LUARMOR] ❌ Failed to update existing user")
+        return None
+
+    print(f"[LUARMOR] ✅ Updated existing user: {user.get('user_key')}")
+    return {
+        "user_key": user["user_key"],
+        "expires_at": expires_at_from(auth_expire),
+    }
+
+
+async def create_unassigned_key(auth_expire: int, note: str = "") -> Optional[str]:
+    """Create a key with no Discord account attached yet (pre-provisioning). Returns user_key."""
+    if not LUARMOR_API_KEY or not LUARMOR_PROJECT_ID:
+        return None
+
+    payload: Dict[str, Any] = {"note": note}
+    if auth_expire is not None and auth_expire != -1:
+        payload["auth_expire"] = auth_expire
+
+    url = f"{BASE_URL}/projects/{LUARMOR_PROJECT_ID}/users"
+
+    timeout = ClientTimeout(total=15)
+    data = await _request_with_retry("POST", url, _get_session(), json=payload, timeout=timeout)
+    if data and data.get("success"):
+        return data.get("user_key")
+    return None
+
+
+async def assign_key(user_key: str, discord_id: int, auth_expire: Optional[int] = None, note: Optional[str] = None) -> bool:
+    """Attach an existing (pre-created) key to a Discord account."""
+    if not LUARMOR_API_KEY or not LUARMOR_PROJECT_ID:
+        return False
+
+    payload: Dict[str, Any] = {"user_key": user_key, "discord_id": str(discord_id)}
+    if auth_expire is not None:
+        payload["auth_expire"] = auth_expire
+    if note is not None:
+        payload["note"] = note
+
+    url = f"{BASE_URL}/projects/{LUARMOR_PROJECT_ID}/users"
+
+    timeout = ClientTimeout(total=10)
+    data = await _request_with_retry("PATCH", url, _get_session(), json=payload, timeout=timeout)
+    return bool(data and data.get("success"))
+
 
 async def get_user_by_discord(discord_id: int) -> Optional[Dict[str, Any]]:
     """Get a Luarmor user by their Discord ID."""
@@ -146,11 +200,25 @@ async def get_user_by_discord(discord_id: int) -> Optional[Dict[str, Any]]:
     params = {"discord_id": str(discord_id)}
 
     timeout = ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        data = await _request_with_retry("GET", url, session, params=params)
-        if data and data.get("users"):
-            return data["users"][0]
+    data = await _request_with_retry("GET", url, _get_session(), params=params, timeout=timeout)
+    if data and data.get("users"):
+        return data["users"][0]
+    return None
+
+
+async def has_user(discord_id: int) -> Optional[bool]:
+    """Whether this Discord ID already has a Luarmor user; None if the lookup failed."""
+    if not LUARMOR_API_KEY or not LUARMOR_PROJECT_ID:
+        return None
+
+    url = f"{BASE_URL}/projects/{LUARMOR_PROJECT_ID}/users"
+    params = {"discord_id": str(discord_id)}
+
+    timeout = ClientTimeout(total=10)
+    data = await _request_with_retry("GET", url, _get_session(), params=params, timeout=timeout)
+    if not data or "users" not in data:
         return None
+    return bool(data["users"])
 
 
 async def update_user_expiry(user_key: str, auth_expire: Optional[int]) -> bool:
@@ -166,9 +234,8 @@ async def update_user_expiry(user_key: str, auth_expire: Optional[int]) -> bool:
     url = f"{BASE_URL}/projects/{LUARMOR_PROJECT_ID}/users"
 
     timeout = ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        data = await _request_with_retry("PATCH", url, session, json=payload)
-        return bool(data and data.get("success"))
+    data = await _request_with_retry("PATCH", url, _get_session(), json=payload, timeout=timeout)
+    return bool(data and data.get("success"))
 
 
 async def delete_user(user_key: str) -> bool:
@@ -180,9 +247,8 @@ async def delete_user(user_key: str) -> bool:
     params = {"user_key": user_key}
 
     timeout = ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        data = await _request_with_retry("DELETE", url, session, params=params)
-        return bool(data and data.get("success"))
+    data = await _request_with_retry("DELETE", url, _get_session(), params=params, timeout=timeout)
+    return bool(data and data.get("success"))
 
 
 async def reset_hwid(user_key: str) -> bool:
@@ -194,9 +260,8 @@ async def reset_hwid(user_key: str) -> bool:
     payload = {"user_key": user_key}
 
     timeout = ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        data = await _request_with_retry("POST", url, session, json=payload)
-        return bool(data and data.get("success"))
+    data = await _request_with_retry("POST", url, _get_session(), json=payload, timeout=timeout)
+    return bool(data and data.get("success"))
 
 
 def compute_expiry_timestamp(product_name: str | None, variant_name: str | None) -> int | None:
@@ -204,24 +269,7 @@ def compute_expiry_timestamp(product_name: str | None, variant_name: str | None)
     Convert product/variant name to Unix timestamp for Luarmor auth_expire.
     Returns -1 for lifetime (never expires in Luarmor).
     """
-    text = f"{product_name or ''} {variant_name or ''}".lower()
-    now = int(datetime.now(timezone.utc).timestamp())
-
-    if "week" in text:
-        return now + (7 * 86400)
-    if "month" in text:
-        return now + (30 * 86400)
-    if "year" in text:
-        return now + (365 * 86400)
-    if "lifetime" in text or "life" in text:
-        return -1  # Luarmor: -1 = never expires
-    
-    day_match = re.search(r'(\d+)\s*days?', text)
-    if day_match:
-        days = int(day_match.group(1))
-        return now + (days * 86400)
-    
-    return -1  # Default to lifetime
+    return compute_expiry(product_name, variant_name).auth_expire
 
 
 async def get_user_info(discord_id: int) -> Optional[Dict[str, Any]]:
@@ -233,11 +281,10 @@ async def get_user_info(discord_id: int) -> Optional[Dict[str, Any]]:
     params = {"discord_id": str(discord_id)}
 
     timeout = ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        data = await _request_with_retry("GET", url, session, params=params)
-        if data and data.get("users"):
-            return data["users"][0]
-        return None
+    data = await _request_with_retry("GET", url, _get_session(), params=params, timeout=timeout)
+    if data and data.get("users"):
+        return data["users"][0]
+    return None
 
 
 async def add_time_to_user(discord_id: int, days: int) -> Optional[Dict[str, Any]]:
@@ -293,11 +340,10 @@ async def get_all_users() -> list:
     url = f"{BASE_URL}/projects/{LUARMOR_PROJECT_ID}/users"
 
     timeout = ClientTimeout(total=30)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        data = await _request_with_retry("GET", url, session)
-        if data and data.get("users"):
-            return data["users"]
-        return []
+    data = await _request_with_retry("GET", url, _get_session(), timeout=timeout)
+    if data and data.get("users"):
+        return data["users"]
+    return []
 
 
 async def compensate_all_users(hours: int) -> dict:
@@ -0,0 +1,184 @@
+import os
+import time
+import asyncio
+from typing import Optional, Dict, Tuple, Iterable, List
+
+import discord
+
+# Seconds a fetched member stays cached before we go back to Discord.
+MEMBER_CACHE_TTL = int(os.getenv("MEMBER_CACHE_TTL", "300"))
+
+# Seconds we remember that a user is NOT in the guild (left / kicked).
+MEMBER_NEGATIVE_TTL = int(os.getenv("MEMBER_NEGATIVE_TTL", "600"))
+
+# Discord caps query_members(user_ids=...) at 100 IDs per request.
+QUERY_BATCH_SIZE = 100
+
+# How long single resolve() calls wait to be coalesced into one batch.
+COALESCE_DELAY = 0.05
+
+# (guild_id, user_id) -> (member, expires_at)
+_member_cache: Dict[Tuple[int, int], Tuple[discord.Member, float]] = {}
+
+
+def _cache_get(guild_id: int, user_id: int) -> Optional[discord.Member]:
+    entry = _member_cache.get((guild_id, user_id))
+    if not entry:
+        return None
+    member, expires_at = entry
+    if expires_at < time.monotonic():
+        _member_cache.pop((guild_id, user_id), None)
+        return None
+    return member
+
+
+def cache_member(member: discord.Member) -> None:
+    """Store a member we already have (e.g. from an interaction payload)."""
+    _member_cache[(member.guild.id, member.id)] = (member, time.monotonic() + MEMBER_CACHE_TTL)
+
+
+def forget_member(guild_id: int, user_id: int) -> None:
+    _member_cache.pop((guild_id, user_id), None)
+
+
+async def get_or_fetch_member(guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+    """
+    Resolve a member without relying on a fully chunked guild.
+    Order: gateway cache -> local TTL cache -> REST fetch (then cached).
+    Returns None if the user is not in the guild.
+    """
+    user_id = int(user_id)
+
+    member = guild.get_member(user_id)
+    if member is not None:
+        return member
+
+    member = _cache_get(guild.id, user_id)
+    if member is not None:
+        return member
+
+    try:
+        member = await guild.fetch_member(user_id)
+    except (discord.NotFound, discord.Forbidden):
+        return None
+    except discord.HTTPException as e:
+        print(f"[MEMBERS] fetch_member failed for {user_id}: {e}")
+        return None
+
+    cache_member(member)
+    return member
+
+
+class MemberResolver:
+    """
+    Resolves members in batches over the gateway (guild.query_members) instead
+    of one REST fetch_member per user, and remembers users who left the guild.
+    """
+
+    def __init__(self, negative_ttl: int = MEMBER_NEGATIVE_TTL):
+        self.negative_ttl = negative_ttl
+        self._negative: Dict[Tuple[int, int], float] = {}
+        # guild_id -> user_id -> waiting futures
+        self._pending: Dict[int, Dict[int, List[asyncio.Future]]] = {}
+        self._flush_tasks: Dict[int, asyncio.Task] = {}
+
+    def forget(self, guild_id: int, user_id: int) -> None:
+        """Drop cached state for a user (call on member join/leave)."""
+        self._negative.pop((guild_id, user_id), None)
+        forget_member(guild_id, user_id)
+
+    def _lookup(self, guild: discord.Guild, user_id: int) -> Tuple[bool, Optional[discord.Member]]:
+        member = guild.get_member(user_id) or _cache_get(guild.id, user_id)
+        if member is not None:
+            return True, member
+
+        expires_at = self._negative.get((guild.id, user_id))
+        if expires_at is not None:
+            if expires_at >= time.monotonic():
+                return True, None
+            self._negative.pop((guild.id, user_id), None)
+
+        return False, None
+
+    async def _query(self, guild: discord.Guild, user_ids: List[int]) -> Dict[int, discord.Member]:
+        try:
+            members = await guild.query_members(user_ids=user_ids, limit=len(user_ids), cache=False)
+        except (asyncio.TimeoutError, discord.ClientException) as e:
+            # Gateway query unavailable - fall back to REST, but don't negative-cache on errors
+            print(f"[MEMBERS] query_members failed ({e}), falling back to fetch_member")
+            found = {}
+            for uid in user_ids:
+                member = await get_or_fetch_member(guild, uid)
+                if member is not None:
+                    found[uid] = member
+            return found
+
+        found = {m.id: m for m in members}
+        negative_until = time.monotonic() + self.negative_ttl
+        for uid in user_ids:
+            member = found.get(uid)
+            if member is not None:
+                cache_member(member)
+                self._negative.pop((guild.id, uid), None)
+            else:
+                self._negative[(guild.id, uid)] = negative_until
+        return found
+
+    async def resolve_many(self, guild: discord.Guild, user_ids: Iterable[int]) -> Dict[int, Optional[discord.Member]]:
+        """
+        Resolve many users at once. Returns {user_id: Member or None}.
+        Cache misses cost one gateway request per 100 users.
+        """
+        result: Dict[int, Optional[discord.Member]] = {}
+        missing: List[int] = []
+
+        for uid in dict.fromkeys(int(u) for u in user_ids):
+            hit, member = self._lookup(guild, uid)
+            if hit:
+                result[uid] = member
+            else:
+                missing.append(uid)
+
+        for i in range(0, len(missing), QUERY_BATCH_SIZE):
+            chunk = missing[i:i + QUERY_BATCH_SIZE]
+            found = await self._query(guild, chunk)
+            for uid in chunk:
+                result[uid] = found.get(uid)
+
+        return result
+
+    async def resolve(self, guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+        """Resolve one user; concurrent callers are coalesced into a single batch."""
+        user_id = int(user_id)
+        hit, member = self._lookup(guild, user_id)
+        if hit:
+            return member
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(guild.id, {}).setdefault(user_id, []).append(future)
+
+        if guild.id not in self._flush_tasks:
+            self._flush_tasks[guild.id] = asyncio.create_task(self._flush_later(guild))
+
+        return await future
+
+    async def _flush_later(self, guild: discord.Guild) -> None:
+        await asyncio.sleep(COALESCE_DELAY)
+        self._flush_tasks.pop(guild.id, None)
+        pending = self._pending.pop(guild.id, {})
+        if not pending:
+            return
+
+        try:
+            resolved = await self.resolve_many(guild, pending.keys())
+        except Exception as e:
+            print(f"[MEMBERS] Batch resolve failed: {e}")
+            resolved = {}
+
+        for uid, futures in pending.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(resolved.get(uid))
+
+
+member_resolver = MemberResolver()
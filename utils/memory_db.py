@@ -0,0 +1,327 @@
+"""
+In-memory stand-in for the Supabase client.
+
+Supports the subset of the postgrest query builder this bot uses
+(select/insert/update/upsert/delete, the usual filters, order/limit/range, rpc)
+so cogs can be imported and exercised without live credentials.
+Enable with SUPABASE_BACKEND=memory or utils.supabase.set_client(MemoryClient()).
+"""
+import re
+import copy
+import itertools
+from typing import Any, Callable, Dict, List, Optional
+
+
+class MemoryResponse:
+    def __init__(self, data: List[Dict[str, Any]], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+def _coerce_pair(a: Any, b: Any):
+    # PostgREST sends every filter value as text, so compare loosely like it does
+    if isinstance(a, bool) or isinstance(b, bool):
+        return str(a).lower(), str(b).lower()
+    if isinstance(a, (int, float)) and isinstance(b, str):
+        try:
+            return a, type(a)(b)
+        except ValueError:
+            return str(a), b
+    if isinstance(a, str) and isinstance(b, (int, float)):
+        try:
+            return type(b)(a), b
+        except ValueError:
+            return a, str(b)
+    return a, b
+
+
+def _like_to_regex(pattern: str, flags: int = 0):
+    escaped = re.escape(pattern).replace("%", ".*").replace("_", ".")
+    return re.compile(f"^{escaped}$", flags | re.DOTALL)
+
+
+_OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+
+
+def _match(row: Dict[str, Any], column: str, op: str, value: Any) -> bool:
+    actual = row.get(column)
+
+    if op == "is":
+        if value in (None, "null"):
+            return actual is None
+        return str(actual).lower() == str(value).lower()
+    if op == "in":
+        return any(_match(row, column, "eq", v) for v in value)
+    if actual is None:
+        return False
+    if op == "like":
+        return bool(_like_to_regex(str(value)).match(str(actual)))
+    if op == "ilike":
+        return bool(_like_to_regex(str(value), re.IGNORECASE).match(str(actual)))
+
+    a, b = _coerce_pair(actual, value)
+    try:
+        return _OPS[op](a, b)
+    except TypeError:
+        return False
+
+
+def _split_top_level(expr: str) -> List[str]:
+    parts, depth, current = [], 0, ""
+    for ch in expr:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += ch
+    if current:
+        parts.append(current)
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _compile_logic(expr: str, mode: str) -> Callable[[Dict[str, Any]], bool]:
+    """Compile a postgrest logic string such as 'a.lt.5,and(a.eq.5,id.lt.3)'."""
+    checks = []
+    for part in _split_top_level(expr):
+        if part.startswith("and(") and part.endswith(")"):
+            checks.append(_compile_logic(part[4:-1], "and"))
+        elif part.startswith("or(") and part.endswith(")"):
+            checks.append(_compile_logic(part[3:-1], "or"))
+        else:
+            column, op, value = part.split(".", 2)
+            if len(value) >= 2 and value[0] == value[-1] == '"':
+                value = value[1:-1]
+            if op == "in":
+                value = [v.strip() for v in value.strip("()").split(",")]
+            checks.append(lambda row, c=column, o=op, v=value: _match(row, c, o, v))
+
+    combine = all if mode == "and" else any
+    return lambda row: combine(check(row) for check in checks)
+
+
+class MemoryQuery:
+    def __init__(self, client: "MemoryClient", table: str):
+        self._client = client
+        self._table = table
+        self._action = "select"
+        self._columns: Optional[List[str]] = None
+        self._count: Optional[str] = None
+        self._payload: Any = None
+        self._filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self._order: List[tuple] = []
+        self._limit: Optional[int] = None
+        self._offset = 0
+        self._on_conflict: Optional[str] = None
+        self._negate_next = False
+
+    # ---- actions ----
+    def select(self, columns: str = "*", count: Optional[str] = None, **_):
+        cols = [c.strip() for c in columns.split(",") if c.strip()]
+        self._columns = None if cols == ["*"] else cols
+        self._count = count
+        return self
+
+    def insert(self, payload, **_):
+        self._action = "insert"
+        self._payload = payload
+        return self
+
+    def upsert(self, payload, on_conflict: Optional[str] = None, **_):
+        self._action = "upsert"
+        self._payload = payload
+        self._on_conflict = on_conflict
+        return self
+
+    def update(self, payload, **_):
+        self._action = "update"
+        self._payload = payload
+        return self
+
+    def delete(self, **_):
+        self._action = "delete"
+        return self
+
+    # ---- filters ----
+    def _add(self, column: str, op: str, value: Any):
+        negate, self._negate_next = self._negate_next, False
+        if not negate:
+            self._filters.append(lambda row: _match(row, column, op, value))
+        elif op == "is":
+            self._filters.append(lambda row: not _match(row, column, op, value))
+        else:
+            # SQL: NOT (NULL op x) is still NULL, so negated filters skip NULL columns too
+            self._filters.append(
+                lambda row: row.get(column) is not None and not _match(row, column, op, value)
+            )
+        return self
+
+    def eq(self, column, value):
+        return self._add(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._add(column, "neq", value)
+
+    def gt(self, column, value):
+        return self._add(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._add(column, "gte", value)
+
+    def lt(self, column, value):
+        return self._add(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._add(column, "lte", value)
+
+    def like(self, column, pattern):
+        return self._add(column, "like", pattern)
+
+    def ilike(self, column, pattern):
+        return self._add(column, "ilike", pattern)
+
+    def in_(self, column, values):
+        return self._add(column, "in", list(values))
+
+    def is_(self, column, value):
+        return self._add(column, "is", value)
+
+    @property
+    def not_(self):
+        # Same shape as postgrest: .not_.is_("col", "null") negates the next filter only
+        self._negate_next = True
+        return self
+
+    def or_(self, filters: str, **_):
+        self._filters.append(_compile_logic(filters, "or"))
+        return self
+
+    def order(self, column, desc: bool = False, **_):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int, **_):
+        self._limit = size
+        return self
+
+    def range(self, start: int, end: int, **_):
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    # ---- execution ----
+    def _matching(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [r for r in rows if all(f(r) for f in self._filters)]
+
+    def _project(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        if self._columns is None:
+            return copy.deepcopy(row)
+        return {c: copy.deepcopy(row.get(c)) for c in self._columns}
+
+    def execute(self) -> MemoryResponse:
+        self._client.query_count += 1
+        rows = self._client.tables.setdefault(self._table, [])
+
+        if self._action in ("insert", "upsert"):
+            payload = self._payload if isinstance(self._payload, list) else [self._payload]
+            written = []
+            for item in payload:
+                item = dict(item)
+                existing = None
+                if self._action == "upsert":
+                    keys = (self._on_conflict or "id").split(",")
+                    existing = next(
+                        (r for r in rows if all(k in item and r.get(k) == item[k] for k in keys)),
+                        None,
+                    )
+                if existing is not None:
+                    existing.update(item)
+                    written.append(copy.deepcopy(existing))
+                    continue
+                item.setdefault("id", next(self._client._ids[self._table]))
+                rows.append(item)
+                written.append(copy.deepcopy(item))
+            return MemoryResponse(written)
+
+        matched = self._matching(rows)
+
+        if self._action == "update":
+            for row in matched:
+                row.update(self._payload)
+            return MemoryResponse([copy.deepcopy(r) for r in matched])
+
+        if self._action == "delete":
+            doomed = {id(r) for r in matched}
+            self._client.tables[self._table] = [r for r in rows if id(r) not in doomed]
+            return MemoryResponse([copy.deepcopy(r) for r in matched])
+
+        for column, desc in reversed(self._order):
+            matched.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+
+        total = len(matched)
+        end = None if self._limit is None else self._offset + self._limit
+        page = matched[self._offset:end]
+        return MemoryResponse([self._project(r) for r in page], total if self._count else None)
+
+
+class _RpcCall:
+    def __init__(self, client: "MemoryClient", fn: Callable, params: Dict[str, Any]):
+        self._client = client
+        self._fn = fn
+        self._params = params
+
+    def execute(self) -> MemoryResponse:
+        self._client.query_count += 1
+        return MemoryResponse(self._fn(self._client, **self._params))
+
+
+class MemoryClient:
+    """Drop-in for supabase.Client backed by plain dicts."""
+
+    def __init__(self, tables: Optional[Dict[str, List[Dict[str, Any]]]] = None):
+        self.tables: Dict[str, List[Dict[str, Any]]] = tables or {}
+        self.functions: Dict[str, Callable] = {}
+        self.query_count = 0
+        self._ids = _IdCounters()
+        for name, rows in self.tables.items():
+            top = max((r.get("id", 0) for r in rows if isinstance(r.get("id"), int)), default=0)
+            self._ids.seed(name, top + 1)
+
+    def table(self, name: str) -> MemoryQuery:
+        return MemoryQuery(self, name)
+
+    def from_(self, name: str) -> MemoryQuery:
+        return self.table(name)
+
+    def register_rpc(self, name: str, fn: Callable) -> None:
+        """fn(client, **params) -> list of rows"""
+        self.functions[name] = fn
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> _RpcCall:
+        if name not in self.functions:
+            known = ", ".join(sorted(self.functions)) or "none"
+            raise ValueError(
+                f"RPC '{name}' is not registered on the memory backend (registered: {known}); "
+                f"add it with MemoryClient.register_rpc()"
+            )
+        return _RpcCall(self, self.functions[name], params or {})
+
+
+class _IdCounters(dict):
+    def __missing__(self, table: str):
+        counter = itertools.count(1)
+        self[table] = counter
+        return counter
+
+    def seed(self, table: str, start: int) -> None:
+        self[table] = itertools.count(start)
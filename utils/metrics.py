@@ -0,0 +1,69 @@
+"""
+In-process counters and latency samples, shown by /metrics.
+
+Nothing is persisted - numbers reset when the bot restarts.
+"""
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator
+
+SAMPLES_PER_TIMER = 500  # newest latencies kept per timer for percentiles
+
+_counters: Dict[str, int] = defaultdict(int)
+_samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=SAMPLES_PER_TIMER))
+_totals: Dict[str, int] = defaultdict(int)
+
+STARTED_AT = time.time()
+
+
+def incr(name: str, n: int = 1) -> None:
+    _counters[name] += n
+
+
+def observe(name: str, seconds: float) -> None:
+    _samples[name].append(seconds)
+    _totals[name] += 1
+
+
+@contextmanager
+def timer(name: str) -> Iterator[None]:
+    """`with metrics.timer("x"):` records the block's wall time, awaits included."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def counter(name: str) -> int:
+    return _counters.get(name, 0)
+
+
+def ratio(hit: str, miss: str) -> float | None:
+    """hit / (hit + miss), or None before anything was counted."""
+    hits, misses = counter(hit), counter(miss)
+    if hits + misses == 0:
+        return None
+    return hits / (hits + misses)
+
+
+def _percentile(ordered: list[float], pct: float) -> float:
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def snapshot() -> dict:
+    """{"counters": {...}, "timers": {name: {count, p50, p95, max}}} with times in ms."""
+    timers = {}
+    for name, samples in _samples.items():
+        if not samples:
+            continue
+        ordered = sorted(samples)
+        timers[name] = {
+            "count": _totals[name],
+            "p50": _percentile(ordered, 50) * 1000,
+            "p95": _percentile(ordered, 95) * 1000,
+            "max": ordered[-1] * 1000,
+        }
+    return {"counters": dict(_counters), "timers": timers, "uptime": time.time() - STARTED_AT}
@@ -0,0 +1,231 @@
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from utils.localdb import connect, lock_for
+from utils.supabase import get_supabase, execute_async
+
+DB_NAME = "outbox"
+
+MAX_ATTEMPTS = 20           # after this an entry is parked as "dead" for staff to look at
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 300
+SENT_RETENTION_DAYS = 7     # sent entries are kept this long; after that the Supabase row answers "already redeemed?"
+
+_SCHEMA = """
+create table if not exists outbox (
+    seq integer primary key autoincrement,
+    dedup_key text not null unique,
+    table_name text not null,
+    op text not null,
+    payload text not null,
+    match text,
+    unique_col text,
+    created_at real not null,
+    attempts integer not null default 0,
+    next_attempt_at real not null default 0,
+    last_error text,
+    status text not null default 'pending'
+);
+create index if not exists outbox_pending_idx on outbox (status, seq);
+"""
+
+_ready = False
+
+supabase = get_supabase()
+
+
+@dataclass
+class OutboxEntry:
+    seq: int
+    dedup_key: str
+    table_name: str
+    op: str                          # "insert" | "update"
+    payload: Dict[str, Any]
+    match: Optional[Dict[str, Any]]  # eq() filters for updates
+    unique_col: Optional[str]        # inserts skip if a row with this value already exists
+    created_at: float
+    attempts: int
+    next_attempt_at: float
+    last_error: Optional[str]
+    status: str                      # "pending" | "sent" | "dead"
+
+
+def _db():
+    global _ready
+    conn = connect(DB_NAME)
+    if not _ready:
+        with lock_for(DB_NAME):
+            conn.executescript(_SCHEMA)
+        _ready = True
+    return conn
+
+
+def _row_to_entry(row) -> OutboxEntry:
+    return OutboxEntry(
+        seq=row["seq"],
+        dedup_key=row["dedup_key"],
+        table_name=row["table_name"],
+        op=row["op"],
+        payload=json.loads(row["payload"]),
+        match=json.loads(row["match"]) if row["match"] else None,
+        unique_col=row["unique_col"],
+        created_at=row["created_at"],
+        attempts=row["attempts"],
+        next_attempt_at=row["next_attempt_at"],
+        last_error=row["last_error"],
+        status=row["status"],
+    )
+
+
+def enqueue(
+    table: str,
+    payload: Dict[str, Any],
+    dedup_key: str,
+    op: str = "insert",
+    match: Optional[Dict[str, Any]] = None,
+    unique_col: Optional[str] = None,
+) -> bool:
+    """
+    Commit a Supabase write locally; the replayer in commands/ops.py sends it later, in order.
+    Returns False if an entry with this dedup_key already exists (the write is already owed).
+    """
+    conn = _db()
+    with lock_for(DB_NAME):
+        cur = conn.execute(
+            "insert or ignore into outbox (dedup_key, table_name, op, payload, match, unique_col, created_at)"
+            " values (?, ?, ?, ?, ?, ?, ?)",
+            (
+                dedup_key,
+                table,
+                op,
+                json.dumps(payload, default=str),
+                json.dumps(match) if match else None,
+                unique_col,
+                time.time(),
+            ),
+        )
+    return cur.rowcount == 1
+
+
+def get(dedup_key: str) -> Optional[OutboxEntry]:
+    """The local entry for a dedup key, whether or not it has reached Supabase yet."""
+    conn = _db()
+    with lock_for(DB_NAME):
+        row = conn.execute("select * from outbox where dedup_key = ?", (dedup_key,)).fetchone()
+    return _row_to_entry(row) if row else None
+
+
+def pending(limit: int = 50) -> List[OutboxEntry]:
+    """Oldest unsent entries, in sequence order."""
+    conn = _db()
+    with lock_for(DB_NAME):
+        rows = conn.execute(
+            "select * from outbox where status = 'pending' order by seq limit ?", (limit,)
+        ).fetchall()
+    return [_row_to_entry(r) for r in rows]
+
+
+def dead(limit: int = 10) -> List[OutboxEntry]:
+    conn = _db()
+    with lock_for(DB_NAME):
+        rows = conn.execute(
+            "select * from outbox where status = 'dead' order by seq limit ?", (limit,)
+        ).fetchall()
+    return [_row_to_entry(r) for r in rows]
+
+
+def requeue_dead() -> int:
+    """Give parked entries another round of attempts (e.g. after fixing a schema problem)."""
+    conn = _db()
+    with lock_for(DB_NAME):
+        cur = conn.execute(
+            "update outbox set status = 'pending', attempts = 0, next_attempt_at = 0 where status = 'dead'"
+        )
+    return cur.rowcount
+
+
+def stats() -> Dict[str, int]:
+    conn = _db()
+    with lock_for(DB_NAME):
+        rows = conn.execute("select status, count(*) from outbox group by status").fetchall()
+    return {r[0]: r[1] for r in rows}
+
+
+def prune(retention_days: int = SENT_RETENTION_DAYS) -> int:
+    """Drop sent entries older than retention_days. Pending and dead entries are never pruned."""
+    cutoff = time.time() - retention_days * 86400
+    conn = _db()
+    with lock_for(DB_NAME):
+        cur = conn.execute("delete from outbox where status = 'sent' and created_at < ?", (cutoff,))
+    return cur.rowcount
+
+
+def _mark_sent(seq: int) -> None:
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.execute("update outbox set status = 'sent', last_error = null where seq = ?", (seq,))
+
+
+def _mark_failed(entry: OutboxEntry, error: str) -> str:
+    attempts = entry.attempts + 1
+    status = "dead" if attempts >= MAX_ATTEMPTS else "pending"
+    delay = min(RETRY_BASE_SECONDS * (2 ** (attempts - 1)), RETRY_MAX_SECONDS)
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.execute(
+            "update outbox set attempts = ?, last_error = ?, status = ?, next_attempt_at = ? where seq = ?",
+            (attempts, error[:500], status, time.time() + delay, entry.seq),
+        )
+    return status
+
+
+async def _send(entry: OutboxEntry) -> None:
+    table = supabase.table(entry.table_name)
+
+    if entry.op == "insert":
+        if entry.unique_col:
+            # A previous replay may have reached Supabase before we could mark it sent
+            value = entry.payload.get(entry.unique_col)
+            existing = await execute_async(
+                supabase.table(entry.table_name).select(entry.unique_col).eq(entry.unique_col, value).limit(1)
+            )
+            if existing.data:
+                return
+        await execute_async(table.insert(entry.payload))
+        return
+
+    if entry.op == "update":
+        query = table.update(entry.payload)
+        for column, value in (entry.match or {}).items():
+            query = query.eq(column, value)
+        await execute_async(query)
+        return
+
+    raise ValueError(f"Unknown outbox op '{entry.op}'")
+
+
+async def replay(limit: int = 50) -> Dict[str, int]:
+    """
+    Send due entries to Supabase in sequence order. Stops at the first failure so
+    later writes never overtake earlier ones.
+    """
+    sent = failed = 0
+    now = time.time()
+    for entry in pending(limit):
+        if entry.next_attempt_at > now:
+            # Head of the queue is backing off - nothing behind it may go first
+            break
+        try:
+            await _send(entry)
+        except Exception as e:
+            failed += 1
+            status = _mark_failed(entry, str(e))
+            print(f"[OUTBOX] #{entry.seq} {entry.dedup_key} failed ({status}): {e}")
+            if status == "pending":
+                break
+            continue
+        _mark_sent(entry.seq)
+        sent += 1
+    return {"sent": sent, "failed": failed}
@@ -0,0 +1,159 @@
+"""
+Single source of truth for turning a product/variant name into a plan and expiry.
+
+Rules live in plans.json (checked in order, first match wins). The variant name
+is matched first, then the product name. A name no rule recognises raises
+UnknownPlanError - it is never guessed as lifetime, the order goes to staff. The
+DB `expires_at` and the Luarmor `auth_expire` are both derived from one
+PlanExpiry so they can't disagree.
+"""
+import json
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta
+from functools import lru_cache
+from typing import List, Optional
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLANS_PATH = os.getenv("PLANS_PATH", os.path.join(BASE_DIR, "plans.json"))
+
+LUARMOR_LIFETIME = -1  # Luarmor: -1 = never expires
+
+UNIT_DAYS = {"day": 1, "week": 7, "month": 30, "year": 365}
+
+# Products that come with a Luarmor key; anything else (alts etc.) has no plan or expiry
+WHITELIST_PRODUCTS = ["fix it up", "fix-it-up", "fixitup"]
+
+
+class UnknownPlanError(ValueError):
+    """No plan rule matched the product/variant name."""
+
+
+@dataclass(frozen=True)
+class PlanExpiry:
+    expires_at: Optional[str]  # ISO string for role_redeem.expires_at, None = lifetime
+    auth_expire: int           # unix timestamp for Luarmor, -1 = lifetime
+
+    @property
+    def lifetime(self) -> bool:
+        return self.auth_expire == LUARMOR_LIFETIME
+
+    @property
+    def timestamp(self) -> Optional[int]:
+        return None if self.lifetime else self.auth_expire
+
+
+@dataclass(frozen=True)
+class Plan:
+    name: str
+    days: Optional[int]  # None = lifetime
+
+    @property
+    def lifetime(self) -> bool:
+        return self.days is None
+
+    def expiry(self, now: Optional[datetime] = None) -> PlanExpiry:
+        if self.days is None:
+            return PlanExpiry(None, LUARMOR_LIFETIME)
+        end = (now or datetime.now(timezone.utc)) + timedelta(days=self.days)
+        return PlanExpiry(end.isoformat(), int(end.timestamp()))
+
+
+@dataclass(frozen=True)
+class _Rule:
+    pattern: "re.Pattern"
+    name: Optional[str] = None
+    days: Optional[int] = None     # fixed length, None = lifetime
+    count: Optional[str] = None    # "$1": the count comes from a capture group...
+    unit: Optional[str] = None     # ...times a UNIT_DAYS unit (literal or "$2")
+
+    def plan(self, m: "re.Match") -> Optional[Plan]:
+        if self.count is None:
+            return Plan(self.name, self.days)
+        count = int(_group(m, self.count))
+        unit = _group(m, self.unit).lower()
+        if count <= 0 or unit not in UNIT_DAYS:
+            return None
+        return Plan(f"{count} {unit.title()}{'' if count == 1 else 's'}", count * UNIT_DAYS[unit])
+
+
+def _group(m: "re.Match", ref: str) -> str:
+    return m.group(int(ref[1:])) if ref.startswith("$") else ref
+
+
+_rules: Optional[List[_Rule]] = None
+
+
+def _load_rules() -> List[_Rule]:
+    global _rules
+    if _rules is None:
+        with open(PLANS_PATH, "r") as f:
+            data = json.load(f)
+        _rules = [
+            _Rule(
+                re.compile(r["pattern"], re.IGNORECASE),
+                name=r.get("name"),
+                days=r.get("days"),
+                count=r.get("count"),
+                unit=r.get("unit"),
+            )
+            for r in data.get("rules", [])
+        ]
+    return _rules
+
+
+def reload_rules() -> None:
+    """Re-read plans.json and drop memoized results."""
+    global _rules
+    _rules = None
+    resolve_plan.cache_clear()
+
+
+def _match(text: str, rules: List[_Rule]) -> Optional[Plan]:
+    for rule in rules:
+        m = rule.pattern.search(text)
+        if m:
+            return rule.plan(m)
+    return None
+
+
+@lru_cache(maxsize=1024)
+def resolve_plan(product_name: Optional[str], variant_name: Optional[str]) -> Plan:
+    """Plan for a product/variant pair. Variant wins over product; raises UnknownPlanError if neither matches."""
+    rules = _load_rules()
+    for text in (variant_name, product_name):
+        if text:
+            plan = _match(text, rules)
+            if plan:
+                return plan
+    raise UnknownPlanError(f"No plan rule matches product={product_name!r} variant={variant_name!r}")
+
+
+def plan_for_days(days: int) -> Plan:
+    """Explicit plan for staff-chosen durations (0 = lifetime)."""
+    if days <= 0:
+        return Plan("Lifetime", None)
+    return Plan(f"{days} Day{'' if days == 1 else 's'}", days)
+
+
+def compute_expiry(product_name: Optional[str], variant_name: Optional[str], now: Optional[datetime] = None) -> PlanExpiry:
+    """Canonical expiry for an order - use the result for both the DB and Luarmor. Raises UnknownPlanError."""
+    return resolve_plan(product_name, variant_name).expiry(now)
+
+
+def should_whitelist_product(product_name: Optional[str], variant_name: Optional[str]) -> bool:
+    """Check if this product should be whitelisted on Luarmor."""
+    combined = f"{product_name or ''} {variant_name or ''}".lower()
+    return any(p in combined for p in WHITELIST_PRODUCTS)
+
+
+def order_expiry(product_name: Optional[str], variant_name: Optional[str], now: Optional[datetime] = None) -> Optional[PlanExpiry]:
+    """
+    Expiry for a redeemed order. None for products without a Luarmor key: they
+    have no plan, and role_redeem.expires_at stays null. Whitelisted products
+    whose name no rule recognises still raise UnknownPlanError.
+    """
+    if not should_whitelist_product(product_name, variant_name):
+        return None
+    return compute_expiry(product_name, variant_name, now)
@@ -0,0 +1,75 @@
+"""
+Query helpers that keep round-trips and payloads visible.
+
+- select() refuses "*" so every read names the columns it needs.
+- query_budget(n) / track() count Supabase round-trips per command or task and
+  flag anything that goes over budget (raise with QUERY_BUDGET_STRICT=1).
+  tests/test_query_budgets.py runs the budgeted commands against the in-memory
+  backend and checks their counts.
+"""
+import os
+import functools
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from utils.supabase import get_supabase, current_tally, QueryTally
+
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "").strip() == "1"
+
+supabase = get_supabase()
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def select(table: str, columns: str, count: Optional[str] = None):
+    """supabase.table(table).select(columns) with an explicit projection."""
+    cols = [c.strip() for c in columns.split(",")]
+    if not cols or any(not c or c == "*" for c in cols):
+        raise ValueError(f"select() on '{table}' needs explicit columns, got {columns!r}")
+    if count:
+        return supabase.table(table).select(columns, count=count)
+    return supabase.table(table).select(columns)
+
+
+def _check(tally: QueryTally) -> None:
+    if tally.limit is None or tally.count <= tally.limit:
+        return
+    message = (
+        f"{tally.name} made {tally.count} Supabase round-trips (budget {tally.limit}): "
+        + ", ".join(tally.targets)
+    )
+    if QUERY_BUDGET_STRICT:
+        raise QueryBudgetExceeded(message)
+    print(f"[QUERY BUDGET] {message}")
+
+
+@contextmanager
+def track(name: str, limit: Optional[int] = None) -> Iterator[QueryTally]:
+    """Count round-trips made inside the block (including tasks it spawns and nested tallies)."""
+    tally = QueryTally(name, limit, parent=current_tally.get())
+    token = current_tally.set(tally)
+    try:
+        yield tally
+    finally:
+        current_tally.reset(token)
+    _check(tally)
+
+
+def query_budget(limit: int, name: Optional[str] = None):
+    """
+    Decorator for command callbacks: warn (or raise, in strict mode) when one
+    invocation makes more than `limit` Supabase round-trips.
+    Put it directly above the function, below the app_commands decorators.
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with track(label, limit):
+                return await func(*args, **kwargs)
+        wrapper.query_budget = limit  # read by tests/test_query_budgets.py
+        return wrapper
+    return decorator
@@ -0,0 +1,288 @@
+import os
+import json
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from utils.supabase import get_supabase, execute_async
+from utils.luarmor import get_all_users, update_user_expiry
+from utils.bulk import run_bulk, BulkResult
+from utils.localdb import data_path
+
+STATE_FILE = "reconcile_state.json"
+
+DRIFT_TOLERANCE_SECONDS = 120  # clock skew between our writes to the two sides
+IN_CHUNK_SIZE = 200            # discord_ids per in_() query
+PAGE_SIZE = 1000               # PostgREST's default max rows per response
+PAGE_OVERLAP = 50              # rows re-read per page in case writes shift the offsets mid-read
+APPLY_CONCURRENCY = 3
+APPLY_RATE_PER_SEC = 2.0       # Luarmor PATCHes + DB updates per second
+
+LIFETIME = -1
+
+supabase = get_supabase()
+
+
+@dataclass
+class Correction:
+    discord_id: int
+    action: str                  # "extend_db" | "extend_luarmor"
+    db_expire: int               # unix seconds, LIFETIME = never
+    luarmor_expire: int
+    row_id: Optional[int] = None
+    user_key: Optional[str] = None
+
+    @property
+    def target(self) -> int:
+        return max(self.db_expire, self.luarmor_expire)
+
+
+@dataclass
+class Issue:
+    discord_id: int
+    kind: str                    # "lifetime_mismatch" | "missing_luarmor" | "luarmor_only"
+    detail: str = ""
+
+
+@dataclass
+class ReconcilePlan:
+    checked: int = 0
+    corrections: List[Correction] = field(default_factory=list)
+    issues: List[Issue] = field(default_factory=list)
+    watermark: Optional[str] = None
+    snapshot: Dict[str, int] = field(default_factory=dict)
+
+
+# -----------------------------
+# STATE (watermark + last Luarmor snapshot)
+# -----------------------------
+def load_state() -> Dict[str, Any]:
+    try:
+        with open(data_path(STATE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(state: Dict[str, Any]) -> None:
+    path = data_path(STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+# -----------------------------
+# HELPERS
+# -----------------------------
+def _iso_to_ts(value: Optional[str]) -> int:
+    if not value:
+        return LIFETIME
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+def _ts_to_iso(ts: int) -> Optional[str]:
+    if ts == LIFETIME:
+        return None
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def _luarmor_expire(user: Dict[str, Any]) -> int:
+    value = user.get("auth_expire")
+    if value is None or int(value) == -1:
+        return LIFETIME
+    return int(value)
+
+
+async def _read_all(build: Callable[[], Any]) -> List[Dict[str, Any]]:
+    """
+    Every row of an ordered role_redeem select, paged with range() so the max-rows
+    cap can't truncate it. `build()` returns a fresh query (must select and order by id).
+    """
+    rows: Dict[Any, Dict[str, Any]] = {}
+    start = 0
+    while True:
+        resp = await execute_async(build().range(start, start + PAGE_SIZE - 1))
+        page = resp.data or []
+        for row in page:
+            rows.setdefault(row["id"], row)
+        if len(page) < PAGE_SIZE:
+            return list(rows.values())
+        start += PAGE_SIZE - PAGE_OVERLAP
+
+
+async def _changed_db_ids(watermark: str) -> tuple[Set[int], Optional[str]]:
+    """discord_ids whose role_redeem rows changed after `watermark`, plus the newest updated_at read."""
+    rows = await _read_all(
+        lambda: supabase.table("role_redeem").select("id, discord_id, updated_at")
+        .gt("updated_at", watermark).order("updated_at").order("id")
+    )
+    ids = {int(r["discord_id"]) for r in rows if r.get("discord_id")}
+    newest = max((r["updated_at"] for r in rows if r.get("updated_at")), default=None)
+    return ids, newest
+
+
+async def _active_rows(discord_ids: Optional[Set[int]]) -> Dict[int, Dict[str, Any]]:
+    """Latest active role_redeem row per discord_id (all active rows when discord_ids is None)."""
+    columns = "id, discord_id, expires_at, redeemed_at"
+    rows: List[Dict[str, Any]] = []
+    if discord_ids is None:
+        rows = await _read_all(
+            lambda: supabase.table("role_redeem").select(columns).eq("whitelisted", True).order("id")
+        )
+    else:
+        ids = sorted(discord_ids)
+        for i in range(0, len(ids), IN_CHUNK_SIZE):
+            chunk = ids[i:i + IN_CHUNK_SIZE]
+            rows.extend(await _read_all(
+                lambda: supabase.table("role_redeem").select(columns)
+                .eq("whitelisted", True).in_("discord_id", chunk).order("id")
+            ))
+
+    best: Dict[int, Dict[str, Any]] = {}
+    for row in rows:
+        if not row.get("discord_id"):
+            continue
+        uid = int(row["discord_id"])
+        # Lifetime beats everything, otherwise the furthest expiry wins
+        if uid not in best or _rank(row) > _rank(best[uid]):
+            best[uid] = row
+    return best
+
+
+def _rank(row: Dict[str, Any]) -> float:
+    ts = _iso_to_ts(row.get("expires_at"))
+    return float("inf") if ts == LIFETIME else ts
+
+
+# -----------------------------
+# PLAN
+# -----------------------------
+async def build_plan(full: bool = False) -> ReconcilePlan:
+    """
+    Pull both sides, join on discord_id and work out what has drifted.
+    Incremental runs only compare users whose DB rows changed since the stored
+    watermark or whose Luarmor auth_expire differs from the last snapshot.
+    """
+    state = {} if full else load_state()
+    started_at = datetime.now(timezone.utc).isoformat()
+
+    watermark = state.get("watermark")
+
+    luarmor_users = await get_all_users()
+    changed_ids, newest = await _changed_db_ids(watermark) if watermark else (set(), None)
+
+    luarmor: Dict[int, Dict[str, Any]] = {}
+    snapshot: Dict[str, int] = {}
+    for user in luarmor_users:
+        raw_id = user.get("discord_id")
+        if not raw_id or not str(raw_id).isdigit():
+            continue
+        luarmor[int(raw_id)] = user
+        snapshot[str(raw_id)] = _luarmor_expire(user)
+
+    if watermark:
+        previous = state.get("luarmor", {})
+        candidates = set(changed_ids)
+        candidates |= {int(k) for k, v in snapshot.items() if previous.get(k) != v}
+        candidates |= {int(k) for k in previous if k not in snapshot}
+        db_rows = await _active_rows(candidates) if candidates else {}
+    else:
+        candidates = None
+        db_rows = await _active_rows(None)
+
+    plan = ReconcilePlan(watermark=newest or started_at, snapshot=snapshot)
+    now = int(datetime.now(timezone.utc).timestamp())
+    ids = candidates if candidates is not None else set(db_rows) | set(luarmor)
+
+    for uid in sorted(ids):
+        row = db_rows.get(uid)
+        user = luarmor.get(uid)
+        plan.checked += 1
+
+        if row is None and user is None:
+            continue
+
+        if row is None:
+            lu = _luarmor_expire(user)
+            if lu == LIFETIME or lu > now:
+                plan.issues.append(Issue(uid, "luarmor_only", "active Luarmor key, no active DB row"))
+            continue
+
+        db = _iso_to_ts(row.get("expires_at"))
+        if user is None:
+            plan.issues.append(Issue(uid, "missing_luarmor", f"DB row {row['id']} active, no Luarmor key"))
+            continue
+
+        lu = _luarmor_expire(user)
+        if (db == LIFETIME) != (lu == LIFETIME):
+            side = "DB" if db == LIFETIME else "Luarmor"
+            plan.issues.append(Issue(uid, "lifetime_mismatch", f"lifetime on {side} only"))
+            continue
+        if db == lu or abs(db - lu) <= DRIFT_TOLERANCE_SECONDS:
+            continue
+
+        # Always move the earlier side forward - never cut anyone off
+        plan.corrections.append(Correction(
+            discord_id=uid,
+            action="extend_db" if lu > db else "extend_luarmor",
+            db_expire=db,
+            luarmor_expire=lu,
+            row_id=row["id"],
+            user_key=user.get("user_key"),
+        ))
+
+    return plan
+
+
+# -----------------------------
+# APPLY
+# -----------------------------
+async def _apply_one(item: Dict[str, Any]):
+    c: Correction = item["correction"]
+    if c.action == "extend_db":
+        await execute_async(
+            supabase.table("role_redeem").update({"expires_at": _ts_to_iso(c.target)}).eq("id", c.row_id)
+        )
+        return True, f"DB expiry -> {c.target}"
+
+    if not c.user_key:
+        return False, "no user_key"
+    if not await update_user_expiry(c.user_key, c.target):
+        return False, "Luarmor update failed"
+    return True, f"Luarmor expiry -> {c.target}"
+
+
+async def apply_plan(plan: ReconcilePlan) -> List[BulkResult]:
+    """Apply corrections in rate-limited batches, then advance the watermark."""
+    items = [{"discord_id": c.discord_id, "action": c.action, "correction": c} for c in plan.corrections]
+    results = await run_bulk(items, _apply_one, concurrency=APPLY_CONCURRENCY, rate_per_sec=APPLY_RATE_PER_SEC)
+
+    # Record what Luarmor looks like now so our own PATCHes don't show up as drift next run
+    snapshot = dict(plan.snapshot)
+    for r in results:
+        c = r.item["correction"]
+        if r.ok and c.action == "extend_luarmor":
+            snapshot[str(c.discord_id)] = c.target
+        elif not r.ok:
+            # Force a re-check of failed users next run
+            snapshot.pop(str(c.discord_id), None)
+
+    save_state({"watermark": plan.watermark, "luarmor": snapshot})
+    return results
+
+
+def format_plan(plan: ReconcilePlan, limit: int = 15) -> List[str]:
+    """Human-readable change plan for dry runs and logs."""
+    def fmt(ts: int) -> str:
+        return "lifetime" if ts == LIFETIME else f"<t:{ts}:d>"
+
+    lines = []
+    for c in plan.corrections[:limit]:
+        side = "DB" if c.action == "extend_db" else "Luarmor"
+        lines.append(
+            f"<@{c.discord_id}>: {side} {fmt(min(c.db_expire, c.luarmor_expire))} -> {fmt(c.target)}"
+        )
+    if len(plan.corrections) > limit:
+        lines.append(f"...and {len(plan.corrections) - limit} more")
+    return lines
@@ -0,0 +1,242 @@
+"""
+Refund/chargeback sweeper.
+
+Redeem only checks the invoice once. This pages through SellAuth invoices
+updated since the stored watermark (newest first, stopping at the watermark,
+resuming where the last pass stopped if it was capped), joins the
+refunded/cancelled ones against role_redeem.invoice_id and revokes access in a
+rate-limited pass: Premium role, Luarmor key and a revoked_at flag on the row.
+Users who still hold another active purchase only get the row flagged.
+Revocations that fail are kept in the state file and retried on the next sweep;
+they don't hold back the watermark.
+"""
+import os
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+import discord
+
+from utils import sellauth, history
+from utils.supabase import get_supabase, execute_async
+from utils.luarmor import delete_user, delete_user_by_discord
+from utils.members import member_resolver
+from utils.bulk import run_bulk, BulkResult
+from utils.localdb import data_path
+
+STATE_FILE = "refund_sweep_state.json"
+
+PAGE_SIZE = 100
+PAGE_CONCURRENCY = 3
+MAX_PAGES = 20                 # per sweep; a longer delta is resumed on the next run
+INITIAL_LOOKBACK_DAYS = 14     # first run starts here instead of reading the whole history
+OVERLAP_SECONDS = 300          # re-read a little before the watermark (same-second updates, clock skew)
+IN_CHUNK_SIZE = 200            # invoice/discord ids per in_() query
+REVOKE_CONCURRENCY = 2
+REVOKE_RATE_PER_SEC = 1.0      # users revoked per second (role edit + Luarmor delete + DB update)
+
+supabase = get_supabase()
+
+
+@dataclass
+class Revocation:
+    discord_id: int
+    rows: List[Dict[str, Any]]   # role_redeem rows (id, invoice_id, product_name, variant_name)
+    reasons: Dict[str, str]      # invoice_id -> "refunded" | "cancelled"
+    keep_access: bool = False    # another active purchase still covers this user
+
+
+@dataclass
+class SweepPlan:
+    scanned: int = 0
+    flagged_invoices: Dict[str, str] = field(default_factory=dict)
+    revocations: List[Revocation] = field(default_factory=list)
+    stale_prekeys: Dict[str, str] = field(default_factory=dict)   # invoice_id -> unclaimed Luarmor key
+    retried: int = 0                                                # flagged invoices carried over from failed revocations
+    next_state: Dict[str, Any] = field(default_factory=dict)        # cursor to save once the plan is applied
+    complete: bool = True
+
+
+# -----------------------------
+# STATE (watermark)
+# -----------------------------
+def load_state() -> Dict[str, Any]:
+    try:
+        with open(data_path(STATE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(state: Dict[str, Any]) -> None:
+    path = data_path(STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+# -----------------------------
+# JOIN
+# -----------------------------
+async def _unrevoked_rows(invoice_ids: List[str]) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    for i in range(0, len(invoice_ids), IN_CHUNK_SIZE):
+        resp = await execute_async(
+            supabase.table("role_redeem")
+            .select("id, discord_id, invoice_id, product_name, variant_name, revoked_at")
+            .in_("invoice_id", invoice_ids[i:i + IN_CHUNK_SIZE])
+        )
+        rows.extend(r for r in (resp.data or []) if r.get("discord_id") and not r.get("revoked_at"))
+    return rows
+
+
+async def _still_covered(discord_ids: List[int], excluded_invoices: Set[str]) -> Set[int]:
+    """discord_ids with an active purchase that isn't being revoked."""
+    now = datetime.now(timezone.utc)
+    covered: Set[int] = set()
+    for i in range(0, len(discord_ids), IN_CHUNK_SIZE):
+        resp = await execute_async(
+            supabase.table("role_redeem")
+            .select("discord_id, invoice_id, expires_at")
+            .eq("whitelisted", True)
+            .in_("discord_id", discord_ids[i:i + IN_CHUNK_SIZE])
+        )
+        for r in resp.data or []:
+            if r.get("invoice_id") in excluded_invoices:
+                continue
+            expires = r.get("expires_at")
+            if expires is None or datetime.fromisoformat(expires.replace("Z", "+00:00")) > now:
+                covered.add(int(r["discord_id"]))
+    return covered
+
+
+# -----------------------------
+# PLAN
+# -----------------------------
+async def build_plan(since: Optional[float] = None, dry_run: bool = False) -> SweepPlan:
+    """
+    Read the delta since the watermark (or `since`) and work out who loses access.
+    A dry run leaves the local invoice index untouched.
+    """
+    state = load_state()
+    if since is not None:
+        state = {"watermark": since, "retry": state.get("retry", {})}
+    plan = SweepPlan()
+
+    changed, plan.next_state, plan.complete = await sellauth.read_delta(
+        state,
+        default_since=time.time() - INITIAL_LOOKBACK_DAYS * 86400,
+        overlap=OVERLAP_SECONDS,
+        concurrency=PAGE_CONCURRENCY,
+        max_pages=MAX_PAGES,
+        per_page=PAGE_SIZE,
+    )
+    plan.scanned = len(changed)
+
+    # Revocations that failed last time; rows already revoked drop out in _unrevoked_rows
+    for invoice_id, reason in state.get("retry", {}).items():
+        if invoice_id not in plan.flagged_invoices:
+            plan.flagged_invoices[invoice_id] = reason
+            plan.retried += 1
+
+    for invoice in changed:
+        invoice_id = str(invoice["id"]).strip()
+        previous = sellauth.indexed_invoice(invoice_id)
+        if not dry_run:
+            sellauth.index_invoice(invoice, source="sweep", invoice_id=invoice_id)
+
+        _, refunded, cancelled, _ = sellauth.invoice_status(invoice)
+        if not (refunded or cancelled):
+            continue
+        plan.flagged_invoices[invoice_id] = "refunded" if refunded else "cancelled"
+        if previous and previous.get("prekey"):
+            plan.stale_prekeys[invoice_id] = previous["prekey"]
+
+    if not plan.flagged_invoices:
+        return plan
+
+    by_user: Dict[int, Revocation] = {}
+    for row in await _unrevoked_rows(sorted(plan.flagged_invoices)):
+        uid = int(row["discord_id"])
+        rev = by_user.setdefault(uid, Revocation(discord_id=uid, rows=[], reasons={}))
+        rev.rows.append(row)
+        rev.reasons[row["invoice_id"]] = plan.flagged_invoices[row["invoice_id"]]
+
+    covered = await _still_covered(sorted(by_user), set(plan.flagged_invoices)) if by_user else set()
+    for uid, rev in by_user.items():
+        rev.keep_access = uid in covered
+        plan.revocations.append(rev)
+    return plan
+
+
+# -----------------------------
+# APPLY
+# -----------------------------
+async def apply_plan(plan: SweepPlan, guild: Optional[discord.Guild], role_id: int) -> List[BulkResult]:
+    """Revoke in rate-limited batches, drop unclaimed pre-created keys, then save the cursor."""
+    for invoice_id, user_key in plan.stale_prekeys.items():
+        sellauth.set_prekey(invoice_id, None)
+        await delete_user(user_key)
+
+    role = guild.get_role(role_id) if guild else None
+    members = await member_resolver.resolve_many(
+        guild, [r.discord_id for r in plan.revocations if not r.keep_access]
+    ) if guild else {}
+
+    async def worker(item):
+        rev: Revocation = item["revocation"]
+        steps = []
+        if not rev.keep_access:
+            member = members.get(rev.discord_id)
+            if member and role and role in member.roles:
+                await member.remove_roles(role, reason="Invoice refunded/cancelled")
+                steps.append("role removed")
+            if await delete_user_by_discord(rev.discord_id):
+                steps.append("key deleted")
+
+        revoked_at = datetime.now(timezone.utc).isoformat()
+        for row in rev.rows:
+            await execute_async(
+                supabase.table("role_redeem").update({
+                    "whitelisted": False,
+                    "revoked_at": revoked_at,
+                    "revoke_reason": rev.reasons[row["invoice_id"]],
+                }).eq("id", row["id"])
+            )
+        history.invalidate(rev.discord_id)
+        steps.append(f"{len(rev.rows)} row(s) flagged")
+        if rev.keep_access:
+            steps.append("access kept (other active purchase)")
+        return True, ", ".join(steps)
+
+    items = [
+        {"discord_id": r.discord_id, "invoices": " ".join(sorted(r.reasons)), "revocation": r}
+        for r in plan.revocations
+    ]
+    results = await run_bulk(items, worker, concurrency=REVOKE_CONCURRENCY, rate_per_sec=REVOKE_RATE_PER_SEC)
+
+    # Failed users are retried by invoice next sweep; the cursor moves on regardless
+    retry = {}
+    for r in results:
+        if not r.ok:
+            retry.update(r.item["revocation"].reasons)
+    if retry:
+        print(f"[REFUNDS] {len(retry)} invoice(s) queued for retry")
+    if not plan.complete:
+        print(f"[REFUNDS] Delta not fully read ({plan.scanned} invoice(s)) - resuming next sweep")
+    save_state({**plan.next_state, "retry": retry, "swept_at": time.time()})
+    return results
+
+
+def format_plan(plan: SweepPlan, limit: int = 15) -> List[str]:
+    lines = []
+    for rev in plan.revocations[:limit]:
+        invoices = ", ".join(f"`{i}` ({reason})" for i, reason in rev.reasons.items())
+        suffix = " - row only, other purchase active" if rev.keep_access else ""
+        lines.append(f"<@{rev.discord_id}>: {invoices}{suffix}")
+    if len(plan.revocations) > limit:
+        lines.append(f"...and {len(plan.revocations) - limit} more")
+    return lines
@@ -1,5 +1,10 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple, Dict, Iterable, List
+
 import aiohttp
-from typing import Optional, Tuple
+from aiohttp import ClientTimeout
 
 # Gamepass IDs and prices (in Robux, before fees)
 GAMEPASSES = {
@@ -8,65 +13,200 @@ GAMEPASSES = {
     125899946: {"name": "Lifetime", "price": 4000, "days": None}  # None = lifetime
 }
 
+USERS_URL = "https://users.roblox.com/v1/usernames/users"
+USER_URL = "https://users.roblox.com/v1/users/{user_id}"
+INVENTORY_URL = "https://inventory.roblox.com/v1/users/{user_id}/items/GamePass/{gamepass_id}"
+
+REQUEST_TIMEOUT = ClientTimeout(total=8, connect=3)
+USERNAMES_PER_REQUEST = 100  # users.roblox.com batch limit
+
+USERNAME_CACHE_SIZE = 2048
+USERNAME_CACHE_TTL = 6 * 3600  # username -> ID rarely changes
+
+
+class _LRUTTLCache:
+    """Small LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[int]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: int) -> None:
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class RobloxClient:
+    """Roblox API client with one pooled session and a cached username lookup."""
+
+    def __init__(self, timeout: ClientTimeout = REQUEST_TIMEOUT):
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._user_ids = _LRUTTLCache(USERNAME_CACHE_SIZE, USERNAME_CACHE_TTL)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    async def resolve_usernames(self, usernames: Iterable[str]) -> Dict[str, Optional[int]]:
+        """
+        Resolve many usernames to user IDs, 100 per request.
+        Returns {lowercased username: user_id or None}.
+        """
+        result: Dict[str, Optional[int]] = {}
+        missing: List[str] = []
+
+        for name in dict.fromkeys(u.strip().lower() for u in usernames if u and u.strip()):
+            cached = self._user_ids.get(name)
+            if cached is not None:
+                result[name] = cached
+            else:
+                missing.append(name)
+
+        session = self._get_session()
+        for i in range(0, len(missing), USERNAMES_PER_REQUEST):
+            chunk = missing[i:i + USERNAMES_PER_REQUEST]
+            for name in chunk:
+                result[name] = None
+            try:
+                async with session.post(
+                    USERS_URL,
+                    json={"usernames": chunk, "excludeBannedUsers": False},
+                ) as resp:
+                    if resp.status != 200:
+                        print(f"[ROBLOX] Username lookup returned {resp.status}")
+                        continue
+                    data = await resp.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"[ROBLOX ERROR] Failed to resolve usernames: {e}")
+                continue
+
+            for item in data.get("data", []):
+                requested = (item.get("requestedUsername") or item.get("name") or "").lower()
+                user_id = item.get("id")
+                if requested and user_id:
+                    result[requested] = user_id
+                    self._user_ids.set(requested, user_id)
+
+        return result
+
+    async def get_user_id(self, username: str) -> Optional[int]:
+        resolved = await self.resolve_usernames([username])
+        return resolved.get(username.strip().lower())
+
+    async def get_description(self, user_id: int) -> Optional[str]:
+        """The profile "About" text, or None if Roblox couldn't be reached."""
+        try:
+            async with self._get_session().get(USER_URL.format(user_id=user_id)) as resp:
+                if resp.status != 200:
+                    print(f"[ROBLOX] Profile lookup returned {resp.status} for {user_id}")
+                    return None
+                data = await resp.json()
+                return data.get("description") or ""
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"[ROBLOX ERROR] Failed to fetch profile: {e}")
+            return None
+
+    async def owns_gamepass(self, user_id: int, gamepass_id: int) -> Optional[bool]:
+        """True/False for ownership, None if Roblox couldn't be reached."""
+        url = INVENTORY_URL.format(user_id=user_id, gamepass_id=gamepass_id)
+        try:
+            async with self._get_session().get(url) as resp:
+                if resp.status != 200:
+                    print(f"[ROBLOX] Inventory check returned {resp.status} for {user_id}/{gamepass_id}")
+                    return None
+                data = await resp.json()
+                # If data array is not empty, user owns the gamepass
+                return len(data.get("data", [])) > 0
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"[ROBLOX ERROR] Failed to check gamepass: {e}")
+            return None
+
+    async def owned_gamepasses(
+        self, user_id: int, gamepass_ids: Iterable[int] = GAMEPASSES
+    ) -> Dict[int, Optional[bool]]:
+        """Check several gamepasses for one user in parallel."""
+        ids = list(gamepass_ids)
+        results = await asyncio.gather(*(self.owns_gamepass(user_id, gp) for gp in ids))
+        return dict(zip(ids, results))
+
+
+roblox = RobloxClient()
+
+
 async def get_user_id_from_username(username: str) -> Optional[int]:
     """Get Roblox user ID from username"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            # Try the new API first
-            async with session.post(
-                "https://users.roblox.com/v1/usernames/users",
-                json={"usernames": [username], "excludeBannedUsers": False}
-            ) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    if data.get("data") and len(data["data"]) > 0:
-                        return data["data"][0]["id"]
-        return None
-    except Exception as e:
-        print(f"[ROBLOX ERROR] Failed to get user ID: {e}")
-        return None
+    return await roblox.get_user_id(username)
+
 
 async def check_gamepass_ownership(user_id: int, gamepass_id: int) -> bool:
     """Check if a Roblox user owns a specific gamepass"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            url = f"https://inventory.roblox.com/v1/users/{user_id}/items/GamePass/{gamepass_id}"
-            async with session.get(url) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    # If data array is not empty, user owns the gamepass
-                    return len(data.get("data", [])) > 0
-        return False
-    except Exception as e:
-        print(f"[ROBLOX ERROR] Failed to check gamepass: {e}")
-        return False
+    return bool(await roblox.owns_gamepass(user_id, gamepass_id))
+
+
+async def find_owned_gamepasses(username: str) -> Tuple[Optional[int], Dict[int, Optional[bool]]]:
+    """
+    Which of our gamepasses does this Roblox user own?
+    Returns: (roblox_user_id, {gamepass_id: owned}) - user_id is None if not found.
+    """
+    user_id = await roblox.get_user_id(username)
+    if not user_id:
+        return None, {}
+    return user_id, await roblox.owned_gamepasses(user_id)
+
 
 async def verify_gamepass_purchase(username: str, gamepass_id: int) -> Tuple[bool, Optional[int], str]:
     """
     Verify a gamepass purchase.
     Returns: (success, roblox_user_id, message)
     """
+    # Check if valid gamepass
+    if gamepass_id not in GAMEPASSES:
+        return False, None, f"Invalid gamepass ID: {gamepass_id}"
+
     # Get user ID
-    user_id = await get_user_id_from_username(username)
+    user_id = await roblox.get_user_id(username)
     if not user_id:
         return False, None, f"Could not find Roblox user '{username}'"
-    
-    # Check if valid gamepass
-    if gamepass_id not in GAMEPASSES:
-        return False, user_id, f"Invalid gamepass ID: {gamepass_id}"
-    
+
     # Check ownership
-    owns_gamepass = await check_gamepass_ownership(user_id, gamepass_id)
+    owns_gamepass = await roblox.owns_gamepass(user_id, gamepass_id)
+    if owns_gamepass is None:
+        return False, user_id, "Roblox API unavailable, try again shortly"
     if not owns_gamepass:
         gamepass_name = GAMEPASSES[gamepass_id]["name"]
         return False, user_id, f"User '{username}' does not own the {gamepass_name} gamepass"
-    
+
     return True, user_id, "Verified"
 
+
 def get_gamepass_info(gamepass_id: int) -> Optional[dict]:
     """Get gamepass info by ID"""
     return GAMEPASSES.get(gamepass_id)
 
+
 def get_all_gamepasses() -> dict:
     """Get all gamepass info"""
     return GAMEPASSES
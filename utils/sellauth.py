@@ -0,0 +1,443 @@
+import os
+import json
+import time
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import ClientTimeout
+
+from utils import admission
+from utils.localdb import connect, lock_for
+
+SELLAUTH_API_KEY = (os.getenv("SELLAUTH_API_KEY") or "").strip()
+SELLAUTH_SHOP_ID = (os.getenv("SELLAUTH_SHOP_ID") or "").strip()
+
+BASE_URL = "https://api.sellauth.com/v1"
+REQUEST_TIMEOUT = ClientTimeout(total=8, connect=3)
+
+PAID_STATUSES = {"paid", "completed", "complete"}
+
+DB_NAME = "invoices"
+
+_SCHEMA = """
+create table if not exists invoices (
+    invoice_id text primary key,
+    status text not null,
+    paid integer not null,
+    refunded integer not null,
+    cancelled integer not null,
+    product_name text,
+    variant_name text,
+    payload text not null,
+    source text not null,
+    received_at real not null,
+    prekey text,
+    prekey_expire integer,
+    updated_at real
+);
+create table if not exists webhook_deliveries (
+    digest text primary key,
+    received_at real not null
+);
+"""
+
+# Columns added after the first release (older data/invoices.db files lack them)
+_ADDED_COLUMNS = {"updated_at": "real"}
+
+# Webhook deliveries are remembered this long to drop replays (older ones are refused as stale)
+DELIVERY_MEMORY_SECONDS = 3600
+
+_ready = False
+_session: Optional[aiohttp.ClientSession] = None
+
+
+# -----------------------------
+# PARSING
+# -----------------------------
+def invoice_status(invoice: Optional[dict]) -> Tuple[bool, bool, bool, str]:
+    """(paid, refunded, cancelled, status) for a SellAuth invoice."""
+    if not invoice:
+        return False, False, False, "not_found"
+
+    status = (invoice.get("status") or "unknown").lower()
+    refunded = bool(invoice.get("refunded", False))
+    cancelled = bool(invoice.get("cancelled", False))
+
+    paid = status in PAID_STATUSES and not refunded and not cancelled
+    return paid, refunded, cancelled, status
+
+
+def invoice_is_paid(invoice: dict) -> bool:
+    return invoice_status(invoice)[0]
+
+
+def invoice_updated_at(invoice: dict) -> Optional[float]:
+    """Unix seconds of the invoice's last change (updated_at, else created_at)."""
+    value = invoice.get("updated_at") or invoice.get("created_at")
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def extract_product_and_variant(invoice: Optional[dict]) -> Tuple[str, str]:
+    """
+    invoice['items'][0]['product']['name'] and ['variant']['name'].
+    A missing variant falls back to the product name so plan matching still works.
+    """
+    if not invoice:
+        return "Unknown", "Standard"
+
+    items = invoice.get("items")
+    if isinstance(items, list) and items and isinstance(items[0], dict):
+        first = items[0]
+        product = first.get("product") or {}
+        variant = first.get("variant") or {}
+
+        product_name = None
+        variant_name = None
+        if isinstance(product, dict):
+            product_name = product.get("name") or product.get("title")
+        if isinstance(variant, dict):
+            variant_name = variant.get("name") or variant.get("title")
+
+        if product_name:
+            product_name = str(product_name).strip()
+            return product_name, str(variant_name or product_name).strip()
+
+    return "Unknown", "Standard"
+
+
+# -----------------------------
+# API
+# -----------------------------
+def _get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            timeout=REQUEST_TIMEOUT,
+            connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300),
+        )
+    return _session
+
+
+async def close() -> None:
+    if _session and not _session.closed:
+        await _session.close()
+
+
+async def fetch_invoice(invoice_id: str) -> Optional[dict]:
+    """
+    Pull one invoice from the SellAuth API. None if missing or unreachable.
+    Raises admission.UpstreamBusy when too many SellAuth calls are already in flight.
+    """
+    if not SELLAUTH_API_KEY or not SELLAUTH_SHOP_ID:
+        return None
+
+    url = f"{BASE_URL}/shops/{SELLAUTH_SHOP_ID}/invoices/{invoice_id}"
+    headers = {"Authorization": f"Bearer {SELLAUTH_API_KEY}"}
+
+    try:
+        async with admission.upstream("sellauth"):
+            async with _get_session().get(url, headers=headers) as resp:
+                if resp.status == 404:
+                    admission.remember_missing(invoice_id)
+                if resp.status != 200:
+                    return None
+                return await resp.json()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"[SELLAUTH ERROR] Failed to fetch invoice {invoice_id}: {e}")
+        return None
+
+
+async def list_invoices(page: int, per_page: int = 100) -> Optional[Tuple[List[dict], int]]:
+    """
+    One page of the shop's invoices, most recently updated first.
+    Returns (invoices, last_page), or None if SellAuth couldn't be reached.
+    """
+    if not SELLAUTH_API_KEY or not SELLAUTH_SHOP_ID:
+        return None
+
+    url = f"{BASE_URL}/shops/{SELLAUTH_SHOP_ID}/invoices"
+    headers = {"Authorization": f"Bearer {SELLAUTH_API_KEY}"}
+    params = {"page": page, "perPage": per_page, "orderColumn": "updated_at", "orderDirection": "desc"}
+
+    try:
+        async with admission.upstream("sellauth"):
+            async with _get_session().get(url, headers=headers, params=params) as resp:
+                if resp.status != 200:
+                    print(f"[SELLAUTH ERROR] Invoice list page {page}: HTTP {resp.status}")
+                    return None
+                body = await resp.json()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"[SELLAUTH ERROR] Failed to list invoices (page {page}): {e}")
+        return None
+
+    if isinstance(body, list):
+        return body, page if len(body) < per_page else page + 1
+    invoices = body.get("data") or []
+    return invoices, int(body.get("last_page") or page)
+
+
+async def _first_page_at_or_below(until: float, last_page: int, per_page: int) -> Optional[int]:
+    """Binary search the newest-first listing for the first page holding an invoice updated <= until."""
+    lo, hi = 1, last_page
+    while lo < hi:
+        mid = (lo + hi) // 2
+        result = await list_invoices(mid, per_page)
+        if result is None:
+            return None
+        stamps = [t for t in map(invoice_updated_at, result[0]) if t is not None]
+        if stamps and min(stamps) > until:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+async def invoices_updated_since(
+    since: float,
+    until: Optional[float] = None,
+    concurrency: int = 3,
+    max_pages: int = 20,
+    per_page: int = 100,
+) -> Tuple[List[dict], Optional[float], Optional[float], bool]:
+    """
+    Every invoice updated in [since, until] (until=None: no upper bound), read
+    newest-first from the paged list. With `until` set, reading starts at the page
+    holding it (binary search) instead of page 1. Pages are fetched `concurrency`
+    at a time and paging stops at the first wave that reaches `since`.
+
+    Returns (invoices, newest, oldest, complete). Reading is newest-first, so the
+    invoices always cover [oldest, until] without gaps; complete is False when a
+    page failed or max_pages was hit, and the caller resumes below `oldest`
+    (see read_delta).
+    """
+    found: Dict[str, dict] = {}
+    newest: Optional[float] = None
+    oldest: Optional[float] = None
+
+    def take(invoices: List[dict]) -> bool:
+        """Collect one page; True once it reaches `since`."""
+        nonlocal newest, oldest
+        for invoice in invoices:
+            updated = invoice_updated_at(invoice)
+            if updated is None or invoice.get("id") is None:
+                continue
+            if updated < since:
+                return True
+            if until is not None and updated > until:
+                continue
+            # Pages shift while we read them, so the same invoice can show up twice
+            found.setdefault(str(invoice["id"]).strip(), invoice)
+            newest = max(newest or updated, updated)
+            oldest = min(oldest or updated, updated)
+        return not invoices
+
+    def done(complete: bool):
+        return list(found.values()), newest, oldest, complete
+
+    first = await list_invoices(1, per_page)
+    if first is None:
+        return done(False)
+    invoices, last_page = first
+
+    page = 1
+    if until is not None and last_page > 1:
+        page = await _first_page_at_or_below(until, last_page, per_page)
+        if page is None:
+            return done(False)
+    read = 0
+    if page == 1:
+        if take(invoices):
+            return done(True)
+        page, read = 2, 1
+
+    while page <= last_page:
+        if read >= max_pages:
+            return done(False)
+        wave = range(page, min(last_page, page + concurrency - 1, page + max_pages - read - 1) + 1)
+        results = await asyncio.gather(*(list_invoices(p, per_page) for p in wave))
+        for result in results:
+            if result is None:
+                return done(False)
+            if take(result[0]):
+                return done(True)
+        read += len(wave)
+        page = wave.stop
+
+    return done(True)
+
+
+async def read_delta(
+    state: Dict[str, Any],
+    default_since: float,
+    overlap: float,
+    **kwargs,
+) -> Tuple[List[dict], Dict[str, Any], bool]:
+    """
+    Incremental read driven by a watermark state dict. Returns (invoices, next_state,
+    complete); save next_state once the invoices are processed.
+
+    A pass that stops early (max_pages, a failed page) keeps the watermark and records
+    where to resume: the next call reads only below `resume_below`, so a delta larger
+    than one pass finishes over several runs instead of re-reading the newest pages.
+    Once the gap is closed the watermark jumps to the newest invoice of the first pass.
+    """
+    since = (state.get("watermark") or default_since) - overlap
+    until = state.get("resume_below")
+    invoices, newest, oldest, complete = await invoices_updated_since(since, until=until, **kwargs)
+
+    next_state = dict(state)
+    if complete:
+        next_state.pop("resume_below", None)
+        next_state.pop("resume_newest", None)
+        watermark = state.get("resume_newest") if until is not None else newest
+        if watermark:
+            next_state["watermark"] = watermark
+    elif oldest is not None:
+        # Everything in [oldest, until] is read; ties at `oldest` are simply re-read
+        next_state["resume_below"] = oldest
+        next_state["resume_newest"] = state.get("resume_newest") or newest
+    return invoices, next_state, complete
+
+
+# -----------------------------
+# LOCAL INVOICE INDEX (filled by the webhook receiver)
+# -----------------------------
+def _db():
+    global _ready
+    conn = connect(DB_NAME)
+    if not _ready:
+        with lock_for(DB_NAME):
+            conn.executescript(_SCHEMA)
+            have = {r["name"] for r in conn.execute("pragma table_info(invoices)").fetchall()}
+            for column, kind in _ADDED_COLUMNS.items():
+                if column not in have:
+                    conn.execute(f"alter table invoices add column {column} {kind}")
+        _ready = True
+    return conn
+
+
+def _replaces(current, paid: bool, updated_at: Optional[float], source: str) -> bool:
+    """Whether an incoming copy of an invoice may overwrite the indexed one."""
+    if current is None:
+        return True
+    # A webhook never revives a refunded/cancelled order (retried, reordered or replayed delivery)
+    if source == "webhook" and paid and (current["refunded"] or current["cancelled"]):
+        return False
+    if updated_at is not None and current["updated_at"] is not None:
+        return updated_at >= current["updated_at"]
+    return True
+
+
+def index_invoice(invoice: dict, source: str, invoice_id: Optional[str] = None) -> str:
+    """Store/refresh an invoice in the local index (keyed by invoice_id or the payload's id)."""
+    invoice_id = str(invoice_id or invoice["id"]).strip()
+    admission.forget_missing(invoice_id)
+    paid, refunded, cancelled, status = invoice_status(invoice)
+    product_name, variant_name = extract_product_and_variant(invoice)
+
+    updated_at = invoice_updated_at(invoice)
+
+    conn = _db()
+    with lock_for(DB_NAME):
+        current = conn.execute(
+            "select refunded, cancelled, updated_at from invoices where invoice_id = ?", (invoice_id,)
+        ).fetchone()
+        if not _replaces(current, paid, updated_at, source):
+            print(f"[SELLAUTH] Kept indexed invoice {invoice_id}: {source} copy ({status}) is older or would un-refund it")
+            return invoice_id
+        conn.execute(
+            """
+            insert into invoices (invoice_id, status, paid, refunded, cancelled, product_name, variant_name,
+                                  payload, source, received_at, updated_at)
+            values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            on conflict(invoice_id) do update set
+                status = excluded.status, paid = excluded.paid, refunded = excluded.refunded,
+                cancelled = excluded.cancelled, product_name = excluded.product_name,
+                variant_name = excluded.variant_name, payload = excluded.payload,
+                source = excluded.source, received_at = excluded.received_at,
+                updated_at = excluded.updated_at
+            """,
+            (invoice_id, status, int(paid), int(refunded), int(cancelled), product_name, variant_name,
+             json.dumps(invoice), source, time.time(), updated_at),
+        )
+    return invoice_id
+
+
+def remember_delivery(digest: str) -> bool:
+    """Record a webhook delivery; False if the same delivery was already seen (a replay or retry)."""
+    now = time.time()
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.execute("delete from webhook_deliveries where received_at < ?", (now - DELIVERY_MEMORY_SECONDS,))
+        cur = conn.execute(
+            "insert or ignore into webhook_deliveries (digest, received_at) values (?, ?)", (digest, now)
+        )
+    return cur.rowcount == 1
+
+
+def indexed_invoice(invoice_id: str) -> Optional[Dict[str, Any]]:
+    """Local index row (with the invoice under 'invoice'), or None."""
+    conn = _db()
+    with lock_for(DB_NAME):
+        row = conn.execute("select * from invoices where invoice_id = ?", (invoice_id.strip(),)).fetchone()
+    if not row:
+        return None
+    entry = dict(row)
+    entry["invoice"] = json.loads(entry.pop("payload"))
+    return entry
+
+
+def paid_invoices() -> List[Dict[str, Any]]:
+    """invoice_id, product/variant, created_at and customer email of every paid invoice in the index."""
+    conn = _db()
+    with lock_for(DB_NAME):
+        rows = conn.execute(
+            """
+            select invoice_id, product_name, variant_name,
+                   json_extract(payload, '$.created_at') as created_at,
+                   coalesce(json_extract(payload, '$.email'), json_extract(payload, '$.customer.email')) as email
+            from invoices where paid = 1
+            """
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def set_prekey(invoice_id: str, user_key: Optional[str], auth_expire: Optional[int] = None) -> None:
+    """Attach (or clear, with user_key=None) a pre-created Luarmor key to an indexed invoice."""
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.execute(
+            "update invoices set prekey = ?, prekey_expire = ? where invoice_id = ?",
+            (user_key, auth_expire, invoice_id),
+        )
+
+
+async def get_invoice(invoice_id: str) -> Tuple[Optional[dict], str]:
+    """
+    Local index first (no upstream call), then the SellAuth API.
+    Returns (invoice, source) where source is "index", "api" or "missing".
+    """
+    entry = indexed_invoice(invoice_id)
+    if entry and entry["paid"]:
+        return entry["invoice"], "index"
+
+    if entry is None and admission.recently_missing(invoice_id):
+        return None, "missing"
+
+    # Unpaid/refunded in the index may be stale - let SellAuth have the final word
+    invoice = await fetch_invoice(invoice_id)
+    if invoice and invoice.get("id") is not None:
+        index_invoice(invoice, source="pull", invoice_id=invoice_id)
+        return invoice, "api"
+    if entry:
+        return entry["invoice"], "index"
+    return None, "missing"
@@ -1,19 +1,147 @@
-import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
-
-load_dotenv()
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("❌ Missing Supabase credentials in .env (SUPABASE_URL or SUPABASE_KEY)")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-print("✅ Supabase client initialized")
-
-def get_supabase() -> Client:
-    """Return the active Supabase client."""
-    return supabase
+import os
+import asyncio
+import contextvars
+from typing import Any, Callable, Dict, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+
+def _backend_name() -> str:
+    """Which backend get_supabase() builds ("supabase" or "memory").
+
+    Read when the client is built, not at import, so SUPABASE_BACKEND from .env
+    is honoured even though this module is imported before load_dotenv runs.
+    """
+    return (os.getenv("SUPABASE_BACKEND") or "supabase").strip().lower()
+
+
+def _create_supabase_client() -> "Client":
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv()
+
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise ValueError("❌ Missing Supabase credentials in .env (SUPABASE_URL or SUPABASE_KEY)")
+
+    client = create_client(url, key)
+    print("✅ Supabase client initialized")
+    return client
+
+
+def _create_memory_client():
+    from utils.memory_db import MemoryClient
+
+    print("⚠️ Using in-memory Supabase backend (data is not persisted)")
+    return MemoryClient()
+
+
+_backends: Dict[str, Callable[[], Any]] = {
+    "supabase": _create_supabase_client,
+    "memory": _create_memory_client,
+}
+
+_client = None
+
+
+def register_backend(name: str, factory: Callable[[], Any]) -> None:
+    """Register a client factory selectable via SUPABASE_BACKEND."""
+    _backends[name.lower()] = factory
+
+
+def set_client(client: Any) -> None:
+    """Inject a ready-made client (tests, benchmarks, tooling)."""
+    global _client
+    _client = client
+
+
+def reset_client() -> None:
+    """Forget the current client; the next use builds a fresh one."""
+    global _client
+    _client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        backend = _backend_name()
+        factory = _backends.get(backend)
+        if factory is None:
+            raise ValueError(f"Unknown SUPABASE_BACKEND '{backend}'")
+        _client = factory()
+    return _client
+
+
+class QueryTally:
+    """Round-trips started while a tally is active (see utils.queries.query_budget)."""
+
+    def __init__(self, name: str, limit: Optional[int] = None, parent: Optional["QueryTally"] = None):
+        self.name = name
+        self.limit = limit
+        self.parent = parent  # enclosing tally (a budgeted command run inside track())
+        self.targets: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.targets)
+
+    def add(self, target: str) -> None:
+        tally = self
+        while tally is not None:
+            tally.targets.append(target)
+            tally = tally.parent
+
+
+# Shared by reference with tasks/threads spawned from the command, so fan-outs are counted too
+current_tally: "contextvars.ContextVar[Optional[QueryTally]]" = contextvars.ContextVar("query_tally", default=None)
+
+# Every query starts with one of these; each start is one PostgREST round-trip
+_QUERY_ENTRYPOINTS = {"table", "from_", "rpc"}
+
+
+class _LazyClient:
+    """Handed out by get_supabase(); the real client is only built on first attribute access."""
+
+    def __getattr__(self, name: str):
+        attr = getattr(_get_client(), name)
+        if name in _QUERY_ENTRYPOINTS:
+            tally = current_tally.get()
+            if tally is not None:
+                def counted(target, *args, **kwargs):
+                    tally.add(f"{name}:{target}")
+                    return attr(target, *args, **kwargs)
+                return counted
+        return attr
+
+    def __repr__(self) -> str:
+        state = "connected" if _client is not None else "not initialised"
+        return f"<LazySupabase backend={_backend_name()} {state}>"
+
+
+_lazy_client = _LazyClient()
+
+
+def get_supabase() -> "Client":
+    """Return the Supabase client (constructed lazily on first use)."""
+    return _lazy_client
+
+
+async def execute_async(query) -> Any:
+    """Run a built query's blocking .execute() in a worker thread."""
+    return await asyncio.to_thread(query.execute)
+
+
+async def check_health(table: str = "tickets") -> bool:
+    """Build the client if needed and run one cheap query. Safe to call at startup."""
+    try:
+        await asyncio.to_thread(
+            lambda: _get_client().table(table).select("id").limit(1).execute()
+        )
+        print(f"✅ Supabase health check passed ({_backend_name()})")
+        return True
+    except Exception as e:
+        print(f"❌ Supabase health check failed: {e}")
+        return False
@@ -0,0 +1,231 @@
+"""
+Supervision for background tasks.loop jobs.
+
+Put @supervised(...) directly below @tasks.loop(...):
+
+    @tasks.loop(hours=1)
+    @supervised("renewal_reminder", interval=3600, timeout=600, catch_up=6 * 3600)
+    async def renewal_reminder(self, run: RunContext): ...
+
+Every run gets a deadline, is single-flight (a run that would overlap the
+previous one is skipped), the first run after start is delayed by a random
+jitter, and the outcome (duration, items processed, error) is written to
+data/taskruns.db for /taskhistory. Jobs that take a `run` argument can use
+run.covered_since to also cover windows missed while the bot was down.
+Return an int (items processed) from the job to have it recorded.
+
+Jobs are singletons by default: with several replicas running they only run on
+the leader (utils.leader). Pass singleton=False for per-replica housekeeping.
+"""
+import time
+import random
+import asyncio
+import functools
+import inspect
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from utils import metrics, leader
+from utils.localdb import connect, lock_for
+
+DB_NAME = "taskruns"
+
+HISTORY_DAYS = 14
+DEFAULT_TIMEOUT = 300.0
+DEFAULT_JITTER = 30.0
+
+_SCHEMA = """
+create table if not exists runs (
+    id integer primary key autoincrement,
+    task text not null,
+    started_at real not null,
+    duration real not null,
+    status text not null,           -- ok | error | timeout | skipped
+    items integer,
+    error text,
+    caught_up real not null default 0  -- seconds of missed schedule this run covered
+);
+create index if not exists runs_task_idx on runs (task, started_at);
+"""
+
+_ready = False
+_running: Dict[str, asyncio.Lock] = {}
+_jittered: set = set()
+
+
+@dataclass
+class RunContext:
+    task: str
+    started_at: float
+    interval: float
+    last_ok: Optional[float]        # start of the last successful run, None if never
+    catch_up: float                 # furthest back a run may reach for missed windows
+
+    @property
+    def covered_since(self) -> float:
+        """
+        Where this run's window should start so it lines up with the previous
+        successful run's (last_ok + interval), bounded by the catch-up limit.
+        """
+        if self.last_ok is None or not self.catch_up:
+            return self.started_at
+        return max(self.last_ok + self.interval, self.started_at - self.catch_up)
+
+    @property
+    def missed(self) -> float:
+        return max(0.0, self.started_at - self.covered_since)
+
+
+def _db():
+    global _ready
+    conn = connect(DB_NAME)
+    if not _ready:
+        with lock_for(DB_NAME):
+            conn.executescript(_SCHEMA)
+        _ready = True
+    return conn
+
+
+def _record(task: str, started_at: float, duration: float, status: str,
+            items: Optional[int] = None, error: Optional[str] = None, caught_up: float = 0.0) -> None:
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.execute(
+            "insert into runs (task, started_at, duration, status, items, error, caught_up)"
+            " values (?, ?, ?, ?, ?, ?, ?)",
+            (task, started_at, duration, status, items, (error or "")[:500] or None, caught_up),
+        )
+    metrics.incr(f"tasks.{task}.{status}")
+    if status != "skipped":
+        metrics.observe(f"tasks.{task}", duration)
+
+
+def last_ok(task: str) -> Optional[float]:
+    conn = _db()
+    with lock_for(DB_NAME):
+        row = conn.execute(
+            "select max(started_at) from runs where task = ? and status = 'ok'", (task,)
+        ).fetchone()
+    return row[0]
+
+
+def task_lock(name: str) -> asyncio.Lock:
+    """The single-flight lock a supervised task runs under; hold it to run the same work by hand."""
+    return _running.setdefault(name, asyncio.Lock())
+
+
+# -----------------------------
+# DECORATOR
+# -----------------------------
+def supervised(
+    name: str,
+    interval: float,
+    timeout: float = DEFAULT_TIMEOUT,
+    jitter: float = DEFAULT_JITTER,
+    catch_up: float = 0.0,
+    singleton: bool = True,
+):
+    """Wrap a tasks.loop coroutine with a deadline, single-flight, start jitter and run history."""
+    def decorator(func):
+        wants_run = "run" in inspect.signature(func).parameters
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if name not in _jittered:
+                _jittered.add(name)
+                if jitter > 0:
+                    await asyncio.sleep(random.uniform(0, jitter))
+
+            if singleton and not await leader.confirm():
+                metrics.incr(f"tasks.{name}.standby")
+                return None
+
+            lock = task_lock(name)
+            started_at = time.time()
+            if lock.locked():
+                _record(name, started_at, 0.0, "skipped", error="previous run still in progress")
+                print(f"[SUPERVISOR] {name}: previous run still in progress - skipped")
+                return None
+
+            async with lock:
+                previous = last_ok(name)
+                if singleton and catch_up:
+                    # Another replica may have run it more recently (failover)
+                    shared = await leader.load_cursor(name)
+                    previous = max((t for t in (previous, shared) if t is not None), default=None)
+                run = RunContext(name, started_at, interval, previous, catch_up)
+                if wants_run:
+                    kwargs["run"] = run
+                began = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(func(*args, **kwargs), timeout=timeout)
+                except asyncio.TimeoutError:
+                    _record(name, started_at, time.perf_counter() - began, "timeout",
+                            error=f"exceeded {timeout:.0f}s", caught_up=run.missed)
+                    print(f"[SUPERVISOR] {name}: timed out after {timeout:.0f}s")
+                    return None
+                except Exception as e:
+                    _record(name, started_at, time.perf_counter() - began, "error",
+                            error=f"{type(e).__name__}: {e}", caught_up=run.missed)
+                    print(f"[SUPERVISOR] {name}: {type(e).__name__}: {e}")
+                    return None
+
+                items = result if isinstance(result, int) and not isinstance(result, bool) else None
+                _record(name, started_at, time.perf_counter() - began, "ok", items=items, caught_up=run.missed)
+                if singleton and catch_up:
+                    await leader.save_cursor(name, started_at)
+                return result
+        return wrapper
+    return decorator
+
+
+# -----------------------------
+# HISTORY
+# -----------------------------
+def recent(task: str, limit: int = 15) -> List[dict]:
+    conn = _db()
+    with lock_for(DB_NAME):
+        rows = conn.execute(
+            "select * from runs where task = ? order by started_at desc limit ?", (task, limit)
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def summary(since_hours: float = 24) -> List[dict]:
+    """Per task: last run, last status, runs/failures and average duration over the window."""
+    since = time.time() - since_hours * 3600
+    conn = _db()
+    with lock_for(DB_NAME):
+        rows = conn.execute(
+            """
+            select task,
+                   max(started_at) as last_started,
+                   (select status from runs r2 where r2.task = runs.task order by started_at desc limit 1) as last_status,
+                   sum(case when started_at >= ? then 1 else 0 end) as runs,
+                   sum(case when started_at >= ? and status in ('error', 'timeout') then 1 else 0 end) as failures,
+                   avg(case when started_at >= ? and status != 'skipped' then duration end) as avg_duration,
+                   sum(case when started_at >= ? then coalesce(items, 0) else 0 end) as items
+            from runs group by task order by task
+            """,
+            (since, since, since, since),
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def task_names() -> List[str]:
+    conn = _db()
+    with lock_for(DB_NAME):
+        return [r[0] for r in conn.execute("select distinct task from runs order by task").fetchall()]
+
+
+def prune(history_days: int = HISTORY_DAYS) -> int:
+    """Drop run history older than history_days, keeping each task's last successful run."""
+    cutoff = time.time() - history_days * 86400
+    conn = _db()
+    with lock_for(DB_NAME):
+        cur = conn.execute(
+            "delete from runs where started_at < ? and id not in"
+            " (select max(id) from runs where status = 'ok' group by task)",
+            (cutoff,),
+        )
+    return cur.rowcount
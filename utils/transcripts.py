@@ -0,0 +1,255 @@
+"""
+Searchable archive of closed ticket transcripts (data/transcripts.db).
+
+Each transcript is stored once, zlib-compressed, and every message is also fed
+into an FTS5 index (text, author, ticket metadata) so staff can find past
+tickets by order ID, user or wording. The close path streams messages in
+through TranscriptWriter while it walks the channel history.
+"""
+import time
+import zlib
+from dataclasses import dataclass
+from typing import List, Optional
+
+from utils.localdb import connect, lock_for
+
+DB_NAME = "transcripts"
+
+RETENTION_DAYS = 365        # transcripts older than this are dropped by prune()
+FTS_BATCH_SIZE = 200        # messages per executemany while streaming
+COMPRESSION_LEVEL = 6
+DELETE_CHUNK_SIZE = 500
+
+_SCHEMA = """
+create table if not exists transcripts (
+    id integer primary key autoincrement,
+    ticket_id integer,
+    channel_name text not null,
+    opener_id integer,
+    closed_by integer,
+    reason text,
+    closed_at real not null,
+    message_count integer not null default 0,
+    raw_size integer not null default 0,
+    body blob
+);
+create index if not exists transcripts_closed_idx on transcripts (closed_at);
+create index if not exists transcripts_opener_idx on transcripts (opener_id);
+create virtual table if not exists transcript_fts using fts5(
+    body, author, meta, transcript_id unindexed, tokenize = 'unicode61'
+);
+"""
+
+_ready = False
+
+
+def _db():
+    global _ready
+    conn = connect(DB_NAME)
+    if not _ready:
+        with lock_for(DB_NAME):
+            conn.executescript(_SCHEMA)
+        _ready = True
+    return conn
+
+
+@dataclass
+class SearchHit:
+    transcript_id: int
+    ticket_id: Optional[int]
+    channel_name: str
+    opener_id: Optional[int]
+    closed_at: float
+    snippet: str
+    score: float
+
+
+class TranscriptWriter:
+    """
+    Builds the .txt transcript and the archive entry in one pass:
+
+        writer = TranscriptWriter(channel.name, ticket_id=..., opener_id=...)
+        writer.header("TICKET TRANSCRIPT: ...")
+        async for msg in channel.history(...):
+            writer.add(...)
+        text = writer.finish(closed_by=...)
+    """
+
+    def __init__(self, channel_name: str, ticket_id: Optional[int] = None,
+                 opener_id: Optional[int] = None, reason: Optional[str] = None):
+        self.channel_name = channel_name
+        self.ticket_id = ticket_id
+        self.opener_id = opener_id
+        self.reason = reason
+        self.message_count = 0
+        self._lines: List[str] = []
+        self._pending: list = []
+        self._compressor = zlib.compressobj(COMPRESSION_LEVEL)
+        self._compressed: List[bytes] = []
+        self._raw_size = 0
+
+        conn = _db()
+        with lock_for(DB_NAME):
+            cur = conn.execute(
+                "insert into transcripts (ticket_id, channel_name, opener_id, reason, closed_at) values (?, ?, ?, ?, ?)",
+                (ticket_id, channel_name, opener_id, reason, time.time()),
+            )
+        self.id = cur.lastrowid
+
+        meta = " ".join(str(v) for v in (channel_name, ticket_id, opener_id, reason) if v is not None)
+        self._pending.append(("", "", meta, self.id))
+
+    def _write(self, line: str) -> None:
+        self._lines.append(line)
+        data = (line + "\n").encode("utf-8")
+        self._raw_size += len(data)
+        self._compressed.append(self._compressor.compress(data))
+
+    def header(self, *lines: str) -> None:
+        for line in lines:
+            self._write(line)
+
+    def add(self, timestamp: str, author: str, author_id: int, content: str,
+            attachments: List[str] = (), embeds: List[str] = ()) -> None:
+        self._write(f"[{timestamp}] {author} ({author_id})")
+        self._write(content or "[No text content]")
+        for att in attachments:
+            self._write(f"  [Attachment: {att}]")
+        for title in embeds:
+            self._write(f"  [Embed: {title}]")
+        self._write("")
+
+        searchable = " ".join([content or "", *attachments, *embeds]).strip()
+        if searchable:
+            self._pending.append((searchable, f"{author} {author_id}", "", self.id))
+        self.message_count += 1
+        if len(self._pending) >= FTS_BATCH_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        conn = _db()
+        with lock_for(DB_NAME):
+            conn.executemany(
+                "insert into transcript_fts (body, author, meta, transcript_id) values (?, ?, ?, ?)",
+                self._pending,
+            )
+        self._pending = []
+
+    def text(self) -> str:
+        return "\n".join(self._lines)
+
+    def finish(self, closed_by: Optional[int] = None) -> str:
+        """Store the compressed transcript and return the plain text for upload."""
+        self._flush()
+        self._compressed.append(self._compressor.flush())
+        conn = _db()
+        with lock_for(DB_NAME):
+            conn.execute(
+                "update transcripts set closed_by = ?, closed_at = ?, message_count = ?, raw_size = ?, body = ?"
+                " where id = ?",
+                (closed_by, time.time(), self.message_count, self._raw_size, b"".join(self._compressed), self.id),
+            )
+        return self.text()
+
+    def abort(self) -> None:
+        """Drop a half-written entry (e.g. history fetch failed)."""
+        _delete([self.id])
+
+
+def _match_expression(query: str) -> str:
+    """Quote every word so order IDs like 'abc-123' aren't parsed as FTS operators."""
+    terms = [t.replace('"', '""') for t in query.split() if t]
+    return " ".join(f'"{t}"' for t in terms)
+
+
+def search(query: str, opener_id: Optional[int] = None, limit: int = 10) -> List[SearchHit]:
+    """Best-ranked hit per transcript, best first."""
+    expression = _match_expression(query)
+    if not expression:
+        return []
+
+    sql = (
+        "select t.id, t.ticket_id, t.channel_name, t.opener_id, t.closed_at,"
+        " snippet(transcript_fts, -1, '**', '**', '…', 16) as snip, bm25(transcript_fts) as score"
+        " from transcript_fts join transcripts t on t.id = transcript_fts.transcript_id"
+        " where transcript_fts match ? and t.body is not null"
+    )
+    params: list = [expression]
+    if opener_id is not None:
+        sql += " and t.opener_id = ?"
+        params.append(opener_id)
+    sql += " order by score limit ?"
+    params.append(limit * 5)
+
+    conn = _db()
+    with lock_for(DB_NAME):
+        rows = conn.execute(sql, params).fetchall()
+
+    hits: List[SearchHit] = []
+    seen = set()
+    for r in rows:
+        if r["id"] in seen:
+            continue
+        seen.add(r["id"])
+        hits.append(SearchHit(r["id"], r["ticket_id"], r["channel_name"], r["opener_id"],
+                              r["closed_at"], r["snip"], r["score"]))
+        if len(hits) >= limit:
+            break
+    return hits
+
+
+def get_text(transcript_id: int) -> Optional[tuple[dict, str]]:
+    """(metadata, full transcript text) for one archived transcript."""
+    conn = _db()
+    with lock_for(DB_NAME):
+        row = conn.execute("select * from transcripts where id = ?", (transcript_id,)).fetchone()
+    if not row or row["body"] is None:
+        return None
+    meta = dict(row)
+    body = meta.pop("body")
+    return meta, zlib.decompress(body).decode("utf-8")
+
+
+def stats() -> dict:
+    conn = _db()
+    with lock_for(DB_NAME):
+        row = conn.execute(
+            "select count(*), coalesce(sum(raw_size), 0), coalesce(sum(length(body)), 0) from transcripts"
+        ).fetchone()
+    return {"count": row[0], "raw_bytes": row[1], "stored_bytes": row[2]}
+
+
+def _delete(ids: List[int]) -> None:
+    conn = _db()
+    for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+        chunk = ids[i:i + DELETE_CHUNK_SIZE]
+        marks = ",".join("?" * len(chunk))
+        with lock_for(DB_NAME):
+            conn.execute("begin")
+            conn.execute(f"delete from transcript_fts where transcript_id in ({marks})", chunk)
+            conn.execute(f"delete from transcripts where id in ({marks})", chunk)
+            conn.execute("commit")
+
+
+def prune(retention_days: int = RETENTION_DAYS) -> List[int]:
+    """Drop transcripts past retention, plus entries left unfinished by a crash. Returns their IDs."""
+    cutoff = time.time() - retention_days * 86400
+    stale_unfinished = time.time() - 86400
+    conn = _db()
+    with lock_for(DB_NAME):
+        ids = [r[0] for r in conn.execute(
+            "select id from transcripts where closed_at < ? or (body is null and closed_at < ?)",
+            (cutoff, stale_unfinished),
+        ).fetchall()]
+    _delete(ids)
+    return ids
+
+
+def compact() -> None:
+    """Merge FTS segments and give freed pages back to the filesystem."""
+    conn = _db()
+    with lock_for(DB_NAME):
+        conn.execute("insert into transcript_fts (transcript_fts) values ('optimize')")
+        conn.execute("vacuum")
@@ -0,0 +1,195 @@
+"""
+Paid-but-unredeemed order finder.
+
+refresh() pulls the SellAuth invoices updated since the last run into the local
+invoice index (data/invoices.db), so repeated runs only page through what is
+new. build_report() then anti-joins the paid ones against the invoice IDs in
+role_redeem (one bulk read) and the local outbox, and buckets what's left by age.
+"""
+import os
+import csv
+import io
+import json
+import time
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from utils import sellauth, outbox
+from utils.supabase import execute_async
+from utils.queries import select
+from utils.localdb import data_path
+
+STATE_FILE = "unredeemed_state.json"
+
+LOOKBACK_DAYS = 60             # first refresh and the widest report window
+GRACE_MINUTES = 30             # younger orders are probably being redeemed right now
+OVERLAP_SECONDS = 300
+PAGE_CONCURRENCY = 3
+MAX_PAGES = 50
+REDEEMED_PAGE_SIZE = 1000      # PostgREST's default max rows per response
+
+AGE_BUCKETS = [                # (label, max age in days)
+    ("< 1 day", 1),
+    ("1-7 days", 7),
+    ("7-30 days", 30),
+    ("30+ days", None),
+]
+
+_refresh_lock = asyncio.Lock()
+
+
+@dataclass
+class UnredeemedOrder:
+    invoice_id: str
+    product_name: str
+    variant_name: str
+    email: str
+    created_at: float
+
+    @property
+    def age_days(self) -> float:
+        return (time.time() - self.created_at) / 86400
+
+
+@dataclass
+class UnredeemedReport:
+    orders: List[UnredeemedOrder] = field(default_factory=list)   # oldest first
+    paid_checked: int = 0
+    redeemed: int = 0
+    window_days: int = LOOKBACK_DAYS
+
+    def buckets(self) -> Dict[str, int]:
+        counts = {label: 0 for label, _ in AGE_BUCKETS}
+        for order in self.orders:
+            for label, limit in AGE_BUCKETS:
+                if limit is None or order.age_days < limit:
+                    counts[label] += 1
+                    break
+        return counts
+
+
+# -----------------------------
+# STATE (watermark)
+# -----------------------------
+def load_state() -> Dict[str, Any]:
+    try:
+        with open(data_path(STATE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(state: Dict[str, Any]) -> None:
+    path = data_path(STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def _to_ts(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+# -----------------------------
+# REFRESH
+# -----------------------------
+async def refresh() -> int:
+    """Index invoices updated since the last refresh. Returns how many were read."""
+    # The hourly loop and /unredeemed can overlap; the second caller then reads almost nothing
+    async with _refresh_lock:
+        invoices, next_state, complete = await sellauth.read_delta(
+            load_state(),
+            default_since=time.time() - LOOKBACK_DAYS * 86400,
+            overlap=OVERLAP_SECONDS,
+            concurrency=PAGE_CONCURRENCY,
+            max_pages=MAX_PAGES,
+        )
+        for invoice in invoices:
+            sellauth.index_invoice(invoice, source="listing")
+
+        if not complete:
+            print(f"[UNREDEEMED] Listing not fully read ({len(invoices)} invoice(s)) - resuming next refresh")
+        save_state({**next_state, "refreshed_at": time.time()})
+        return len(invoices)
+
+
+# -----------------------------
+# REPORT
+# -----------------------------
+async def _redeemed_invoice_ids(since_iso: str) -> Set[str]:
+    """Every invoice_id redeemed since `since_iso` - one round-trip unless there are more than a page."""
+    ids: Set[str] = set()
+    start = 0
+    while True:
+        resp = await execute_async(
+            select("role_redeem", "invoice_id")
+            .gte("redeemed_at", since_iso)
+            .order("id")
+            .range(start, start + REDEEMED_PAGE_SIZE - 1)
+        )
+        rows = resp.data or []
+        ids.update(str(r["invoice_id"]).strip() for r in rows if r.get("invoice_id"))
+        if len(rows) < REDEEMED_PAGE_SIZE:
+            return ids
+        start += REDEEMED_PAGE_SIZE
+
+
+async def build_report(window_days: int = LOOKBACK_DAYS) -> UnredeemedReport:
+    """Paid orders from the last `window_days` that nobody has redeemed, oldest first."""
+    window_days = max(1, min(window_days, LOOKBACK_DAYS))
+    now = time.time()
+    window_start = now - window_days * 86400
+    grace_cutoff = now - GRACE_MINUTES * 60
+
+    report = UnredeemedReport(window_days=window_days)
+    candidates: List[UnredeemedOrder] = []
+    for row in sellauth.paid_invoices():
+        created = _to_ts(row["created_at"])
+        if created is None or not window_start <= created <= grace_cutoff:
+            continue
+        candidates.append(UnredeemedOrder(
+            invoice_id=row["invoice_id"],
+            product_name=row["product_name"] or "Unknown",
+            variant_name=row["variant_name"] or "Standard",
+            email=row["email"] or "",
+            created_at=created,
+        ))
+    report.paid_checked = len(candidates)
+    if not candidates:
+        return report
+
+    redeemed = await _redeemed_invoice_ids(datetime.fromtimestamp(window_start, tz=timezone.utc).isoformat())
+    for order in candidates:
+        if order.invoice_id in redeemed or outbox.get(f"role_redeem:{order.invoice_id}"):
+            report.redeemed += 1
+            continue
+        report.orders.append(order)
+
+    report.orders.sort(key=lambda o: o.created_at)
+    return report
+
+
+def report_csv(report: UnredeemedReport) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["invoice_id", "created_at", "age_days", "product", "variant", "email"])
+    for o in report.orders:
+        writer.writerow([
+            o.invoice_id,
+            datetime.fromtimestamp(o.created_at, tz=timezone.utc).isoformat(),
+            f"{o.age_days:.1f}",
+            o.product_name,
+            o.variant_name,
+            o.email,
+        ])
+    return out.getvalue().encode("utf-8")